@@ -0,0 +1,216 @@
+'''
+ALT (A*, landmarks and the triangle inequality) preprocessing and search.
+
+For a landmark L the triangle inequality gives two lower bounds on the
+cost of getting from v to t:
+
+    d(v, t) >= d(v, L) - d(t, L)
+    d(v, t) >= d(L, t) - d(L, v)
+
+Tobler travel times depend on direction (uphill is slower than downhill) so
+both the costs to and from every landmark are kept. The best bound over all
+landmarks, together with the 6 km/h straight line bound, is a consistent
+heuristic that is much tighter than the straight line alone on hilly ground.
+'''
+from heapq import heappush, heappop
+import random
+
+import numpy as np
+
+import astar
+import cache
+
+
+class Landmarks:
+    '''
+    Costs from and to a set of landmark nodes of a CSRGraph.
+    from_landmark[k][v] is d(landmarks[k], v) and to_landmark[k][v] is
+    d(v, landmarks[k]).
+    '''
+
+    def __init__(self, landmarks, from_landmark, to_landmark):
+        self.landmarks = list(landmarks)
+        self.from_landmark = np.asarray(from_landmark, dtype=np.float64)
+        self.to_landmark = np.asarray(to_landmark, dtype=np.float64)
+
+    @classmethod
+    def build(cls, graph, weights, count=8, seed=0):
+        '''
+        Pick count landmarks by farthest point selection (each new landmark
+        is the node farthest from the ones picked so far) and compute the
+        costs from and to each of them.
+        '''
+        offsets, targets = graph.adjacency()
+        roffsets, rsources, redges = graph.reverse()
+        roffsets, rsources = roffsets.tolist(), rsources.tolist()
+        rweights = np.asarray(weights, dtype=np.float64)[redges].tolist()
+
+        r = random.Random(seed)
+        start = r.randrange(len(graph))
+        nearest = np.array(astar.dijkstra(offsets, targets, weights, [start]))
+
+        landmarks, from_landmark, to_landmark = [], [], []
+        for _ in range(min(count, len(graph))):
+            reachable = np.where(np.isinf(nearest), -1, nearest)
+            landmark = int(np.argmax(reachable))
+            if reachable[landmark] <= 0:
+                break
+            landmarks.append(landmark)
+            from_landmark.append(astar.dijkstra(offsets, targets, weights, [landmark]))
+            to_landmark.append(astar.dijkstra(roffsets, rsources, rweights, [landmark]))
+            nearest = np.minimum(nearest, from_landmark[-1])
+
+        return cls(landmarks, np.array(from_landmark).reshape(-1, len(graph)),
+                   np.array(to_landmark).reshape(-1, len(graph)))
+
+    def save(self, path, fingerprint):
+        '''
+        Save to path, tagged with the fingerprint of the graph (see
+        CSRGraph.fingerprint) the landmarks were built for.
+        '''
+        arrays = {
+            'landmarks': np.array(self.landmarks, dtype=np.int64),
+            'from_landmark': self.from_landmark,
+            'to_landmark': self.to_landmark,
+        }
+        cache.save_arrays(path, arrays, {'kind': 'landmarks', 'fingerprint': fingerprint})
+
+    @classmethod
+    def load(cls, path, fingerprint=None):
+        '''
+        Load from path, or return None if missing or built for another
+        graph, whose bounds could overestimate and give wrong routes.
+        '''
+        loaded = cache.load_arrays(path)
+        if loaded is None:
+            return None
+        meta, arrays = loaded
+        if meta.get('kind') != 'landmarks' or (fingerprint is not None and meta.get('fingerprint') != fingerprint):
+            return None
+        return cls(arrays['landmarks'].tolist(), arrays['from_landmark'], arrays['to_landmark'])
+
+    def active(self, start, goal, count):
+        '''
+        The count landmarks giving the best bound on d(start, goal). Using
+        only those for a query is nearly as tight and a lot cheaper.
+        '''
+        if count is None or count >= len(self.landmarks):
+            return None
+        with np.errstate(invalid='ignore'):
+            bounds = np.fmax(self.to_landmark[:, start] - self.to_landmark[:, goal],
+                             self.from_landmark[:, goal] - self.from_landmark[:, start])
+        return np.argsort(-np.nan_to_num(bounds, nan=-np.inf), kind='stable')[:count]
+
+    def lower_bounds_to(self, goal, active=None):
+        '''An array of lower bounds on d(v, goal) for every node v.'''
+        to_l, from_l = self._tables(active)
+        return _bounds(to_l, to_l[:, goal:goal+1], from_l[:, goal:goal+1], from_l)
+
+    def lower_bounds_from(self, source, active=None):
+        '''An array of lower bounds on d(source, v) for every node v.'''
+        to_l, from_l = self._tables(active)
+        return _bounds(to_l[:, source:source+1], to_l, from_l, from_l[:, source:source+1])
+
+    def _tables(self, active):
+        if active is None:
+            return (self.to_landmark, self.from_landmark)
+        return (self.to_landmark[active], self.from_landmark[active])
+
+
+def _bounds(to_a, to_b, from_b, from_a):
+    # max over landmarks of d(a, L) - d(b, L) and d(L, b) - d(L, a). fmax
+    # skips the nans from inf - inf, which (neither end connects to L) tell
+    # us nothing.
+    if len(to_a) == 0:
+        return np.zeros(max(to_a.shape[1], to_b.shape[1]))
+    with np.errstate(invalid='ignore'):
+        bounds = np.fmax(to_a - to_b, from_b - from_a)
+    return np.fmax(np.fmax.reduce(bounds, axis=0), 0)
+
+
+def heuristic(graph, landmarks, goal, start=None, active=4):
+    '''
+    The ALT heuristic to goal for every node of a CSRGraph, as a list. If
+    start is given only the active best landmarks for the query are used.
+    '''
+    straight = astar.toblers_heuristic_many(graph.x, graph.y, graph.z, graph.x[goal], graph.y[goal], graph.z[goal])
+    chosen = None if start is None else landmarks.active(start, goal, active)
+    return np.maximum(landmarks.lower_bounds_to(goal, chosen), straight).tolist()
+
+
+def bidirectional_astar(graph, weights, landmarks, start, goal, active=4, stats=None):
+    '''
+    Bidirectional A* over a CSRGraph using the average of the forward and
+    backward ALT potentials, so that both searches see the same (non
+    negative) reduced edge costs and can stop as soon as the best meeting
+    point found can't be improved on.
+
+    Only the active best landmarks for the query are used. Return (path of
+    node indices, path_cost) or None.
+    '''
+    if start == goal:
+        return ([start], 0)
+
+    offsets, targets = graph.adjacency()
+    roffsets, rsources, redges = graph.reverse_adjacency()
+    chosen = landmarks.active(start, goal, active)
+
+    def straight(node):
+        return astar.toblers_heuristic_many(graph.x, graph.y, graph.z, graph.x[node], graph.y[node], graph.z[node])
+
+    to_goal = np.maximum(landmarks.lower_bounds_to(goal, chosen), straight(goal))
+    from_start = np.maximum(landmarks.lower_bounds_from(start, chosen), straight(start))
+    # nodes that can't be on any path from start to goal
+    dead = np.isinf(to_goal) | np.isinf(from_start)
+    with np.errstate(invalid='ignore'):
+        potential = np.where(dead, 0.0, (to_goal - from_start) / 2).tolist()
+    dead = dead.tolist()
+
+    inf = float('inf')
+    dist = ({start: 0}, {goal: 0})
+    parent = ({}, {})
+    frontiers = ([(potential[start], 0, start)], [(-potential[goal], 0, goal)])
+    best, meeting = inf, None
+    expanded = 0
+
+    while frontiers[0] and frontiers[1]:
+        if frontiers[0][0][0] + frontiers[1][0][0] >= best:
+            break
+        side = 0 if frontiers[0][0][0] <= frontiers[1][0][0] else 1
+        (key, cost, cur_node) = heappop(frontiers[side])
+        if cost > dist[side][cur_node]:
+            continue
+        expanded += 1
+
+        if side == 0:
+            edges = ((targets[e], weights[e]) for e in range(offsets[cur_node], offsets[cur_node + 1]))
+            sign = 1
+        else:
+            edges = ((rsources[j], weights[redges[j]]) for j in range(roffsets[cur_node], roffsets[cur_node + 1]))
+            sign = -1
+
+        this_dist, other_dist = dist[side], dist[1 - side]
+        for (successor, weight) in edges:
+            if dead[successor]:
+                continue
+            new_cost = cost + weight
+            if new_cost < this_dist.get(successor, inf):
+                this_dist[successor] = new_cost
+                parent[side][successor] = cur_node
+                heappush(frontiers[side], (new_cost + sign*potential[successor], new_cost, successor))
+                if successor in other_dist and new_cost + other_dist[successor] < best:
+                    best = new_cost + other_dist[successor]
+                    meeting = successor
+
+    if stats is not None:
+        stats['expanded'] = expanded
+    if meeting is None:
+        return None
+
+    path = [meeting]
+    while path[-1] != start:
+        path.append(parent[0][path[-1]])
+    path.reverse()
+    while path[-1] != goal:
+        path.append(parent[1][path[-1]])
+    return (path, best)
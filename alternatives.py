@@ -0,0 +1,300 @@
+'''
+Alternative routes: a few good paths between the same two nodes instead of
+only the best one.
+
+Both ways of finding them start from one Dijkstra over the reversed edges
+from the goal, which gives the exact cost from every node to the goal and
+the first edge of a best path from it (the reverse shortest path tree).
+
+alternatives    via routes: a Dijkstra from the start as well, and for
+                every node v the best path through v is the tree path to v
+                followed by the tree path from v, costing d(s, v) + d(v, t).
+                The cheapest of those that don't loop and overlap every
+                route chosen so far by at most max_overlap of their length
+                (in meters of road) are the alternatives. Both trees stop
+                at max_stretch times the best cost.
+k_shortest      Yen's k shortest loopless paths. Every spur search uses the
+                tree costs as its heuristic and stops as soon as the node it
+                pops reaches the goal through the tree without touching the
+                root path, which with an exact heuristic is the best spur;
+                spurs give up past max_stretch times the best cost. On a
+                street grid the next best paths are mostly the best one
+                with a block's detour, so this is for exact rankings, and
+                alternatives for routes that are actually different.
+'''
+from heapq import heappush, heappop
+
+
+inf = float('inf')
+
+
+def reverse_tree(graph, weights, goal, start=None, max_stretch=inf, offset=0):
+    '''
+    Return (costs, next_edges) lists over the nodes of a CSRGraph: the cost
+    of the best path from each node to goal (inf if there is none), and the
+    first edge of that path (None at the goal and unreachable nodes). With
+    a start, nodes costing more than max_stretch times the cost from start
+    are left out, comparing the costs plus offset (which turns costs under
+    weights reduced by a heuristic back into real ones).
+    '''
+    roffsets, rsources, redges = graph.reverse_adjacency()
+    costs = [inf] * len(graph)
+    next_edges = [None] * len(graph)
+    costs[goal] = 0
+    frontier = [(0, goal)]
+    budget = inf
+
+    while frontier:
+        (cost, cur_node) = heappop(frontier)
+        if cost > costs[cur_node]:
+            continue
+        if cost > budget:
+            break
+        if cur_node == start:
+            budget = _limit(cost, max_stretch, offset)
+        for j in range(roffsets[cur_node], roffsets[cur_node + 1]):
+            predecessor = rsources[j]
+            edge = redges[j]
+            new_cost = cost + weights[edge]
+            if new_cost < costs[predecessor]:
+                costs[predecessor] = new_cost
+                next_edges[predecessor] = edge
+                heappush(frontier, (new_cost, predecessor))
+
+    if budget < inf:
+        # drop what was reached but not settled within the budget
+        for i, cost in enumerate(costs):
+            if cost > budget:
+                costs[i] = inf
+                next_edges[i] = None
+    return (costs, next_edges)
+
+
+def _reduced(graph, weights, h, start, goal):
+    # edge costs made non-negative by a consistent heuristic, and what to add
+    # to the reduced cost of a path from start to goal to get its real cost
+    if h is None:
+        return (weights, 0)
+    sources = graph.edge_sources().tolist()
+    targets = graph.adjacency()[1]
+    return ([max(0.0, w + h[t] - h[s]) for (w, s, t) in zip(weights, sources, targets)], h[start] - h[goal])
+
+
+def _limit(best, max_stretch, offset):
+    # the most a reduced path may cost
+    return (best + offset) * max_stretch - offset + 1e-9
+
+
+def alternatives(graph, weights, start, goal, k=3, max_overlap=0.6, max_stretch=1.4, h=None, tree=None):
+    '''
+    Up to k routes from start to goal (node indices of a CSRGraph) as a
+    list of (path of node indices, path_cost), best first. The first is
+    the best path, the others via routes (see above) costing at most
+    max_stretch times it and sharing at most max_overlap of their length
+    with every route before them.
+
+    Negative weights are allowed if h is a consistent heuristic for goal
+    (see astar.learned_search), which is used to make them non-negative.
+    tree may be reverse_tree for the same weights, h and goal, to share it
+    between queries.
+    '''
+    (reduced, offset) = _reduced(graph, weights, h, start, goal)
+    if tree is None:
+        tree = reverse_tree(graph, reduced, goal, start, max_stretch, offset)
+    to_goal, next_edges = tree
+    if to_goal[start] == inf:
+        return []
+    if start == goal:
+        return [([start], 0)]
+
+    limit = _limit(to_goal[start], max_stretch, offset)
+    (from_start, parents) = _forward_tree(graph, reduced, start, limit)
+    search = _SpurSearch(graph, reduced, tree)
+    lengths = graph.edge_features()[0].tolist()
+
+    via = sorted((cost + to_goal[v], v) for v, cost in from_start.items() if cost + to_goal[v] <= limit)
+    covered = set()
+    chosen = []
+    for (_, v) in via:
+        if v in covered:
+            continue
+        edges = []
+        node = v
+        while node != start:
+            (node, edge) = parents[node]
+            edges.append(edge)
+        edges.reverse()
+        edges += search.tree_path(v)
+        nodes = search.nodes(start, edges)
+        covered.update(nodes)
+        if len(set(nodes)) < len(nodes):
+            continue
+        if _distinct(edges, chosen, lengths, max_overlap):
+            chosen.append(edges)
+            if len(chosen) == k:
+                break
+
+    return [(search.nodes(start, edges), sum(weights[e] for e in edges)) for edges in chosen]
+
+
+def k_shortest(graph, weights, start, goal, k=3, max_overlap=1.0, max_stretch=1.5,
+               h=None, tree=None, examine=None):
+    '''
+    The k best loopless paths from start to goal costing at most
+    max_stretch times the best, as a list of (path of node indices,
+    path_cost), best first. Paths sharing more than max_overlap of their
+    length with a better one are passed over (but still branched from), and
+    at most examine paths (by default 10 * k) are looked at. h and tree are
+    as for alternatives.
+    '''
+    (reduced, offset) = _reduced(graph, weights, h, start, goal)
+    if tree is None:
+        tree = reverse_tree(graph, reduced, goal, start, max_stretch, offset)
+    if tree[0][start] == inf:
+        return []
+    if start == goal:
+        return [([start], 0)]
+
+    search = _SpurSearch(graph, reduced, tree)
+    lengths = graph.edge_features()[0].tolist()
+    limit = _limit(tree[0][start], max_stretch, offset)
+    if examine is None:
+        examine = 10 * k
+
+    first = tuple(search.tree_path(start))
+    candidates = [(tree[0][start], first)]
+    seen = {first}
+    found = []
+    chosen = []
+
+    while candidates and len(chosen) < k and len(found) < examine:
+        (cost, edges) = heappop(candidates)
+        found.append(edges)
+        if _distinct(edges, chosen, lengths, max_overlap):
+            chosen.append(edges)
+            if len(chosen) == k:
+                break
+
+        nodes = search.nodes(start, edges)
+        root_cost = 0
+        for i in range(len(edges)):
+            root = edges[:i]
+            banned_edges = {path[i] for path in found if len(path) > i and path[:i] == root}
+            spur = search.spur(nodes[i], set(nodes[:i]), banned_edges, limit - root_cost)
+            if spur is not None:
+                path = root + tuple(spur[0])
+                if path not in seen:
+                    seen.add(path)
+                    heappush(candidates, (root_cost + spur[1], path))
+            root_cost += reduced[edges[i]]
+
+    return [(search.nodes(start, edges), sum(weights[e] for e in edges)) for edges in chosen]
+
+
+def _forward_tree(graph, weights, start, budget):
+    # Dijkstra from start up to budget: costs and (parent, edge) dicts
+    offsets, targets = graph.adjacency()
+    costs = {start: 0}
+    parents = {}
+    settled = set()
+    frontier = [(0, start)]
+
+    while frontier:
+        (cost, cur_node) = heappop(frontier)
+        if cur_node in settled:
+            continue
+        settled.add(cur_node)
+        for e in range(offsets[cur_node], offsets[cur_node + 1]):
+            successor = targets[e]
+            new_cost = cost + weights[e]
+            if new_cost <= budget and new_cost < costs.get(successor, inf):
+                costs[successor] = new_cost
+                parents[successor] = (cur_node, e)
+                heappush(frontier, (new_cost, successor))
+
+    return (costs, parents)
+
+
+def _distinct(edges, chosen, lengths, max_overlap):
+    # whether edges overlaps every chosen path by at most max_overlap of its length
+    total = sum(lengths[e] for e in edges)
+    for other in chosen:
+        other = set(other)
+        shared = sum(lengths[e] for e in edges if e in other)
+        if shared > max_overlap * total:
+            return False
+    return True
+
+
+class _SpurSearch:
+    # searches for the best path to the goal avoiding some nodes and edges,
+    # using the exact costs of a reverse tree as the heuristic
+
+    def __init__(self, graph, weights, tree):
+        self.offsets, self.targets = graph.adjacency()
+        self.weights = weights
+        self.costs, self.next_edges = tree
+
+    def nodes(self, start, edges):
+        targets = self.targets
+        return [start] + [targets[e] for e in edges]
+
+    def tree_path(self, node, banned_nodes=()):
+        # the edges of the tree path from node to the goal, or None if it
+        # goes through a banned node
+        edges = []
+        targets, next_edges = self.targets, self.next_edges
+        edge = next_edges[node]
+        while edge is not None:
+            edges.append(edge)
+            node = targets[edge]
+            if node in banned_nodes:
+                return None
+            edge = next_edges[node]
+        return edges
+
+    def spur(self, start, banned_nodes, banned_edges, limit):
+        '''
+        A* from start with banned nodes and edges removed, giving up on
+        paths costing more than limit. Return (edges, cost) or None.
+        '''
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        costs = self.costs
+        if self.next_edges[start] not in banned_edges:
+            edges = self.tree_path(start, banned_nodes)
+            if edges is not None:
+                return (edges, costs[start])
+
+        # tree paths back through start would loop, so it's avoided too
+        blocked = banned_nodes | {start}
+        history = {}
+        path_costs = {start: 0}
+        frontier = [(costs[start], start)]
+        while frontier:
+            (cost, cur_node) = heappop(frontier)
+            cur_cost = path_costs[cur_node]
+            if cost > cur_cost + costs[cur_node]:
+                continue
+            if cur_node != start:
+                rest = self.tree_path(cur_node, blocked)
+                if rest is not None:
+                    edges = []
+                    while cur_node != start:
+                        (cur_node, edge) = history[cur_node]
+                        edges.append(edge)
+                    return (edges[::-1] + rest, cost)
+
+            for e in range(offsets[cur_node], offsets[cur_node + 1]):
+                successor = targets[e]
+                if successor in banned_nodes or (cur_node == start and e in banned_edges):
+                    continue
+                new_path_cost = cur_cost + weights[e]
+                estimate = new_path_cost + costs[successor]
+                if estimate > limit:
+                    continue
+                if successor not in path_costs or new_path_cost < path_costs[successor]:
+                    history[successor] = (cur_node, e)
+                    path_costs[successor] = new_path_cost
+                    heappush(frontier, (estimate, successor))
+
+        return None
@@ -1,35 +1,225 @@
-from collections import defaultdict, namedtuple
-from heapq import heappush, heappop
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from heapq import heapify, heappush, heappop
 import math
+import time
+
+import numpy as np
+
+import csr
+import queues
 
 
 nodedata = namedtuple('NodeData', 'x_m y_m z_m')
 
 
-def astar(costfunc, heuristic, id_digraph, id_to_data, start, goal):
-    """Return the tuple (path, path_cost), or None if no path is found."""
+class SearchStats(dict):
+    """
+    What one query did. It is a dict so that plain {} can still be passed
+    wherever only stats['expanded'] is wanted. The counters are
+
+    expanded    nodes whose edges were relaxed
+    pops        entries taken off the frontier
+    pushes      entries put on the frontier
+    stale       entries popped after a cheaper one for the same node
+    reexpanded  expansions of a node that had been expanded before
+    cost_calls  evaluations of cost and heuristic functions
+
+    and stats['phases'] maps phase names to seconds, see phase().
+    """
+
+    counters = ('expanded', 'pops', 'pushes', 'stale', 'reexpanded', 'cost_calls')
+
+    def __init__(self):
+        super().__init__((name, 0) for name in self.counters)
+        self['phases'] = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Add the time spent in the with block to phase name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = self['phases']
+            phases[name] = phases.get(name, 0) + time.perf_counter() - start
+
+    def report(self):
+        lines = ['{:<12} {}'.format(name, self[name]) for name in self.counters]
+        lines += ['{:<12} {:.2f} ms'.format(name, 1000 * seconds) for name, seconds in self['phases'].items()]
+        return '\n'.join(lines)
+
+
+def phase(stats, name):
+    """stats.phase(name) if stats is a SearchStats, otherwise a no-op context."""
+    if isinstance(stats, SearchStats):
+        return stats.phase(name)
+    return nullcontext()
+
+
+def _count(stats, name, n):
+    if stats is not None:
+        stats[name] = stats.get(name, 0) + n
+
+
+def astar(costfunc, heuristic, id_digraph, id_to_data, start, goal, stats=None, graph=None):
+    """
+    Return the tuple (path, path_cost), or None if no path is found.
+
+    This compiles the digraph and runs astar_csr over it. To route many
+    pairs over the same graph, compile it once with CSRGraph.from_digraph
+    and pass it as graph: its edge weights under costfunc are then only
+    worked out for the first pair. The heuristic is evaluated for the
+    nodes the search reaches, not the whole graph.
+    stats may be a SearchStats (or a dict) to fill in.
+    """
+    if start == goal:
+        return ([start], 0)
+
+    with phase(stats, 'compile'):
+        if graph is None:
+            graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+        weights = graph.cached(('weights', costfunc), lambda: edge_weights(graph, costfunc, stats).tolist())
+    if start not in graph.index or goal not in graph.index:
+        return None
+
+    goal_idx = graph.index[goal]
+    h = _LazyHeuristic(graph, heuristic, goal_idx)
+    with phase(stats, 'search'):
+        result = astar_csr(graph, weights, h, graph.index[start], goal_idx, stats)
+    _count(stats, 'cost_calls', len(h))
+    if result is None:
+        return None
+    with phase(stats, 'path'):
+        return (graph.path_ids(result[0]), result[1])
+
+
+class _LazyHeuristic(dict):
+    # heuristic(node, goal) by node index, worked out the first time each
+    # node is looked up
+    def __init__(self, graph, heuristic, goal):
+        self.graph = graph
+        self.heuristic = heuristic
+        self.goal = nodedata(float(graph.x[goal]), float(graph.y[goal]), float(graph.z[goal]))
+
+    def __missing__(self, i):
+        g = self.graph
+        value = self[i] = self.heuristic(nodedata(float(g.x[i]), float(g.y[i]), float(g.z[i])), self.goal)
+        return value
+
+
+def astar_csr(graph, weights, h, start, goal, stats=None, queue='heap', width=None):
+    """
+    A* over a CSRGraph. weights[e] is the cost of edge e and h[i] the
+    heuristic cost from node i to the goal; start and goal are node indices.
+    Return the tuple (path of node indices, path_cost), or None if no path
+    is found. If stats is a dict (see SearchStats) the search counters are
+    stored in it; without one nothing is counted.
+
+    Frontier entries made outdated by a cheaper path to the same node are
+    skipped when popped, so with a consistent heuristic every node is
+    expanded at most once. queue picks the frontier (see queues.make); the
+    bucket queue's width defaults to the mean edge weight.
+    """
+    if stats is not None or queue != 'heap':
+        if queue == 'bucket' and width is None:
+            width = sum(weights) / len(weights) if len(weights) else 1.0
+        return _astar_csr_queue(graph, weights, h, start, goal, stats, queues.make(queue, width or 1.0))
+
+    offsets, targets = graph.adjacency()
     history = {}
-    frontier = [(0, start)] # a priority queue [(cost, node), ...] 
-    path_costs = defaultdict(int) # updated throughout search
+    frontier = [(h[start], start)] # a priority queue [(cost, node), ...]
+    path_costs = {start: 0} # updated throughout search
 
     while len(frontier) != 0:
         (cost, cur_node) = heappop(frontier)
+        cur_cost = path_costs[cur_node]
+        if cost > cur_cost + h[cur_node]:
+            continue
         if cur_node == goal:
-            path = build_path(id_digraph, start, goal, history)
-            return (path, path_costs[goal])
+            path = build_path(None, start, goal, history)
+            return (path, cur_cost)
 
-        for successor in id_digraph[cur_node]:
-            new_path_cost = path_costs[cur_node] + costfunc(id_to_data[cur_node], id_to_data[successor])
-            if successor not in history or new_path_cost < path_costs[successor]:
+        for e in range(offsets[cur_node], offsets[cur_node + 1]):
+            successor = targets[e]
+            new_path_cost = cur_cost + weights[e]
+            if successor not in path_costs or new_path_cost < path_costs[successor]:
                 history[successor] = cur_node
                 path_costs[successor] = new_path_cost
-                total_cost = path_costs[successor] + heuristic(id_to_data[successor], id_to_data[goal])
-                
-                heappush(frontier, (total_cost, successor))
-                
+                heappush(frontier, (new_path_cost + h[successor], successor))
+
     return None
 
 
+def _astar_csr_queue(graph, weights, h, start, goal, stats, frontier):
+    # astar_csr over any queue, counting as it goes
+    offsets, targets = graph.adjacency()
+    history = {}
+    frontier.push(h[start], start)
+    path_costs = {start: 0}
+    expanded_nodes = set()
+    expanded = pops = stale = reexpanded = 0
+    pushes = 1
+    result = None
+
+    while len(frontier) != 0:
+        (cost, cur_node) = frontier.pop()
+        pops += 1
+        cur_cost = path_costs[cur_node]
+        if cost > cur_cost + h[cur_node]:
+            stale += 1
+            continue
+        if cur_node == goal:
+            result = (build_path(None, start, goal, history), cur_cost)
+            break
+        expanded += 1
+        if cur_node in expanded_nodes:
+            reexpanded += 1
+        expanded_nodes.add(cur_node)
+
+        for e in range(offsets[cur_node], offsets[cur_node + 1]):
+            successor = targets[e]
+            new_path_cost = cur_cost + weights[e]
+            if successor not in path_costs or new_path_cost < path_costs[successor]:
+                history[successor] = cur_node
+                path_costs[successor] = new_path_cost
+                frontier.push(new_path_cost + h[successor], successor)
+                pushes += 1
+
+    if stats is not None:
+        stats.update(expanded=expanded, pops=pops, pushes=pushes, stale=stale, reexpanded=reexpanded)
+    return result
+
+
+def dijkstra(offsets, targets, weights, sources, budget=float('inf')):
+    """
+    One to all shortest path costs over adjacency lists (see
+    CSRGraph.adjacency) from the given source node indices. Return a list of
+    costs with inf for unreachable nodes, and for nodes costing more than
+    budget, which are never searched past.
+    """
+    inf = float('inf')
+    dist = [inf] * (len(offsets) - 1)
+    frontier = []
+    for source in sources:
+        dist[source] = 0
+        frontier.append((0, source))
+    heapify(frontier)
+
+    while frontier:
+        (cost, cur_node) = heappop(frontier)
+        if cost > dist[cur_node]:
+            continue
+        for e in range(offsets[cur_node], offsets[cur_node + 1]):
+            successor = targets[e]
+            new_cost = cost + weights[e]
+            if new_cost < dist[successor] and new_cost <= budget:
+                dist[successor] = new_cost
+                heappush(frontier, (new_cost, successor))
+
+    return dist
+
+
 def build_path(id_digraph, start, goal, history):
     lst = [goal]
     while lst[-1] != start:
@@ -37,6 +227,153 @@ def build_path(id_digraph, start, goal, history):
     return lst[::-1]
 
 
+def shortest_path_tree(graph, weights, source, wanted=None, budget=float('inf')):
+    """
+    Dijkstra from source over a CSRGraph until every node in wanted is
+    settled, or until the cost exceeds budget, or the graph runs out.
+    Return (costs, parents) dicts covering the settled nodes; follow
+    parents back from a settled node to get its path from source.
+    """
+    inf = float('inf')
+    offsets, targets = graph.adjacency()
+    remaining = None if wanted is None else set(wanted)
+    costs = {}
+    parents = {}
+    best = {source: 0}
+    frontier = [(0, source, None)]
+
+    while frontier:
+        (cost, cur_node, parent) = heappop(frontier)
+        if cur_node in costs:
+            continue
+        if cost > budget:
+            break
+        costs[cur_node] = cost
+        if parent is not None:
+            parents[cur_node] = parent
+        if remaining is not None:
+            remaining.discard(cur_node)
+            if not remaining:
+                break
+
+        for e in range(offsets[cur_node], offsets[cur_node + 1]):
+            successor = targets[e]
+            new_cost = cost + weights[e]
+            if new_cost < best.get(successor, inf):
+                best[successor] = new_cost
+                heappush(frontier, (new_cost, successor, cur_node))
+
+    return (costs, parents)
+
+
+def edge_weights(graph, costfunc, stats=None):
+    '''
+    The cost of every edge of a CSRGraph under costfunc, as an array.
+    Cost functions with a vectorized counterpart are evaluated in one go,
+    anything else is called once per edge.
+    '''
+    _count(stats, 'cost_calls', graph.num_edges())
+    if costfunc in vectorized:
+        src = graph.edge_sources()
+        dst = graph.targets
+        return vectorized[costfunc](graph.x[src], graph.y[src], graph.z[src], graph.x[dst], graph.y[dst], graph.z[dst])
+
+    nodes = [nodedata(*xyz) for xyz in zip(graph.x.tolist(), graph.y.tolist(), graph.z.tolist())]
+    offsets, targets = graph.adjacency()
+    weights = np.empty(len(targets))
+    for i in range(len(nodes)):
+        for e in range(offsets[i], offsets[i + 1]):
+            weights[e] = costfunc(nodes[i], nodes[targets[e]])
+    return weights
+
+
+def model_edge_weights(graph, model, stats=None):
+    '''
+    The cost of every edge of a CSRGraph under a travel time model taking
+    [xy distance, elevation change] features, as an array.
+    '''
+    _count(stats, 'cost_calls', graph.num_edges())
+    dist, delta_elev = graph.edge_features()
+    return _predict(model, np.column_stack([dist, delta_elev]))
+
+
+def heuristic_values(graph, heuristic, goal, stats=None):
+    '''heuristic(node, goal) for every node of a CSRGraph, as a list.'''
+    _count(stats, 'cost_calls', len(graph))
+    gx, gy, gz = graph.x[goal], graph.y[goal], graph.z[goal]
+    if heuristic in vectorized:
+        return vectorized[heuristic](graph.x, graph.y, graph.z, gx, gy, gz).tolist()
+
+    goal_data = nodedata(float(gx), float(gy), float(gz))
+    return [heuristic(nodedata(*xyz), goal_data)
+            for xyz in zip(graph.x.tolist(), graph.y.tolist(), graph.z.tolist())]
+
+
+def min_cost_per_metre(graph, weights):
+    '''
+    The smallest cost per metre of straight line distance over the edges
+    of a CSRGraph, or 0 if that is negative. Any path costs at least this
+    times the straight line distance between its ends.
+    '''
+    dist, _ = graph.edge_features()
+    weights = np.asarray(weights, dtype=np.float64)
+    moving = dist > 0
+    if not moving.any():
+        return 0.0
+    return max(0.0, float(np.min(weights[moving] / dist[moving])))
+
+
+def learned_search(graph, weights, model=None):
+    '''
+    Return (weights, heuristic) for searching with a learned model's edge
+    weights, where heuristic(goal) is a consistent (so admissible) heuristic
+    over every node as a list. heuristic(goal, stats) counts its
+    evaluations in stats.
+
+    For a linear model over [distance, elevation change] with a non-negative
+    distance weight the cost of any path is w0*length + w1*(net elevation
+    change), which can't be less than w0*straight line distance + w1*(net
+    elevation change). That bound stays consistent even when downhill edges
+    cost less than nothing. Otherwise the bound is min_cost_per_metre times
+    the straight line distance, and since that needs non-negative edge
+    costs, negative predictions are clamped to 0.
+    '''
+    weights = np.asarray(weights, dtype=np.float64)
+    negative = bool((weights < 0).any())
+    linear = getattr(model, 'weights', None)
+    x, y, z = graph.x, graph.y, graph.z
+
+    if linear is not None and len(linear) == 2 and linear[0] >= 0:
+        w0, w1 = (float(w) for w in linear)
+        scale = None if negative else min_cost_per_metre(graph, weights)
+
+        def heuristic(goal, stats=None):
+            _count(stats, 'cost_calls', len(x))
+            dist = np.sqrt((x[goal] - x)**2 + (y[goal] - y)**2)
+            h = w0*dist + w1*(z[goal] - z)
+            # with no negative edges the min cost per metre bound is
+            # consistent too, and so is the larger of the two
+            if scale is not None:
+                h = np.maximum(h, scale*dist)
+            return h.tolist()
+        return (weights.tolist(), heuristic)
+
+    if negative:
+        weights = np.maximum(weights, 0)
+    scale = min_cost_per_metre(graph, weights)
+
+    def heuristic(goal, stats=None):
+        _count(stats, 'cost_calls', len(x))
+        return (scale * np.sqrt((x[goal] - x)**2 + (y[goal] - y)**2)).tolist()
+    return (weights.tolist(), heuristic)
+
+
+def _predict(model, X):
+    if hasattr(model, 'predict_many'):
+        return np.asarray(model.predict_many(X), dtype=np.float64)
+    return np.array([model(xs) for xs in X.tolist()], dtype=np.float64)
+
+
 def euclidean(a, b):
     '''The euclidean distance path cost/heuristic function disregarding elevations'''
     return math.sqrt((b.x_m - a.x_m)**2 + (b.y_m - a.y_m)**2)
@@ -64,3 +401,31 @@ def toblers_heuristic(a, b):
     m_per_min = 6000/60
     minutes = xy_m/m_per_min
     return minutes
+
+
+def euclidean_many(ax, ay, az, bx, by, bz):
+    '''euclidean over arrays of coordinates'''
+    return np.sqrt((bx - ax)**2 + (by - ay)**2)
+
+
+def toblers_many(ax, ay, az, bx, by, bz):
+    '''toblers over arrays of coordinates'''
+    xy_dist = np.sqrt((bx - ax)**2 + (by - ay)**2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (bz - az)/xy_dist
+        km_per_h = 6*np.exp(-3.5 * np.abs(slope + 0.05))
+        minutes = xy_dist / (km_per_h / 60 * 1000)
+    return np.where(xy_dist == 0, 0.0, minutes)
+
+
+def toblers_heuristic_many(ax, ay, az, bx, by, bz):
+    '''toblers_heuristic over arrays of coordinates'''
+    return np.sqrt((bx - ax)**2 + (by - ay)**2) / (6000/60)
+
+
+# cost functions of two NodeDatas -> their counterparts over coordinate arrays
+vectorized = {
+    euclidean: euclidean_many,
+    toblers: toblers_many,
+    toblers_heuristic: toblers_heuristic_many,
+}
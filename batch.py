@@ -0,0 +1,102 @@
+'''
+Routing many queries at once.
+
+Queries are grouped by source and each source gets a single one to many
+search that runs until all of its targets are settled, instead of one
+search per (source, target) pair. Alternative routes are grouped by target
+instead, sharing the reverse tree from it.
+'''
+from collections import defaultdict
+
+import alternatives
+import astar
+import csr
+
+
+def route_many(graph, weights, pairs):
+    '''
+    Route every (source, target) pair of node indices of a CSRGraph. Return
+    a list of (path, path_cost) or None, in the same order as pairs.
+    '''
+    by_source = defaultdict(set)
+    for (source, target) in pairs:
+        by_source[source].add(target)
+
+    trees = {source: astar.shortest_path_tree(graph, weights, source, targets)
+             for source, targets in by_source.items()}
+
+    results = []
+    for (source, target) in pairs:
+        costs, parents = trees[source]
+        if target not in costs:
+            results.append(None)
+        else:
+            results.append((astar.build_path(None, source, target, parents), costs[target]))
+    return results
+
+
+def route_alternatives(graph, weights, pairs, k=3, heuristic=None, **options):
+    '''
+    alternatives.alternatives for every (source, target) pair of node
+    indices of a CSRGraph, sharing one reverse shortest path tree between
+    the pairs with the same target. Return a list with each pair's list of
+    (path, path_cost), in the same order as pairs.
+
+    For weights needing a heuristic (see alternatives.alternatives) pass
+    heuristic(goal), returning it over every node as a list, like the one
+    astar.learned_search gives; a single h can't serve several targets.
+    '''
+    by_target = defaultdict(set)
+    for (source, target) in pairs:
+        by_target[target].add(source)
+
+    found = {}
+    for target, sources in by_target.items():
+        h = None if heuristic is None else heuristic(target)
+        (reduced, _) = alternatives._reduced(graph, weights, h, target, target)
+        tree = alternatives.reverse_tree(graph, reduced, target)
+        for source in sources:
+            found[source, target] = alternatives.alternatives(graph, weights, source, target, k, h=h, tree=tree, **options)
+    return [found[pair] for pair in pairs]
+
+
+def route_chains(graph, weights, chains):
+    '''
+    Route chains of waypoints (lists of node indices), leg by leg. Return a
+    list with, for each chain, the list of its legs' (path, path_cost), or
+    None if any leg has no path.
+    '''
+    legs = [(a, b) for chain in chains for (a, b) in zip(chain, chain[1:])]
+    routed = iter(route_many(graph, weights, legs))
+
+    results = []
+    for chain in chains:
+        chain_legs = [next(routed) for _ in range(len(chain) - 1)]
+        results.append(None if None in chain_legs else chain_legs)
+    return results
+
+
+def route_id_chains(id_digraph, id_to_data, chains, costfunc=astar.toblers, graph=None):
+    '''
+    route_chains over node ids of a digraph. Each chain's legs are joined
+    into one path the way models.construct_full_path does (every leg's path
+    in full, one after another); chains with an unknown node or an
+    impossible leg give None. graph may be the digraph already compiled to
+    a CSRGraph.
+    '''
+    if graph is None:
+        graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    weights = astar.edge_weights(graph, costfunc).tolist()
+
+    known = [all(nid in graph.index for nid in chain) for chain in chains]
+    index_chains = [[graph.index[nid] for nid in chain] for chain, ok in zip(chains, known) if ok]
+    routed = iter(route_chains(graph, weights, index_chains))
+
+    results = []
+    for ok in known:
+        legs = next(routed) if ok else None
+        if legs is None:
+            results.append(None)
+        else:
+            results.append([graph.ids[i] for (path, _) in legs for i in path])
+    return results
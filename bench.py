@@ -0,0 +1,563 @@
+'''
+Benchmarks. Run as
+
+    python bench.py ingest [osm_path elevations_path]
+
+to compare the DOM based and the streaming map loaders. Without paths a
+synthetic map is generated in a temporary directory.
+
+    python bench.py alt [rows cols landmarks]
+
+compares plain A* with the straight line Tobler heuristic against ALT A*
+and bidirectional ALT on a fixed set of queries over a synthetic grid.
+
+    python bench.py ch [rows cols]
+
+builds a contraction hierarchy over a synthetic grid, checks it against
+plain A* and compares query times.
+
+    python bench.py chains [rows cols bends]
+
+collapses the chains of degree-2 nodes of a synthetic grid whose streets
+curve through bends extra nodes, and compares query times and the sizes of
+the original and reduced graphs.
+
+    python bench.py server [requests.jsonl]
+
+measures route server throughput and latency with 0, 1, 2 and 4 worker
+processes on a synthetic map, for the given requests or random ones.
+
+    python bench.py parallel [rows cols max_workers]
+
+times a batch of queries over a shared, memory mapped compiled graph with
+1..max_workers processes.
+
+    python bench.py queues [nodes]
+
+compares the A* frontier queues (binary heap, indexed decrease-key heap and
+bucket queue) on synthetic grid and random geometric graphs.
+
+    python bench.py suite [--sizes 1000,10000,100000] [--kinds grid,geometric] [--out results.json]
+
+runs the whole suite (map loading, elevation lookups, query latency for
+every prediction, batch throughput and walk reconstruction) on synthetic
+maps of each size, and on the bundled Dubrovnik data when it is present,
+and writes the results as json. 10**6 nodes works but takes a while and a
+few GB of memory.
+
+    python bench.py compare old.json new.json
+
+prints how every timing changed between two suite runs.
+'''
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import asyncio
+
+import numpy as np
+
+import alt
+import astar
+import batch
+import ch
+import config
+import csr
+import models
+import parallel
+import run
+import server
+import simplify
+import synthetic
+
+
+def measure(func, *args):
+    '''Return (result, seconds, peak traced bytes) of calling func(*args).'''
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (result, seconds, peak)
+
+
+def compare_ingestion(xml_path, elevations_path):
+    '''
+    Load the map with read_xml and with read_xml_streaming and return
+    {loader name: {'seconds': ..., 'peak_mb': ..., 'nodes': ..., 'edges': ...}}.
+    '''
+    results = {}
+    for loader in (run.read_xml, run.read_xml_streaming):
+        (graph, ways, data), seconds, peak = measure(loader, xml_path, elevations_path)
+        results[loader.__name__] = {
+            'seconds': seconds,
+            'peak_mb': peak / 2**20,
+            'nodes': len(data),
+            'edges': sum(len(succ) for succ in graph.values()),
+        }
+    return results
+
+
+def print_ingestion(results):
+    print('{:<20} {:>10} {:>10} {:>10} {:>10}'.format('loader', 'seconds', 'peak MB', 'nodes', 'edges'))
+    for name, r in results.items():
+        print('{:<20} {:>10.2f} {:>10.1f} {:>10} {:>10}'.format(name, r['seconds'], r['peak_mb'], r['nodes'], r['edges']))
+
+
+def compare_alt(graph, weights, landmarks, queries):
+    '''
+    Run each (start, goal) query with plain A*, ALT A* and bidirectional
+    ALT. Return {method: {'expanded': mean nodes expanded, 'ms': mean query
+    milliseconds}}. Query time includes computing the heuristic.
+    '''
+    def plain(s, t, stats):
+        h = astar.heuristic_values(graph, astar.toblers_heuristic, t)
+        return astar.astar_csr(graph, weights, h, s, t, stats)
+
+    def alt_astar(s, t, stats):
+        return astar.astar_csr(graph, weights, alt.heuristic(graph, landmarks, t, s), s, t, stats)
+
+    def bidirectional(s, t, stats):
+        return alt.bidirectional_astar(graph, weights, landmarks, s, t, stats=stats)
+
+    results = {}
+    for name, method in (('astar', plain), ('alt', alt_astar), ('alt_bidirectional', bidirectional)):
+        expanded = 0
+        start = time.perf_counter()
+        for s, t in queries:
+            stats = {}
+            method(s, t, stats)
+            expanded += stats.get('expanded', 0)
+        seconds = time.perf_counter() - start
+        results[name] = {'expanded': expanded / len(queries), 'ms': 1000 * seconds / len(queries)}
+    return results
+
+
+def compare_ch(graph, weights, queries):
+    '''
+    Build a contraction hierarchy and time it against plain A* on queries.
+    Return a dict of build seconds, mean query milliseconds for both and the
+    number of queries where they disagree.
+    '''
+    start = time.perf_counter()
+    hierarchy = ch.ContractionHierarchy.build(graph, weights)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [astar.astar_csr(graph, weights, astar.heuristic_values(graph, astar.toblers_heuristic, t), s, t)
+                for s, t in queries]
+    astar_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    got = [hierarchy.query(s, t) for s, t in queries]
+    ch_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+    mismatches = sum(1 for a, b in zip(expected, got)
+                     if (a is None) != (b is None) or (a is not None and abs(a[1] - b[1]) > 1e-9 * max(1, a[1])))
+    return {'build_seconds': build, 'astar_ms': astar_ms, 'ch_ms': ch_ms, 'mismatches': mismatches}
+
+
+def compare_chains(graph, weights, queries):
+    '''
+    Collapse the chains of a graph and time searching the reduced graph
+    against plain A* on queries. Return a dict of the node and edge counts
+    before and after, build seconds, mean query milliseconds for both and
+    the number of queries where they disagree.
+    '''
+    start = time.perf_counter()
+    chains = simplify.Chains.build(graph)
+    reduced_weights = chains.weights(weights)
+    chains.lists()
+    build = time.perf_counter() - start
+
+    heuristics = [astar.heuristic_values(graph, astar.toblers_heuristic, t) for _, t in queries]
+    start = time.perf_counter()
+    expected = [astar.astar_csr(graph, weights, h, s, t) for (s, t), h in zip(queries, heuristics)]
+    astar_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    got = [chains.search(weights, reduced_weights, h, s, t) for (s, t), h in zip(queries, heuristics)]
+    chains_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+    mismatches = sum(1 for a, b in zip(expected, got)
+                     if (a is None) != (b is None) or (a is not None and abs(a[1] - b[1]) > 1e-9 * max(1, a[1])))
+    return {'nodes': len(graph), 'edges': graph.num_edges(),
+            'reduced_nodes': len(chains.reduced), 'reduced_edges': chains.reduced.num_edges(),
+            'build_seconds': build, 'astar_ms': astar_ms, 'chains_ms': chains_ms, 'mismatches': mismatches}
+
+
+def server_throughput(paths, requests, workers=(0, 1, 2, 4)):
+    '''Run the route server benchmark for each number of workers.'''
+    results = {}
+    for n in workers:
+        async def go():
+            s = server.Server(paths, n)
+            try:
+                return await s.benchmark(requests)
+            finally:
+                s.close()
+        results[n] = asyncio.run(go())
+    return results
+
+
+def parallel_scaling(graph, weights, queries, max_workers):
+    '''
+    Route queries (pairs of node ids) with 1..max_workers processes.
+    Return {workers: queries per second}.
+    '''
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'compiled')
+        parallel.write_compiled(path, graph, weights, 1/100)
+        for n in range(1, max_workers + 1):
+            start = time.perf_counter()
+            for _ in parallel.route_parallel(path, queries, n):
+                pass
+            results[n] = len(queries) / (time.perf_counter() - start)
+    return results
+
+
+def random_requests(graph, count, seed=0):
+    r = random.Random(seed)
+    ids = list(graph)
+    return [{'id': i, 'source': str(r.choice(ids)), 'destination': str(r.choice(ids))} for i in range(count)]
+
+
+def random_queries(graph, count, seed=0):
+    r = random.Random(seed)
+    return [(r.randrange(len(graph)), r.randrange(len(graph))) for _ in range(count)]
+
+
+def compare_queues(graph, weights, queries, heuristic):
+    '''
+    Run the queries with each frontier queue. Return {queue: {'ms': mean
+    query milliseconds, 'pops': mean entries popped}}, with 'heap' timed
+    without counting (the default fast path).
+    '''
+    results = {}
+    hs = {t: heuristic(t) for _, t in queries}
+    for queue in ('heap', 'indexed', 'bucket'):
+        start = time.perf_counter()
+        for s, t in queries:
+            astar.astar_csr(graph, weights, hs[t], s, t, queue=queue)
+        ms = 1000 * (time.perf_counter() - start) / len(queries)
+        pops = 0
+        for s, t in queries:
+            stats = {}
+            astar.astar_csr(graph, weights, hs[t], s, t, stats, queue=queue)
+            pops += stats['pops']
+        results[queue] = {'ms': ms, 'pops': pops / len(queries)}
+    return results
+
+
+def environment():
+    '''What the suite ran on, so that results can be told apart.'''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def latency(seconds):
+    '''Summarize a list of per query seconds in milliseconds.'''
+    ms = np.array(seconds) * 1000
+    return {
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p90_ms': float(np.percentile(ms, 90)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+    }
+
+
+def synthetic_graph(kind, n, seed=0):
+    '''(id_digraph, id_to_data) for a synthetic map of about n nodes.'''
+    if kind == 'grid':
+        side = max(2, round(math.sqrt(n)))
+        return synthetic.grid_graph(side, side, seed=seed)
+    if kind == 'geometric':
+        return synthetic.geometric_graph(n, seed=seed)
+    raise ValueError('unknown graph kind {}'.format(kind))
+
+
+def train_model(graph, prediction, count=200, seed=0):
+    '''
+    A model of the given kind trained on Tobler times, give or take 20%,
+    over random edges.
+    '''
+    r = random.Random(seed)
+    dist, dz = graph.edge_features()
+    times = astar.edge_weights(graph, astar.toblers)
+    edges = [r.randrange(graph.num_edges()) for _ in range(count)]
+    examples = [([float(dist[e]), float(dz[e])], float(times[e]) * r.uniform(.8, 1.2)) for e in edges]
+    if prediction == 'linear':
+        return models.linear_model(examples)
+    return models.nearest_neighbor_model(examples)
+
+
+def search_latency(graph, weights, heuristic, queries):
+    '''
+    Time each (start, goal) query, heuristic included. Return the latency
+    summary with the mean expanded nodes and the fraction of queries that
+    found a path.
+    '''
+    seconds, expanded, found = [], 0, 0
+    for s, t in queries:
+        stats = {}
+        start = time.perf_counter()
+        result = astar.astar_csr(graph, weights, heuristic(t), s, t, stats)
+        seconds.append(time.perf_counter() - start)
+        expanded += stats['expanded']
+        found += result is not None
+    results = latency(seconds)
+    results['expanded'] = expanded / len(queries)
+    results['found'] = found / len(queries)
+    return results
+
+
+def bench_graph(name, id_digraph, id_to_data, queries=50, walks=20, seed=0):
+    '''
+    Query latency for every prediction, batch throughput and walk
+    reconstruction on one map. Return a list of result dicts.
+    '''
+    start = time.perf_counter()
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    compile_seconds = time.perf_counter() - start
+    common = {'graph': name, 'nodes': len(graph), 'edges': graph.num_edges()}
+    results = [dict(common, benchmark='compile', seconds=compile_seconds)]
+    pairs = random_queries(graph, queries, seed)
+
+    toblers = astar.edge_weights(graph, astar.toblers).tolist()
+    searches = {'toblers': (toblers, lambda goal: astar.heuristic_values(graph, astar.toblers_heuristic, goal))}
+    for prediction in ('linear', 'nearest'):
+        model = train_model(graph, prediction, seed=seed)
+        searches[prediction] = astar.learned_search(graph, astar.model_edge_weights(graph, model), model)
+    for prediction, (weights, heuristic) in searches.items():
+        results.append(dict(common, benchmark='query', prediction=prediction,
+                            **search_latency(graph, weights, heuristic, pairs)))
+
+    start = time.perf_counter()
+    batch.route_many(graph, toblers, pairs)
+    seconds = time.perf_counter() - start
+    results.append(dict(common, benchmark='batch', queries=len(pairs), seconds=seconds,
+                        per_second=len(pairs) / seconds))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        walk_path = os.path.join(tmp, 'walks.txt')
+        # walk between nodes that can reach each other (the synthetic maps
+        # are undirected) so that every walk can be reconstructed
+        offsets, targets = graph.adjacency()
+        busiest = int(np.argmax(np.diff(graph.offsets)))
+        reachable = np.isfinite(astar.dijkstra(offsets, targets, toblers, [busiest]))
+        ids = [nid for nid, ok in zip(graph.ids, reachable.tolist()) if ok]
+        synthetic.write_walks(walk_path, ids, walks, seed=seed)
+        start = time.perf_counter()
+        models.read_walk_data(walk_path, id_digraph, id_to_data)
+        results.append(dict(common, benchmark='walks', walks=walks, seconds=time.perf_counter() - start))
+    return results
+
+
+def bench_loading(n, hgt_path, seed=0):
+    '''
+    Streaming load, cache compile and cached load times for a synthetic OSM
+    file with about n street nodes, and interpolated elevation lookups for
+    n points. Return a list of result dicts.
+    '''
+    side = max(2, round(math.sqrt(n)))
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        osm_path = os.path.join(tmp, 'map.osm')
+        cache_path = os.path.join(tmp, 'map.cache')
+        synthetic.write_osm(osm_path, side, side, buildings=0, seed=seed)
+        common = {'graph': 'osm', 'nodes': side*side, 'bytes': os.path.getsize(osm_path)}
+
+        start = time.perf_counter()
+        run.read_xml_streaming(osm_path, hgt_path)
+        results.append(dict(common, benchmark='load_streaming', seconds=time.perf_counter() - start))
+        start = time.perf_counter()
+        run.compile_map(osm_path, hgt_path, cache_path)
+        results.append(dict(common, benchmark='load_compile', seconds=time.perf_counter() - start))
+        start = time.perf_counter()
+        run.load_map(osm_path, hgt_path, cache_path)
+        results.append(dict(common, benchmark='load_cached', seconds=time.perf_counter() - start))
+
+    r = np.random.default_rng(seed)
+    lats, lons = r.uniform(42, 43, n), r.uniform(18, 19, n)
+    elevs = run.map_elevations(hgt_path)
+    start = time.perf_counter()
+    run.lerped_elevations(elevs, lats, lons)
+    seconds = time.perf_counter() - start
+    results.append({'benchmark': 'elevation', 'graph': 'points', 'nodes': n, 'seconds': seconds, 'per_second': n / seconds})
+    return results
+
+
+def suite(sizes, kinds, queries=50, walks=20, seed=0, log=None):
+    '''
+    Run every benchmark on synthetic maps of each size and kind, and on the
+    bundled map if there is one. Return {'environment': ..., 'results': [...]}.
+    '''
+    results = []
+
+    def add(entries):
+        for entry in entries:
+            entry['seed'] = seed
+            results.append(entry)
+            if log is not None:
+                log(entry)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        hgt_path = os.path.join(tmp, 'N42E018.HGT')
+        synthetic.write_hgt(hgt_path)
+        for n in sizes:
+            add(bench_loading(n, hgt_path, seed))
+            for kind in kinds:
+                add(bench_graph(kind, *synthetic_graph(kind, n, seed), queries=queries, walks=walks, seed=seed))
+
+    if os.path.exists(config.osm_path) and os.path.exists(config.elev_path):
+        (graph, ways, data) = run.load_map(config.osm_path, config.elev_path, config.cache_path)
+        add(bench_graph('dbv', graph, data, queries=queries, walks=walks, seed=seed))
+
+    return {'environment': environment(), 'results': results}
+
+
+def result_key(entry):
+    return tuple(str(entry.get(k)) for k in ('benchmark', 'graph', 'nodes', 'prediction'))
+
+
+def compare(old, new):
+    '''
+    Pair up the results of two suite runs and return [(key, metric, old
+    value, new value)] for every timing both have.
+    '''
+    before = {result_key(e): e for e in old['results']}
+    changes = []
+    for entry in new['results']:
+        key = result_key(entry)
+        if key not in before:
+            continue
+        for metric in ('seconds', 'mean_ms', 'p50_ms', 'p99_ms', 'per_second'):
+            if metric in entry and metric in before[key]:
+                changes.append((key, metric, before[key][metric], entry[metric]))
+    return changes
+
+
+def main(argv):
+    if argv[:1] == ['ingest']:
+        paths = argv[1:3]
+        with tempfile.TemporaryDirectory() as tmp:
+            if not paths:
+                if os.path.exists(config.osm_path) and os.path.exists(config.elev_path):
+                    paths = [config.osm_path, config.elev_path]
+                else:
+                    paths = [os.path.join(tmp, 'map.osm'), os.path.join(tmp, 'N42E018.HGT')]
+                    synthetic.write_osm(paths[0], 150, 150)
+                    synthetic.write_hgt(paths[1])
+            print_ingestion(compare_ingestion(*paths))
+    elif argv[:1] == ['alt']:
+        rows, cols, count = (int(a) for a in (argv[1:4] + ['150', '150', '16'][len(argv[1:4]):]))
+        graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(rows, cols))
+        weights = astar.edge_weights(graph, astar.toblers).tolist()
+        start = time.perf_counter()
+        landmarks = alt.Landmarks.build(graph, weights, count)
+        print('{} nodes, {} landmarks in {:.2f} s'.format(len(graph), count, time.perf_counter() - start))
+        results = compare_alt(graph, weights, landmarks, random_queries(graph, 100))
+        print('{:<20} {:>10} {:>10}'.format('method', 'expanded', 'ms'))
+        for name, r in results.items():
+            print('{:<20} {:>10.0f} {:>10.2f}'.format(name, r['expanded'], r['ms']))
+    elif argv[:1] == ['ch']:
+        rows, cols = (int(a) for a in (argv[1:3] + ['80', '80'][len(argv[1:3]):]))
+        graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(rows, cols))
+        weights = astar.edge_weights(graph, astar.toblers).tolist()
+        results = compare_ch(graph, weights, random_queries(graph, 200))
+        print('{} nodes: built in {:.1f} s, {:.3f} ms per query vs {:.3f} ms for A*, {} mismatches'.format(
+            len(graph), results['build_seconds'], results['ch_ms'], results['astar_ms'], results['mismatches']))
+    elif argv[:1] == ['chains']:
+        rows, cols, bends = (int(a) for a in (argv[1:4] + ['80', '80', '4'][len(argv[1:4]):]))
+        graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(rows, cols, bends=bends))
+        weights = astar.edge_weights(graph, astar.toblers).tolist()
+        r = compare_chains(graph, weights, random_queries(graph, 200))
+        print('{} nodes, {} edges -> {} nodes, {} edges in {:.2f} s'.format(
+            r['nodes'], r['edges'], r['reduced_nodes'], r['reduced_edges'], r['build_seconds']))
+        print('{:.3f} ms per query vs {:.3f} ms for A*, {} mismatches'.format(r['chains_ms'], r['astar_ms'], r['mismatches']))
+    elif argv[:1] == ['server']:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = (os.path.join(tmp, 'map.osm'), os.path.join(tmp, 'N42E018.HGT'), os.path.join(tmp, 'map.cache'))
+            synthetic.write_osm(paths[0], 100, 100, buildings=0)
+            synthetic.write_hgt(paths[1])
+            (graph, ways, data) = run.load_map(*paths)
+            if argv[1:2]:
+                requests = server.read_requests(argv[1])
+            else:
+                requests = random_requests(graph, 400)
+            print('{:<8} {:>10} {:>10} {:>10} {:>10}'.format('workers', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+            for n, r in server_throughput(paths, requests).items():
+                print('{:<8} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(n, r['per_second'], r['p50_ms'], r['p95_ms'], r['p99_ms']))
+    elif argv[:1] == ['parallel']:
+        rows, cols, max_workers = (int(a) for a in (argv[1:4] + ['150', '150', str(os.cpu_count())][len(argv[1:4]):]))
+        graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(rows, cols))
+        weights = astar.edge_weights(graph, astar.toblers)
+        queries = [(graph.ids[s], graph.ids[t]) for s, t in random_queries(graph, 400)]
+        print('{:<8} {:>10}'.format('workers', 'queries/s'))
+        for n, per_second in parallel_scaling(graph, weights, queries, max_workers).items():
+            print('{:<8} {:>10.1f}'.format(n, per_second))
+    elif argv[:1] == ['queues']:
+        n = int(argv[1]) if argv[1:2] else 20000
+        print('{:<10} {:<10} {:>10} {:>10}'.format('graph', 'queue', 'ms', 'pops'))
+        for kind in ('grid', 'geometric'):
+            graph = csr.CSRGraph.from_digraph(*synthetic_graph(kind, n))
+            weights = astar.edge_weights(graph, astar.toblers).tolist()
+            heuristic = lambda t: astar.heuristic_values(graph, astar.toblers_heuristic, t)
+            for queue, r in compare_queues(graph, weights, random_queries(graph, 50), heuristic).items():
+                print('{:<10} {:<10} {:>10.2f} {:>10.0f}'.format(kind, queue, r['ms'], r['pops']))
+    elif argv[:1] == ['suite']:
+        parser = argparse.ArgumentParser(prog='bench.py suite')
+        parser.add_argument('--sizes', default='1000,10000,100000', help='comma separated node counts')
+        parser.add_argument('--kinds', default='grid,geometric', help='comma separated synthetic graph kinds')
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--walks', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--out', help='write the results here instead of to stdout')
+        args = parser.parse_args(argv[1:])
+        log = lambda entry: print(json.dumps(entry), file=sys.stderr)
+        results = suite([int(n) for n in args.sizes.split(',')], args.kinds.split(','),
+                        args.queries, args.walks, args.seed, log)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(results, f, indent=1)
+        else:
+            print(json.dumps(results, indent=1))
+    elif argv[:1] == ['compare'] and len(argv) == 3:
+        with open(argv[1]) as f:
+            old = json.load(f)
+        with open(argv[2]) as f:
+            new = json.load(f)
+        print('{:<50} {:<12} {:>12} {:>12} {:>8}'.format('benchmark', 'metric', 'old', 'new', 'change'))
+        for key, metric, before, after in compare(old, new):
+            change = '{:+.0%}'.format(after / before - 1) if before else ''
+            print('{:<50} {:<12} {:>12.4g} {:>12.4g} {:>8}'.format(' '.join(k for k in key if k != 'None'), metric, before, after, change))
+    else:
+        print(__doc__)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
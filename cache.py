@@ -0,0 +1,314 @@
+'''
+A versioned binary cache of the compiled map so we don't re-parse the OSM
+file on every run.
+
+A cache file is laid out as
+
+    MAGIC | format version (u32) | header length (u32) | json header | arrays
+
+where the json header records the source stamp the cache was built from and
+the dtype, shape and byte offset of every array. Arrays are 64 byte aligned
+and are mapped straight back in with mmap, so loading costs about as much as
+reading the header.
+'''
+import hashlib
+import json
+import mmap
+import os
+import struct
+from collections import defaultdict
+
+import numpy as np
+
+import csr
+from astar import nodedata
+
+
+MAGIC = b'DBVCACHE'
+FORMAT_VERSION = 1
+ALIGN = 64
+
+# bump this whenever the meaning of the cached graph changes
+GRAPH_VERSION = 2
+
+
+def source_stamp(paths, use_hash=False):
+    '''
+    Describe the source files a cache was built from as
+    [[path, size, mtime_ns, sha1 or None], ...]. A directory stands for the
+    elevation tiles in it. A cache is stale when its stamp differs from the
+    current one.
+    '''
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, f) for f in os.listdir(path) if f.upper().endswith('.HGT')))
+        else:
+            files.append(path)
+
+    stamp = []
+    for path in files:
+        st = os.stat(path)
+        digest = None
+        if use_hash:
+            h = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            digest = h.hexdigest()
+        stamp.append([os.path.abspath(path), st.st_size, st.st_mtime_ns, digest])
+    return stamp
+
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def save_arrays(path, arrays, meta):
+    '''
+    Write a dict of numpy arrays and a json-able meta dict to path.
+    The file is written next to path first and then moved into place so
+    readers never see a half written cache.
+    '''
+    arrays = {name: np.ascontiguousarray(arr) for name, arr in arrays.items()}
+
+    layout = {}
+    offset = 0
+    for name, arr in arrays.items():
+        layout[name] = [arr.dtype.str, list(arr.shape), offset]
+        offset = _aligned(offset + arr.nbytes)
+
+    header = json.dumps({'meta': meta, 'arrays': layout}).encode('utf-8')
+    prefix_len = len(MAGIC) + 8 + len(header)
+    start = _aligned(prefix_len)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<II', FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write(b'\0' * (start - prefix_len))
+        pos = 0
+        for name, arr in arrays.items():
+            f.write(b'\0' * (layout[name][2] - pos))
+            f.write(arr.tobytes())
+            pos = layout[name][2] + arr.nbytes
+    os.replace(tmp_path, path)
+
+
+def load_arrays(path):
+    '''
+    Map a file written by save_arrays back in. Return (meta, arrays) where
+    arrays are read-only views onto the mapped file, or None if the file is
+    missing or was written with a different format version.
+    '''
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buf[:len(MAGIC)] != MAGIC:
+        return None
+    version, header_len = struct.unpack_from('<II', buf, len(MAGIC))
+    if version != FORMAT_VERSION:
+        return None
+
+    header_start = len(MAGIC) + 8
+    header = json.loads(bytes(buf[header_start:header_start + header_len]).decode('utf-8'))
+    start = _aligned(header_start + header_len)
+
+    arrays = {}
+    for name, (dtype, shape, offset) in header['arrays'].items():
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        arr = np.frombuffer(buf, dtype=dtype, count=count, offset=start + offset)
+        arrays[name] = arr.reshape(shape)
+
+    return (header['meta'], arrays)
+
+
+def graph_to_arrays(graph, ways, data):
+    '''
+    Flatten the (graph, ways, data) triple into arrays. Node ids are sorted
+    and referred to by index; adjacency is stored in compressed sparse row
+    form so each node's successor order is kept.
+    '''
+    ids = sorted(set(data) | set(graph))
+    index = {nid: i for i, nid in enumerate(ids)}
+
+    xyz = np.full((len(ids), 3), np.nan)
+    for nid, nd in data.items():
+        xyz[index[nid]] = nd
+
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    targets = []
+    for i, nid in enumerate(ids):
+        successors = graph.get(nid, ())
+        targets.extend(index[s] for s in successors)
+        offsets[i + 1] = len(targets)
+
+    names = sorted(ways)
+    way_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    way_nodes = []
+    for i, name in enumerate(names):
+        way_nodes.extend(ways[name])
+        way_offsets[i + 1] = len(way_nodes)
+
+    arrays = {
+        'ids': np.array(ids, dtype=np.int64),
+        'xyz': xyz,
+        'offsets': offsets,
+        'targets': np.array(targets, dtype=np.int32),
+        'way_offsets': way_offsets,
+        'way_nodes': np.array(way_nodes, dtype=np.int64),
+    }
+    return (arrays, names)
+
+
+def arrays_to_graph(arrays, names):
+    '''The inverse of graph_to_arrays. Return (graph, ways, data).'''
+    ids = arrays['ids'].tolist()
+    offsets = arrays['offsets'].tolist()
+    targets = arrays['targets'].tolist()
+
+    graph = defaultdict(list)
+    for i, nid in enumerate(ids):
+        start, end = offsets[i], offsets[i + 1]
+        if start != end:
+            graph[nid] = [ids[t] for t in targets[start:end]]
+
+    data = {}
+    xyz = arrays['xyz']
+    present = ~np.isnan(xyz).any(axis=1)
+    for nid, (x, y, z) in zip(arrays['ids'][present].tolist(), xyz[present].tolist()):
+        data[nid] = nodedata(x, y, z)
+
+    return (graph, arrays_to_ways(arrays, names), data)
+
+
+def arrays_to_ways(arrays, names):
+    '''Just the ways of arrays_to_graph.'''
+    way_offsets = arrays['way_offsets'].tolist()
+    way_nodes = arrays['way_nodes'].tolist()
+    return {name: way_nodes[way_offsets[i]:way_offsets[i + 1]] for i, name in enumerate(names)}
+
+
+class CachedMap:
+    '''
+    A map read back from the cache. compiled is a csr.CSRGraph straight over
+    the mapped arrays, which is all a search needs. The (graph, ways, data)
+    dicts take far longer to build than the arrays take to map in, so they
+    are only built the first time something asks for them. Unpacking gives
+    (graph, ways, data).
+    '''
+
+    def __init__(self, arrays, names):
+        self.arrays = arrays
+        self.names = names
+        self._compiled = None
+        self._ways = None
+        self._dicts = None
+
+    @property
+    def compiled(self):
+        if self._compiled is None:
+            self._compiled = csr.CSRGraph.from_arrays(self.arrays)
+        return self._compiled
+
+    @property
+    def ways(self):
+        if self._ways is None:
+            self._ways = arrays_to_ways(self.arrays, self.names)
+        return self._ways
+
+    @property
+    def graph(self):
+        return self._graph_and_data()[0]
+
+    @property
+    def data(self):
+        return self._graph_and_data()[1]
+
+    def _graph_and_data(self):
+        if self._dicts is None:
+            (graph, ways, data) = arrays_to_graph(self.arrays, self.names)
+            self._dicts = (graph, data)
+            if self._ways is None:
+                self._ways = ways
+        return self._dicts
+
+    def __iter__(self):
+        return iter((self.graph, self.ways, self.data))
+
+
+def write_graph_cache(path, graph, ways, data, stamp):
+    '''Write the (graph, ways, data) triple to path, tagged with stamp.'''
+    arrays, names = graph_to_arrays(graph, ways, data)
+    meta = {'graph_version': GRAPH_VERSION, 'stamp': stamp, 'way_names': names}
+    save_arrays(path, arrays, meta)
+
+
+def read_graph_cache(path, stamp=None):
+    '''
+    Return the CachedMap at path, or None if there is no usable cache
+    there. If stamp is given the cache must have been built from exactly
+    those sources.
+    '''
+    loaded = load_arrays(path)
+    if loaded is None:
+        return None
+    meta, arrays = loaded
+    if meta.get('graph_version') != GRAPH_VERSION:
+        return None
+    if stamp is not None and meta.get('stamp') != stamp:
+        return None
+    return CachedMap(arrays, meta['way_names'])
+
+
+def write_walk_cache(path, fingerprint, walks):
+    '''
+    Write reconstructed walks, {row key: full path or None if impossible},
+    to path, tagged with the fingerprint of the graph they were routed on.
+    '''
+    keys = sorted(walks)
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    nodes = []
+    for i, key in enumerate(keys):
+        nodes.extend(walks[key] or ())
+        offsets[i + 1] = len(nodes)
+    arrays = {
+        'offsets': offsets,
+        'nodes': np.array(nodes, dtype=np.int64),
+        'possible': np.array([walks[key] is not None for key in keys], dtype=np.uint8),
+    }
+    save_arrays(path, arrays, {'kind': 'walks', 'fingerprint': fingerprint, 'keys': keys})
+
+
+def read_walk_cache(path, fingerprint):
+    '''
+    The walks written by write_walk_cache, or {} if there is no cache at
+    path or it was routed on another graph.
+    '''
+    loaded = load_arrays(path)
+    if loaded is None:
+        return {}
+    meta, arrays = loaded
+    if meta.get('kind') != 'walks' or meta.get('fingerprint') != fingerprint:
+        return {}
+    offsets = arrays['offsets'].tolist()
+    nodes = arrays['nodes'].tolist()
+    possible = arrays['possible'].tolist()
+    return {key: nodes[offsets[i]:offsets[i + 1]] if possible[i] else None
+            for i, key in enumerate(meta['keys'])}
+
+
+if __name__ == '__main__':
+    import config
+    import run
+    run.compile_map(config.osm_path, config.elev_path, config.cache_path)
+    print('wrote {}'.format(config.cache_path))
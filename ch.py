@@ -0,0 +1,282 @@
+'''
+Contraction hierarchies for answering many queries on a static map.
+
+Nodes are contracted one at a time, least important first. Contracting v
+removes it from the remaining graph and adds a shortcut u -> w, costing
+d(u, v) + d(v, w), wherever no path avoiding v (a witness) is as cheap.
+Every edge then leads either up or down the resulting order, and a
+shortest path is always an upward path from the start that meets a
+reversed upward path from the goal, so queries only search a small part of
+the graph in both directions.
+
+Edges keep their direction throughout, so the asymmetric Tobler costs of
+going up and down hill are respected.
+'''
+from heapq import heapify, heappush, heappop
+import random
+
+import numpy as np
+
+import astar
+import cache
+
+
+class ContractionHierarchy:
+    '''
+    The upward edges of a contracted graph. up_* describe edges u -> w with
+    rank[w] > rank[u], stored at u. down_* describe edges w -> u with
+    rank[w] > rank[u], stored at u, for searching backward from the goal.
+    middle is the contracted node a shortcut skips, or -1 for an edge of
+    the original graph.
+    '''
+
+    def __init__(self, ids, rank, up, down):
+        self.ids = list(ids)
+        self.index = {nid: i for i, nid in enumerate(self.ids)}
+        self.rank = np.asarray(rank, dtype=np.int64)
+        self.up = tuple(np.asarray(a) for a in up)
+        self.down = tuple(np.asarray(a) for a in down)
+        self._lists = None
+        self._middle = None
+
+    @classmethod
+    def build(cls, graph, weights, witness_settled=1000):
+        '''
+        Contract a CSRGraph with edge weights. Witness searches give up
+        after settling witness_settled nodes, which can only add
+        unnecessary shortcuts, never wrong ones.
+        '''
+        n = len(graph)
+        offsets, targets = graph.adjacency()
+        inf = float('inf')
+
+        out = [{} for _ in range(n)]
+        inn = [{} for _ in range(n)]
+        for u in range(n):
+            for e in range(offsets[u], offsets[u + 1]):
+                w = targets[e]
+                if w != u and weights[e] < out[u].get(w, inf):
+                    out[u][w] = weights[e]
+                    inn[w][u] = weights[e]
+
+        middle = {}
+        depth = [0] * n
+        rank = [0] * n
+        up = [[] for _ in range(n)]
+        down = [[] for _ in range(n)]
+
+        def witness_costs(source, avoid, limit, wanted):
+            # costs from source avoiding one node, up to limit or until every
+            # wanted node is settled
+            dist = {source: 0}
+            frontier = [(0, source)]
+            settled = 0
+            remaining = len(wanted)
+            while frontier and settled < witness_settled and remaining:
+                (cost, node) = heappop(frontier)
+                if cost > dist[node]:
+                    continue
+                if cost > limit:
+                    break
+                settled += 1
+                if node in wanted:
+                    remaining -= 1
+                for succ, c in out[node].items():
+                    new_cost = cost + c
+                    if succ != avoid and new_cost < dist.get(succ, inf):
+                        dist[succ] = new_cost
+                        heappush(frontier, (new_cost, succ))
+            return dist
+
+        def shortcuts(v):
+            result = []
+            for u, cu in inn[v].items():
+                wanted = {w: cu + cw for w, cw in out[v].items() if w != u}
+                if not wanted:
+                    continue
+                dist = witness_costs(u, v, max(wanted.values()), wanted)
+                for w, c in wanted.items():
+                    if dist.get(w, inf) > c:
+                        result.append((u, w, c))
+            return result
+
+        def priority(v):
+            return 2*len(shortcuts(v)) - len(inn[v]) - len(out[v]) + depth[v]
+
+        current = [priority(v) for v in range(n)]
+        queue = [(p, v) for v, p in enumerate(current)]
+        heapify(queue)
+        contracted = [False] * n
+        order = 0
+        while queue:
+            (prio, v) = heappop(queue)
+            # priorities only change when a neighbour is contracted, and are
+            # recomputed then, so anything else in the queue is stale
+            if contracted[v] or prio != current[v]:
+                continue
+
+            for (u, w, c) in shortcuts(v):
+                if c < out[u].get(w, inf):
+                    out[u][w] = c
+                    inn[w][u] = c
+                    middle[(u, w)] = v
+
+            rank[v] = order
+            order += 1
+            for w, c in out[v].items():
+                up[v].append((w, c, middle.get((v, w), -1)))
+                del inn[w][v]
+                depth[w] += 1
+            for u, c in inn[v].items():
+                down[v].append((u, c, middle.get((u, v), -1)))
+                del out[u][v]
+                depth[u] += 1
+            neighbours = set(out[v]) | set(inn[v])
+            out[v] = {}
+            inn[v] = {}
+            contracted[v] = True
+            for x in neighbours:
+                current[x] = priority(x)
+                heappush(queue, (current[x], x))
+
+        return cls(graph.ids, rank, _flatten(up), _flatten(down))
+
+    def save(self, path, fingerprint):
+        '''Save to path, tagged with the fingerprint of the graph it was built from.'''
+        arrays = {'ids': np.array(self.ids, dtype=np.int64), 'rank': self.rank}
+        for prefix, parts in (('up', self.up), ('down', self.down)):
+            for name, arr in zip(('offsets', 'targets', 'weights', 'middle'), parts):
+                arrays[prefix + '_' + name] = arr
+        cache.save_arrays(path, arrays, {'kind': 'ch', 'fingerprint': fingerprint})
+
+    @classmethod
+    def load(cls, path, fingerprint=None):
+        '''Load from path, or return None if missing or built from another graph.'''
+        loaded = cache.load_arrays(path)
+        if loaded is None:
+            return None
+        meta, arrays = loaded
+        if meta.get('kind') != 'ch' or (fingerprint is not None and meta.get('fingerprint') != fingerprint):
+            return None
+        parts = [tuple(arrays[prefix + '_' + name] for name in ('offsets', 'targets', 'weights', 'middle'))
+                 for prefix in ('up', 'down')]
+        return cls(arrays['ids'].tolist(), arrays['rank'], parts[0], parts[1])
+
+    def lists(self):
+        if self._lists is None:
+            self._lists = tuple(tuple(a.tolist() for a in part) for part in (self.up, self.down))
+        return self._lists
+
+    def query(self, start, goal, stats=None):
+        '''
+        Return (path of node indices, path_cost) from start to goal, with
+        shortcuts unpacked into the original edges, or None.
+        '''
+        if start == goal:
+            return ([start], 0)
+
+        inf = float('inf')
+        searches = self.lists()
+        dist = ({start: 0}, {goal: 0})
+        parent = ({}, {})
+        frontiers = ([(0, start)], [(0, goal)])
+        best, meeting = inf, None
+        expanded = 0
+
+        while frontiers[0] or frontiers[1]:
+            side = 0 if frontiers[0] and (not frontiers[1] or frontiers[0][0][0] <= frontiers[1][0][0]) else 1
+            (cost, node) = heappop(frontiers[side])
+            if cost >= best:
+                frontiers[side].clear()
+                continue
+            if cost > dist[side][node]:
+                continue
+            expanded += 1
+
+            offsets, targets, weights, _ = searches[side]
+            this_dist, other_dist = dist[side], dist[1 - side]
+            if node in other_dist and cost + other_dist[node] < best:
+                best, meeting = cost + other_dist[node], node
+            for e in range(offsets[node], offsets[node + 1]):
+                succ = targets[e]
+                new_cost = cost + weights[e]
+                if new_cost < this_dist.get(succ, inf):
+                    this_dist[succ] = new_cost
+                    parent[side][succ] = node
+                    heappush(frontiers[side], (new_cost, succ))
+                    if succ in other_dist and new_cost + other_dist[succ] < best:
+                        best, meeting = new_cost + other_dist[succ], succ
+
+        if stats is not None:
+            stats['expanded'] = expanded
+        if meeting is None:
+            return None
+
+        path = [meeting]
+        while path[-1] != start:
+            path.append(parent[0][path[-1]])
+        path.reverse()
+        while path[-1] != goal:
+            path.append(parent[1][path[-1]])
+        return (self.unpack(path), best)
+
+    def route(self, start, goal):
+        '''query() taking and returning node ids.'''
+        if start not in self.index or goal not in self.index:
+            return None
+        result = self.query(self.index[start], self.index[goal])
+        if result is None:
+            return None
+        return ([self.ids[i] for i in result[0]], result[1])
+
+    def unpack(self, path):
+        '''Replace every shortcut along a path of node indices by the nodes it skips.'''
+        if self._middle is None:
+            self._middle = {}
+            (uo, ut, _, um), (do, ds, _, dm) = self.lists()
+            for u in range(len(self.ids)):
+                for e in range(uo[u], uo[u + 1]):
+                    self._middle[(u, ut[e])] = um[e]
+                for e in range(do[u], do[u + 1]):
+                    self._middle[(ds[e], u)] = dm[e]
+
+        result = [path[0]]
+        stack = [(a, b) for a, b in zip(path[::-1][1:], path[::-1])]
+        while stack:
+            (a, b) = stack.pop()
+            m = self._middle[(a, b)]
+            if m == -1:
+                result.append(b)
+            else:
+                stack.append((m, b))
+                stack.append((a, m))
+        return result
+
+
+def _flatten(adjacency):
+    offsets = np.zeros(len(adjacency) + 1, dtype=np.int64)
+    np.cumsum([len(edges) for edges in adjacency], out=offsets[1:])
+    edges = [edge for edges in adjacency for edge in edges]
+    targets = np.array([e[0] for e in edges], dtype=np.int64)
+    weights = np.array([e[1] for e in edges], dtype=np.float64)
+    middle = np.array([e[2] for e in edges], dtype=np.int64)
+    return (offsets, targets, weights, middle)
+
+
+def check_against_astar(graph, weights, hierarchy, count=100, seed=0, rel_tol=1e-9):
+    '''
+    Route count random pairs with both the hierarchy and plain A* and
+    return the pairs where the costs disagree (an empty list is good).
+    '''
+    r = random.Random(seed)
+    weights = list(weights)
+    mismatches = []
+    for _ in range(count):
+        s, t = r.randrange(len(graph)), r.randrange(len(graph))
+        expected = astar.astar_csr(graph, weights, astar.heuristic_values(graph, astar.toblers_heuristic, t), s, t)
+        got = hierarchy.query(s, t)
+        if (expected is None) != (got is None):
+            mismatches.append((s, t))
+        elif expected is not None and abs(expected[1] - got[1]) > rel_tol * max(1, expected[1]):
+            mismatches.append((s, t))
+    return mismatches
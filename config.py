@@ -1,4 +1,18 @@
-
 osm_path = 'data/dbv.osm'
-elev_path = 'data/N42E018.HGT'
+# either a single N42E018 tile or a directory of SRTM tiles
+elev_path = 'data'
 walk_data_path = 'data/walk.txt'
+# walks from walk_data_path already routed on the map
+walk_cache_path = 'data/walk.cache'
+# walks added through the route server, summed up for the linear model
+added_walks_path = 'data/added_walks.stats'
+cache_path = 'data/dbv.cache'
+ch_path = 'data/dbv.ch'
+# the ALT landmarks of the map (run.py --landmarks)
+landmarks_path = 'data/dbv.landmarks'
+# the map with its chains of degree-2 nodes collapsed (run.py --chains)
+chains_path = 'data/dbv.chains'
+# the map split into square cells tile_size meters wide, for loading only
+# the cells a query needs (run.py --tiles)
+tiles_path = 'data/tiles'
+tile_size = 1000.0
@@ -0,0 +1,124 @@
+'''
+A compiled, array based form of the node digraph.
+
+Nodes are numbered 0..n-1 and the successors of node i are
+targets[offsets[i]:offsets[i + 1]] (compressed sparse row form). Edge e is
+the e-th entry of targets, so per-edge quantities such as travel times are
+plain arrays indexed the same way.
+'''
+import hashlib
+
+import numpy as np
+
+
+class CSRGraph:
+    def __init__(self, ids, xyz, offsets, targets):
+        self.ids = list(ids)
+        self.index = {nid: i for i, nid in enumerate(self.ids)}
+        xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        self.x = xyz[:, 0]
+        self.y = xyz[:, 1]
+        self.z = xyz[:, 2]
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self._adjacency = None
+        self._reverse_adjacency = None
+        self._cached = {}
+
+    @classmethod
+    def from_digraph(cls, id_digraph, id_to_data):
+        '''
+        Compile a digraph of node ids and its map of node ids to NodeDatas.
+        Successor order is kept. Nodes missing from id_to_data get nan
+        coordinates.
+        '''
+        ids = list(id_digraph)
+        seen = set(ids)
+        for successors in id_digraph.values():
+            for nid in successors:
+                if nid not in seen:
+                    seen.add(nid)
+                    ids.append(nid)
+        index = {nid: i for i, nid in enumerate(ids)}
+
+        nan = (np.nan, np.nan, np.nan)
+        xyz = [id_to_data.get(nid, nan) for nid in ids]
+
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        targets = []
+        for i, nid in enumerate(ids):
+            targets.extend(index[s] for s in id_digraph.get(nid, ()))
+            offsets[i + 1] = len(targets)
+
+        return cls(ids, xyz, offsets, targets)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        '''Build from the ids, xyz, offsets and targets arrays of a map cache.'''
+        return cls(arrays['ids'].tolist(), arrays['xyz'], arrays['offsets'], arrays['targets'])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def num_edges(self):
+        return len(self.targets)
+
+    def edge_sources(self):
+        '''The source node of every edge.'''
+        return np.repeat(np.arange(len(self.ids)), np.diff(self.offsets))
+
+    def edge_features(self):
+        '''Return (xy distance, elevation change) arrays over all edges.'''
+        src = self.edge_sources()
+        dst = self.targets
+        dist = np.sqrt((self.x[dst] - self.x[src])**2 + (self.y[dst] - self.y[src])**2)
+        return (dist, self.z[dst] - self.z[src])
+
+    def reverse(self):
+        '''
+        Return the incoming edges as (offsets, sources, edges) arrays: the
+        edges into node i are edges[offsets[i]:offsets[i + 1]] and
+        sources[j] is where edges[j] comes from.
+        '''
+        edges = np.argsort(self.targets, kind='stable')
+        counts = np.bincount(self.targets, minlength=len(self.ids))
+        offsets = np.zeros(len(self.ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return (offsets, self.edge_sources()[edges], edges)
+
+    def adjacency(self):
+        '''
+        Return (offsets, targets) as python lists, which are a lot quicker to
+        index one element at a time than numpy arrays.
+        '''
+        if self._adjacency is None:
+            self._adjacency = (self.offsets.tolist(), self.targets.tolist())
+        return self._adjacency
+
+    def reverse_adjacency(self):
+        '''reverse() as python lists, computed once.'''
+        if self._reverse_adjacency is None:
+            self._reverse_adjacency = tuple(a.tolist() for a in self.reverse())
+        return self._reverse_adjacency
+
+    def cached(self, key, make):
+        '''
+        Return make(), calling it only the first time key is asked for on
+        this graph. For things derived from the graph, such as its edge
+        weights under some cost function.
+        '''
+        if key not in self._cached:
+            self._cached[key] = make()
+        return self._cached[key]
+
+    def fingerprint(self):
+        '''A hex digest identifying the graph's nodes, coordinates and edges.'''
+        h = hashlib.sha1()
+        h.update(repr(self.ids).encode('utf-8'))
+        for arr in (self.x, self.y, self.z, self.offsets, self.targets):
+            h.update(np.ascontiguousarray(arr).tobytes())
+        return h.hexdigest()
+
+    def path_ids(self, path):
+        '''Translate a path of node indices back to node ids.'''
+        return [self.ids[i] for i in path]
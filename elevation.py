@@ -0,0 +1,122 @@
+'''
+Elevations from a directory of SRTM .HGT tiles.
+
+Each tile covers one degree square and is named after its south west corner,
+e.g. N42E018.HGT covers 42-43N 18-19E. Rows run north to south and columns
+west to east, and neighbouring tiles share their edge rows and columns, so a
+point can always be interpolated from within the one tile that holds it.
+'''
+from collections import OrderedDict
+import math
+import os
+
+import numpy as np
+
+
+def tile_name(lat0, lon0):
+    '''The file name of the tile whose south west corner is (lat0, lon0).'''
+    return '{}{:02d}{}{:03d}.HGT'.format(
+        'N' if lat0 >= 0 else 'S', abs(lat0),
+        'E' if lon0 >= 0 else 'W', abs(lon0))
+
+
+class ElevationProvider:
+    '''
+    Look up elevations in the tiles found in a directory. Tiles are memory
+    mapped the first time they are needed and at most max_open of them are
+    kept mapped, least recently used first out. Points in tiles that don't
+    exist (the sea, usually) get the elevation missing, but see
+    check_coverage.
+    '''
+
+    def __init__(self, directory, max_open=4, missing=0.0):
+        self.directory = directory
+        self.max_open = max_open
+        self.missing = missing
+        self.paths = {}
+        for fname in os.listdir(directory):
+            if fname.upper().endswith('.HGT'):
+                self.paths[fname.upper()] = os.path.join(directory, fname)
+        self.tiles = OrderedDict()
+
+    def tile(self, lat0, lon0):
+        '''Return the mapped tile at (lat0, lon0) as a square array, or None.'''
+        key = (lat0, lon0)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        path = self.paths.get(tile_name(lat0, lon0))
+        if path is None:
+            return None
+
+        size = math.isqrt(os.path.getsize(path) // 2)
+        if 2 * size * size != os.path.getsize(path):
+            raise IOError('{} is not a square tile of shorts'.format(path))
+
+        tile = np.memmap(path, dtype='>i2', mode='r', shape=(size, size))
+        self.tiles[key] = tile
+        while len(self.tiles) > self.max_open:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def check_coverage(self, lats, lons):
+        '''
+        Raise IOError if there is no tile for any part of the bounding box
+        of the latitudes and longitudes. A map with no elevations at all is
+        a missing or wrong directory rather than one out at sea.
+        '''
+        if len(lats) == 0:
+            return
+        lat_range = range(math.floor(np.min(lats)), math.floor(np.max(lats)) + 1)
+        lon_range = range(math.floor(np.min(lons)), math.floor(np.max(lons)) + 1)
+        if not any(tile_name(lat0, lon0) in self.paths for lat0 in lat_range for lon0 in lon_range):
+            raise IOError('No elevation tile in "{}" covers {:.3f}..{:.3f}N {:.3f}..{:.3f}E.'.format(
+                self.directory, np.min(lats), np.max(lats), np.min(lons), np.max(lons)))
+
+    def elevations(self, lats, lons):
+        '''
+        Return an array of bilinearly interpolated elevations for the arrays
+        of latitudes and longitudes.
+        '''
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        result = np.full(lats.shape, self.missing, dtype=np.float64)
+
+        lat0s = np.floor(lats).astype(np.int64)
+        lon0s = np.floor(lons).astype(np.int64)
+        keys, inverse = np.unique(np.stack([lat0s.ravel(), lon0s.ravel()], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(lats.shape)
+
+        for k, (lat0, lon0) in enumerate(keys.tolist()):
+            tile = self.tile(lat0, lon0)
+            if tile is None:
+                continue
+            mask = inverse == k
+            result[mask] = interpolate(tile, lat0, lon0, lats[mask], lons[mask])
+
+        return result
+
+    def elevation(self, lat, lon):
+        return float(self.elevations([lat], [lon])[0])
+
+
+def interpolate(tile, lat0, lon0, lats, lons):
+    '''Bilinearly interpolate the tile with south west corner (lat0, lon0).'''
+    last = tile.shape[0] - 1
+    rows = np.clip((lat0 + 1 - lats) * last, 0, last)
+    cols = np.clip((lons - lon0) * last, 0, last)
+
+    r1 = np.floor(rows).astype(np.intp)
+    c1 = np.floor(cols).astype(np.intp)
+    r2 = np.minimum(r1 + 1, last)
+    c2 = np.minimum(c1 + 1, last)
+    fr = rows - r1
+    fc = cols - c1
+
+    def at(r, c):
+        return tile[r, c].astype(np.float64)
+
+    top = fc*at(r1, c2) + (1 - fc)*at(r1, c1)
+    bottom = fc*at(r2, c2) + (1 - fc)*at(r2, c1)
+    return fr*bottom + (1 - fr)*top
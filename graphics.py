@@ -1,3 +1,6 @@
+from collections import defaultdict
+import math
+
 try:
     from Tkinter import *
 except:
@@ -20,27 +23,112 @@ def norm(x_m, y_m):
 
 
 def create_lines(id_digraph, id_to_data):
-    visited = set()
-    lines = []
+    """
+    Return the streets as polylines of normalized points. Chains of nodes
+    with exactly two neighbours are merged into one polyline, so a curving
+    street is one canvas item rather than dozens.
+    """
+    neighbours = defaultdict(set)
     for source in id_digraph:
-        visited.add(source)
+        if source not in id_to_data:
+            continue
         for dest in id_digraph[source]:
-            if not dest in visited:
-                s = id_to_data[source]
-                d = id_to_data[dest]
+            if dest != source and dest in id_to_data:
+                neighbours[source].add(dest)
+                neighbours[dest].add(source)
+
+    def point(nid):
+        nd = id_to_data[nid]
+        return norm(nd.x_m, nd.y_m)
+
+    visited = set()
+    lines = []
 
-                line = { norm(s.x_m, s.y_m), norm(d.x_m, d.y_m) }
-                if len(line) == 2:
-                    lines.append(line)
+    def walk(start, nxt):
+        chain = [start, nxt]
+        visited.add((min(start, nxt), max(start, nxt)))
+        while len(neighbours[chain[-1]]) == 2 and chain[-1] != start:
+            prev, cur = chain[-2], chain[-1]
+            nxt = next(n for n in neighbours[cur] if n != prev)
+            edge = (min(cur, nxt), max(cur, nxt))
+            if edge in visited:
+                break
+            visited.add(edge)
+            chain.append(nxt)
+        lines.append([point(nid) for nid in chain])
+
+    ends = [nid for nid in neighbours if len(neighbours[nid]) != 2]
+    # then whatever is left over is loops of degree two nodes
+    for nid in ends + list(neighbours):
+        for nxt in neighbours[nid]:
+            if (min(nid, nxt), max(nid, nxt)) not in visited:
+                walk(nid, nxt)
 
     return lines
 
 
+def simplify(line, tolerance):
+    """
+    Drop the points of a polyline closer than tolerance to the last point
+    kept, keeping both ends. Return None if the whole line is that small.
+    """
+    (px, py) = line[0]
+    kept = [line[0]]
+    for (x, y) in line[1:-1]:
+        if abs(x - px) >= tolerance or abs(y - py) >= tolerance:
+            kept.append((x, y))
+            (px, py) = (x, y)
+    (x, y) = line[-1]
+    if len(kept) == 1 and abs(x - px) < tolerance and abs(y - py) < tolerance:
+        return None
+    kept.append(line[-1])
+    return kept
+
+
+class LineGrid:
+    """A uniform grid over the unit square of the polylines passing through each cell"""
+
+    def __init__(self, lines, cells=64):
+        self.cells = cells
+        self.grid = defaultdict(list)
+        for i, line in enumerate(lines):
+            xs = [x for (x, _) in line]
+            ys = [y for (_, y) in line]
+            (c0, r0) = self.cell(min(xs), min(ys))
+            (c1, r1) = self.cell(max(xs), max(ys))
+            for c in range(c0, c1 + 1):
+                for r in range(r0, r1 + 1):
+                    self.grid[(c, r)].append(i)
+
+    def cell(self, x, y):
+        n = self.cells
+        return (max(0, min(n - 1, int(x * n))), max(0, min(n - 1, int(y * n))))
+
+    def query(self, x0, y0, x1, y1):
+        """The indices of the lines that may cross the box, in order"""
+        (c0, r0) = self.cell(x0, y0)
+        (c1, r1) = self.cell(x1, y1)
+        found = set()
+        for c in range(c0, c1 + 1):
+            for r in range(r0, r1 + 1):
+                found.update(self.grid.get((c, r), ()))
+        return sorted(found)
+
+
 class MyWin(Frame):
     '''
     Here is a Tkinter window with a canvas, a button, and a text label
+
+    Zooming rescales what is already drawn on the canvas straight away. A
+    moment later the streets are redrawn, but only those near the visible
+    area and with points closer together than a pixel dropped.
     ''' 
 
+    # how far past the visible area to draw, as a fraction of its size
+    MARGIN = 0.5
+    # milliseconds to wait after zooming or panning before redrawing
+    DELAY = 100
+
     def __init__(self, master, id_digraph, id_to_data, path, cost):
         self.id_to_data = id_to_data
         self.path = path
@@ -48,6 +136,8 @@ class MyWin(Frame):
         self.last_x = 0
         self.last_y = 0
         self.scale = 1
+        self.drawn = None # (x0, y0, x1, y1, level) of what is on the canvas
+        self.pending = None
 
         thewin = Frame(master)
         self.master = master
@@ -70,10 +160,16 @@ class MyWin(Frame):
         self.canvas = w
          
         self.lines = create_lines(id_digraph, id_to_data)
+        self.grid = LineGrid(self.lines)
+        self.simplified = {} # level -> {line index: simplified line or None}
 
         pathdata = [id_to_data[nd_id] for nd_id in path]
         self.path = [norm(nd.x_m, nd.y_m) for nd in pathdata]
 
+        paths2 = [(WINWIDTH*lon, WINHEIGHT*lat) for (lon, lat) in self.path]
+        if len(paths2) > 1:
+            self.canvas.create_line(*paths2, fill='red', tags='path')
+
         self.update_lines()
 
         w.pack(fill=BOTH)
@@ -81,25 +177,52 @@ class MyWin(Frame):
         thewin.pack()
 
 
-    def update_lines(self):
-        self.canvas.delete("all")
-
-        wd = WINWIDTH
-        h = WINHEIGHT
-        s = self.scale
-        for (lon1, lat1), (lon2, lat2) in self.lines:
-            self.canvas.create_line(s*wd*lon1, s*h*lat1, s*wd*lon2, s*h*lat2, fill='grey')
-
-        '''
-        for i in range(0, 3601):
-            self.canvas.create_line(s*wd*float(i)/3600, 0, s*wd*float(i)/3600, 1*s*h)
+    def viewport(self):
+        """The visible area as (x0, y0, x1, y1) in normalized coordinates"""
+        c = self.canvas
+        width = c.winfo_width() if c.winfo_width() > 1 else WINWIDTH
+        height = c.winfo_height() if c.winfo_height() > 1 else WINHEIGHT
+        return (c.canvasx(0) / (self.scale*WINWIDTH), c.canvasy(0) / (self.scale*WINHEIGHT),
+                c.canvasx(width) / (self.scale*WINWIDTH), c.canvasy(height) / (self.scale*WINHEIGHT))
 
-        for i in range(0, 3601):
-            self.canvas.create_line(0, s*h*float(i)/3600, 1*s*wd, s*wd*float(i)/3600)
-        '''
 
-        paths2 = [(s*wd*lon, s*h*lat) for (lon, lat) in self.path]
-        self.canvas.create_line(*paths2, fill='red')
+    def update_lines(self):
+        """Redraw the streets around the visible area at the current zoom"""
+        self.pending = None
+        (x0, y0, x1, y1) = self.viewport()
+        dx = (x1 - x0) * self.MARGIN
+        dy = (y1 - y0) * self.MARGIN
+        (x0, y0, x1, y1) = (x0 - dx, y0 - dy, x1 + dx, y1 + dy)
+
+        # the tolerance is under a pixel anywhere in [2**level, 2**(level+1))
+        level = math.floor(math.log2(self.scale))
+        tolerance = 2.0**-level / max(WINWIDTH, WINHEIGHT)
+        simplified = self.simplified.setdefault(level, {})
+
+        self.canvas.delete('street')
+        wd = WINWIDTH * self.scale
+        h = WINHEIGHT * self.scale
+        for i in self.grid.query(x0, y0, x1, y1):
+            if i not in simplified:
+                simplified[i] = simplify(self.lines[i], tolerance)
+            line = simplified[i]
+            if line is not None:
+                self.canvas.create_line(*[(wd*lon, h*lat) for (lon, lat) in line], fill='grey', tags='street')
+
+        self.canvas.tag_raise('path')
+        self.drawn = (x0, y0, x1, y1, level)
+
+
+    def refresh(self):
+        """Redraw soon if the visible area isn't covered at the current zoom"""
+        if self.drawn is not None:
+            (x0, y0, x1, y1) = self.viewport()
+            (dx0, dy0, dx1, dy1, level) = self.drawn
+            if level == math.floor(math.log2(self.scale)) and dx0 <= x0 and dy0 <= y0 and x1 <= dx1 and y1 <= dy1:
+                return
+        if self.pending is not None:
+            self.canvas.after_cancel(self.pending)
+        self.pending = self.canvas.after(self.DELAY, self.update_lines)
 
 
     def shift(self, dx, dy):
@@ -107,18 +230,23 @@ class MyWin(Frame):
         self.canvas.yview('scroll', int(dy), 'units')
         
 
+    def zoom(self, factor):
+        self.scale *= factor
+        self.canvas.scale('all', 0, 0, factor, factor)
+
+
     def zoom_in(self, event):
-        self.scale *= 1.1
-        self.update_lines()
+        self.zoom(1.1)
         x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
         self.shift(x*.1, y*.1)
+        self.refresh()
 
 
     def zoom_out(self, event):
-        self.scale /= 1.1
-        self.update_lines()
+        self.zoom(1/1.1)
         x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
         self.shift(-x*(1-1/1.1), -y*(1-1/1.1))
+        self.refresh()
 
 
     def click(self, event):
@@ -130,6 +258,7 @@ class MyWin(Frame):
         self.shift(self.last_x - event.x, self.last_y - event.y)
         self.last_x = event.x
         self.last_y = event.y
+        self.refresh()
 
 
 def display(graph, data, path, cost):
@@ -0,0 +1,68 @@
+'''
+Isochrones: how long it takes to walk to every node from a starting point
+(or the nearest of several), within a time budget.
+
+One budgeted Dijkstra sweep answers for every node at once, instead of a
+search per candidate node.
+'''
+import json
+
+import numpy as np
+
+import astar
+
+
+def travel_times(graph, weights, sources, budget=float('inf')):
+    '''
+    The cost of getting from the nearest of sources (node indices of a
+    CSRGraph) to every node, as an array, with inf for nodes that can't be
+    reached within budget. Every weight must be non-negative: the search
+    settles nodes in order of cost and stops at budget, which a later
+    negative edge could undercut.
+    '''
+    offsets, targets = graph.adjacency()
+    if len(weights) and min(weights) < 0:
+        raise ValueError('travel times need non-negative edge weights')
+    if not isinstance(weights, list):
+        weights = np.asarray(weights, dtype=np.float64).tolist()
+    return np.array(astar.dijkstra(offsets, targets, weights, list(sources), budget))
+
+
+def reachable_edges(graph, weights, times, budget=float('inf')):
+    '''
+    The indices of the edges that can be walked end to end within budget,
+    given the travel times to every node.
+    '''
+    arrive = times[graph.edge_sources()] + np.asarray(weights, dtype=np.float64)
+    return np.flatnonzero(arrive <= budget)
+
+
+def edges_geojson(graph, edges, times, m_per_lat, m_per_lon):
+    '''
+    A GeoJSON FeatureCollection of the given edges as lines, each with the
+    node ids at its ends and the travel time to its start.
+    '''
+    sources = graph.edge_sources()[edges].tolist()
+    targets = graph.targets[edges].tolist()
+    lons = (graph.x / m_per_lon).tolist()
+    lats = (graph.y / m_per_lat).tolist()
+    features = []
+    for s, t in zip(sources, targets):
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': [[lons[s], lats[s]], [lons[t], lats[t]]]},
+            'properties': {'from': graph.ids[s], 'to': graph.ids[t], 'minutes': float(times[s])},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def write_times(path, graph, times):
+    '''Write "node id,minutes" lines for every node reached.'''
+    with open(path, 'w') as f:
+        for i in np.flatnonzero(np.isfinite(times)).tolist():
+            f.write('{},{:.4f}\n'.format(graph.ids[i], times[i]))
+
+
+def write_geojson(path, collection):
+    with open(path, 'w') as f:
+        json.dump(collection, f)
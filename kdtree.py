@@ -0,0 +1,76 @@
+'''
+A k-d tree for nearest neighbour lookups among a fixed set of points.
+'''
+import numpy as np
+
+
+class KDTree:
+    '''
+    Built over an (n, k) array of points. Leaves hold up to leaf_size
+    point indices; internal nodes split on the widest dimension at the
+    median.
+    '''
+
+    def __init__(self, points, leaf_size=8):
+        self.points = np.asarray(points, dtype=np.float64).reshape(len(points), -1)
+        self.leaf_size = leaf_size
+        self._coords = self.points.tolist()
+        # node i is (dim, split, left, right) or (None, indices, None, None)
+        self.nodes = []
+        if len(self.points):
+            self._build(np.arange(len(self.points)))
+
+    def _build(self, indices):
+        node = len(self.nodes)
+        self.nodes.append(None)
+        if len(indices) <= self.leaf_size:
+            self.nodes[node] = (None, indices.tolist(), None, None)
+            return node
+
+        pts = self.points[indices]
+        dim = int(np.argmax(pts.max(axis=0) - pts.min(axis=0)))
+        order = np.argsort(pts[:, dim], kind='stable')
+        half = len(indices) // 2
+        split = float(pts[order[half], dim])
+        left = self._build(indices[order[:half]])
+        right = self._build(indices[order[half:]])
+        self.nodes[node] = (dim, split, left, right)
+        return node
+
+    def nearest(self, q, key=None):
+        '''
+        Return the index of the point nearest to q, or None if the tree is
+        empty.
+
+        key(i) may give a tuple to minimise instead of the distance to point
+        i, to control ties or use a slightly different distance formula. Its
+        first element must be the distance from q to point i; subtrees are
+        only skipped when they lie strictly farther away than the best so
+        far, so every point at the best distance is considered.
+        '''
+        if not self.nodes:
+            return None
+        q = [float(v) for v in q]
+        coords = self._coords
+        if key is None:
+            def key(i):
+                return (sum((a - b)**2 for a, b in zip(coords[i], q)) ** .5, i)
+
+        best, best_key = None, None
+        stack = [(0, 0.0)]
+        while stack:
+            (node, bound) = stack.pop()
+            if best_key is not None and bound > best_key[0] * (1 + 1e-12):
+                continue
+            dim, split, left, right = self.nodes[node]
+            if dim is None:
+                for i in split:
+                    k = key(i)
+                    if best_key is None or k < best_key:
+                        best, best_key = i, k
+                continue
+            diff = q[dim] - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, max(bound, abs(diff))))
+            stack.append((near, bound))
+        return best
@@ -0,0 +1,183 @@
+'''
+Resolving query endpoints to nodes of the map.
+
+An endpoint may be a node ID, a street name, or a position. Street names
+are matched ignoring case and accents ("Ulica Od Puča" matches "ulica od
+puca"), then by prefix, then fuzzily, so "stradu" and "stradnu" both find
+Stradun. Positions are snapped to the nearest routable node with a k-d tree
+over the node coordinates. Resolver holds these rules for Lookup and for
+tiles.TiledMap, so a query resolves the same whichever way the map is loaded.
+'''
+from bisect import bisect_left
+import difflib
+import functools
+import re
+import unicodedata
+
+import numpy as np
+
+from kdtree import KDTree
+
+
+latlon_pattern = re.compile(r'^\s*(-?\d+(?:\.\d*)?)\s*,\s*(-?\d+(?:\.\d*)?)\s*$')
+
+
+def normalize(name):
+    '''Lowercase a name and strip its accents and surrounding whitespace.'''
+    decomposed = unicodedata.normalize('NFKD', str(name).strip().lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).replace('đ', 'd')
+
+
+class StreetNames:
+    '''
+    Matches queries against way names. The fuzzy matches of the last
+    fuzzy_cache misspellings looked up are remembered.
+    '''
+
+    def __init__(self, names, fuzzy_cache=1024):
+        # normalized name -> way names, in a sorted list for prefix searches
+        self.names = {}
+        for name in names:
+            self.names.setdefault(normalize(name), []).append(name)
+        self.keys = sorted(self.names)
+        self._fuzzy = functools.lru_cache(maxsize=fuzzy_cache)(self._closest)
+
+    def street(self, query):
+        '''
+        The way name best matching query: an exact match, else the shortest
+        name starting with it, else the closest by spelling, else None.
+        '''
+        key = normalize(query)
+        if not key:
+            return None
+        if key not in self.names:
+            prefixed = self.prefixed(key)
+            if prefixed:
+                key = min(prefixed, key=lambda k: (len(k), k))
+            else:
+                key = self.fuzzy(key)
+                if key is None:
+                    return None
+        return min(self.names[key])
+
+    def prefixed(self, prefix, limit=None):
+        '''The normalized names starting with prefix, in order.'''
+        prefix = normalize(prefix)
+        found = []
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            found.append(self.keys[i])
+            if limit is not None and len(found) >= limit:
+                break
+            i += 1
+        return found
+
+    def fuzzy(self, key, cutoff=0.75):
+        '''The normalized name closest in spelling to key, or None.'''
+        return self._fuzzy(key, cutoff)
+
+    def _closest(self, key, cutoff):
+        close = difflib.get_close_matches(key, self.keys, n=1, cutoff=cutoff)
+        return close[0] if close else None
+
+
+class Resolver(StreetNames):
+    '''
+    Resolves endpoints to routable nodes. Subclasses provide
+    is_routable(nid), street_node(name) and nearest(x, y), and set
+    m_per_lat and m_per_lon to convert degrees to x/y meters.
+    '''
+
+    def resolve(self, query):
+        '''
+        Return the node id for a node ID, street name, "lat,lon" string or
+        (lat, lon) pair, or None if it doesn't match anything routable.
+        '''
+        if isinstance(query, (list, tuple)):
+            if len(query) != 2:
+                return None
+            try:
+                return self.nearest_latlon(float(query[0]), float(query[1]))
+            except (TypeError, ValueError):
+                return None
+        if query is None:
+            return None
+
+        query = str(query)
+        try:
+            node = int(query)
+            if self.is_routable(node):
+                return node
+        except ValueError:
+            pass
+
+        match = latlon_pattern.match(query)
+        if match:
+            return self.nearest_latlon(float(match.group(1)), float(match.group(2)))
+
+        name = self.street(query)
+        if name is None:
+            return None
+        return self.street_node(name)
+
+    def nearest_latlon(self, lat, lon):
+        '''The routable node nearest to a latitude and longitude.'''
+        if not (np.isfinite(lat) and np.isfinite(lon)):
+            return None
+        return self.nearest(lon * self.m_per_lon, lat * self.m_per_lat)
+
+
+class Lookup(Resolver):
+    '''
+    Resolves endpoints against a (graph, ways, data) map. A node is
+    routable if it has edges leaving it and known coordinates; names and
+    positions only ever resolve to routable nodes. m_per_lat and m_per_lon
+    convert degrees to the x/y meters of the node data. The fuzzy matches
+    of the last fuzzy_cache misspellings looked up are remembered. The k-d
+    tree for positions is only built once the first one is looked up.
+    '''
+
+    def __init__(self, graph, ways, data, m_per_lat, m_per_lon, fuzzy_cache=1024):
+        routable = [nid for nid, succ in graph.items() if succ and nid in data]
+        points = [(data[nid].x_m, data[nid].y_m) for nid in routable]
+        self._setup(routable, points, ways, m_per_lat, m_per_lon, fuzzy_cache)
+
+    @classmethod
+    def from_compiled(cls, compiled, ways, m_per_lat, m_per_lon, fuzzy_cache=1024):
+        '''The same Lookup built from a csr.CSRGraph instead of the dicts.'''
+        keep = (np.diff(compiled.offsets) > 0) & ~np.isnan(compiled.x) & ~np.isnan(compiled.y)
+        places = cls.__new__(cls)
+        places._setup(np.asarray(compiled.ids)[keep].tolist(), np.column_stack([compiled.x[keep], compiled.y[keep]]),
+                      ways, m_per_lat, m_per_lon, fuzzy_cache)
+        return places
+
+    def _setup(self, routable, points, ways, m_per_lat, m_per_lon, fuzzy_cache):
+        self.ways = ways
+        self.m_per_lat = m_per_lat
+        self.m_per_lon = m_per_lon
+        self.routable = routable
+        self.routable_set = set(routable)
+        self.points = points
+        self._tree = None
+        super().__init__([name for name, nds in ways.items() if any(nid in self.routable_set for nid in nds)], fuzzy_cache)
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = KDTree(self.points)
+        return self._tree
+
+    def is_routable(self, nid):
+        return nid in self.routable_set
+
+    def street_node(self, name):
+        '''The first routable node along every segment of the named way.'''
+        for nid in self.ways[name]:
+            if nid in self.routable_set:
+                return nid
+        return None
+
+    def nearest(self, x, y):
+        '''The routable node nearest to x/y meters, or None if there are none.'''
+        i = self.tree.nearest((x, y))
+        return None if i is None else self.routable[i]
@@ -1,14 +1,22 @@
+from concurrent.futures import ProcessPoolExecutor
 import csv
+import hashlib
+from itertools import chain
 import numpy as np
 import random
 import math
 import astar
+import batch
+import cache
+import csr
+import kdtree
 
 
 def construct_full_path(path, id_digraph, id_to_data):
     fullpath = []
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
     for l, r in zip(path, path[1:]):
-        result = astar.astar(astar.toblers, astar.toblers_heuristic, id_digraph, id_to_data, l, r)
+        result = astar.astar(astar.toblers, astar.toblers_heuristic, id_digraph, id_to_data, l, r, graph=graph)
         if result is None:
             return None
         else:
@@ -16,26 +24,55 @@ def construct_full_path(path, id_digraph, id_to_data):
     return fullpath
 
 
-def read_walk_data(csv_fname, id_digraph, id_to_data):
+def read_walk_data(csv_fname, id_digraph, id_to_data, cache_path=None):
     '''
     Read the walk data into a form we care about.
     Return [(full path, total minutes, name, group), ...]
+
+    All rows are routed together, one search per distinct waypoint rather
+    than one per leg. With a cache_path the full paths are kept there, keyed
+    by the row's text and the graph they were routed on, so only rows that
+    are new (or changed) since the last read get routed.
     '''
-    result = []
+    rows = []
     with open(csv_fname, newline ='') as f:
         reader = csv.reader(f, delimiter=',', quotechar='|')
         for idx, row in enumerate(reader):
+            key = hashlib.sha1('|'.join(row).encode('utf-8')).hexdigest()
             *path, minutes, seconds, name, group = row
             path = [int(p) for p in path]
             minutes = int(minutes)
             seconds = int(seconds)
             total_minutes = minutes + seconds/60.0
-            fullpath = construct_full_path(path, id_digraph, id_to_data)
-            if fullpath == None:
-                print("***WARNING! The path in walk data row {} is impossible!***".format(idx))
-                continue
-            else:
-                result.append((fullpath, total_minutes, name, group))
+            rows.append((path, total_minutes, name, group, key))
+
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    known = {}
+    if cache_path is not None:
+        fingerprint = graph.fingerprint()
+        known = cache.read_walk_cache(cache_path, fingerprint)
+
+    todo = {}
+    for (path, _, _, _, key) in rows:
+        if key not in known:
+            todo[key] = path
+    if todo:
+        routed = batch.route_id_chains(id_digraph, id_to_data, list(todo.values()), graph=graph)
+        known.update(zip(todo, routed))
+
+    keys = set(key for (_, _, _, _, key) in rows)
+    if cache_path is not None and (todo or len(known) != len(keys)):
+        # rows no longer in the file are dropped
+        cache.write_walk_cache(cache_path, fingerprint, {key: known[key] for key in keys})
+
+    result = []
+    for idx, (path, total_minutes, name, group, key) in enumerate(rows):
+        fullpath = known[key]
+        if fullpath == None:
+            print("***WARNING! The path in walk data row {} is impossible!***".format(idx))
+            continue
+        else:
+            result.append((fullpath, total_minutes, name, group))
     return result
 
 
@@ -51,7 +88,7 @@ def partition_walks(examples, seed=None):
     if not seed is None:
         r.seed(seed)
     exclone = examples[:]
-    random.shuffle(exclone, random=r.random)
+    r.shuffle(exclone)
     boundary = round(.7 * len(exclone))
     training = exclone[:boundary]
     test = exclone[boundary:]
@@ -63,14 +100,99 @@ def linear_model(examples):
     Take examples: [([x1, ..., xn], target), ...] and return the
     model function [x1, ..., xn] -> result.
 
-    Linear regression is accomplished through some closed form matrix math
-    rather than gradient descent.
+    Linear regression is accomplished through least squares rather than
+    gradient descent.
+    '''
+    X = np.array([xvec for (xvec, _) in examples], dtype=np.float64)
+    y = np.array([e for (_, e) in examples], dtype=np.float64)
+    ws, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+    return LinearModel(ws)
+
+
+class LinearModel:
+    '''A fitted linear model: the dot product of the weights with the features.'''
+
+    def __init__(self, weights):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self._weights = self.weights.tolist()
+
+    def __call__(self, xs):
+        return float(sum([w*x for w, x in zip(self._weights, xs)]))
+
+    def predict_many(self, X):
+        '''Predict every row of the feature matrix X, as an array.'''
+        return np.asarray(X, dtype=np.float64) @ self.weights
+
+
+class IncrementalLinearModel:
     '''
-    X = np.matrix([xvec for (xvec, _) in examples])
-    y = np.matrix([[e] for (_, e) in examples])
-    ws = (X.T * X).I * X.T * y
-    print(ws)
-    return lambda xs: float(sum([w*x for w, x in zip(ws, xs)]))
+    The sufficient statistics X^T X and X^T y of a least squares fit, so
+    that examples can be added one at a time in O(features^2) and the fit
+    redone without the examples. Statistics over different examples add up
+    with +. model() gives the same weights as linear_model over all of the
+    examples added, up to rounding.
+    '''
+
+    def __init__(self, features, xtx=None, xty=None, count=0):
+        self.features = features
+        self.xtx = np.zeros((features, features)) if xtx is None else np.array(xtx, dtype=np.float64)
+        self.xty = np.zeros(features) if xty is None else np.array(xty, dtype=np.float64)
+        self.count = count
+
+    @classmethod
+    def from_examples(cls, examples, features=None):
+        if features is None:
+            features = len(examples[0][0])
+        stats = cls(features)
+        stats.add_many(examples)
+        return stats
+
+    def add(self, xs, y):
+        xs = np.asarray(xs, dtype=np.float64)
+        self.xtx += np.outer(xs, xs)
+        self.xty += xs * y
+        self.count += 1
+
+    def add_many(self, examples):
+        if not examples:
+            return
+        X = np.array([xs for (xs, _) in examples], dtype=np.float64).reshape(len(examples), self.features)
+        y = np.array([y for (_, y) in examples], dtype=np.float64)
+        self.xtx += X.T @ X
+        self.xty += X.T @ y
+        self.count += len(examples)
+
+    def __add__(self, other):
+        return IncrementalLinearModel(self.features, self.xtx + other.xtx, self.xty + other.xty, self.count + other.count)
+
+    def model(self, ridge=1e-12):
+        '''The LinearModel fitted to everything added so far.'''
+        # Solve the normal equations scaled to a unit diagonal, which undoes
+        # the conditioning lost to features of very different sizes (meters
+        # of distance and of climb). A ridge penalty on the unscaled weights,
+        # tiny next to the data, keeps linearly dependent features solvable
+        # and gives them the smallest weights, as linear_model does.
+        scale = np.sqrt(np.diag(self.xtx))
+        scale[scale == 0] = 1
+        penalty = ridge * np.mean(scale**2) / scale**2
+        a = self.xtx / np.outer(scale, scale) + np.diag(penalty)
+        ws = np.linalg.solve(a, self.xty / scale) / scale
+        return LinearModel(ws)
+
+    def save(self, path):
+        cache.save_arrays(path, {'xtx': self.xtx, 'xty': self.xty},
+                          {'kind': 'linear_stats', 'features': self.features, 'count': self.count})
+
+    @classmethod
+    def load(cls, path):
+        '''Load statistics saved to path, or return None if there are none.'''
+        loaded = cache.load_arrays(path)
+        if loaded is None:
+            return None
+        meta, arrays = loaded
+        if meta.get('kind') != 'linear_stats':
+            return None
+        return cls(meta['features'], arrays['xtx'], arrays['xty'], meta['count'])
 
 
 def nearest_neighbor_model(examples):
@@ -78,18 +200,60 @@ def nearest_neighbor_model(examples):
     Take examples: [([dist, elev], target), ...] and return the
     model function [dist, elev] -> result.
     '''
-    scalefactor = 5
+    return NearestNeighborModel(examples)
 
-    def model(xs):
+
+class NearestNeighborModel:
+    '''
+    Predict the target of the training example nearest in
+    [dist, scalefactor*elev] space, ties going to the smallest target.
+    Single predictions use a k-d tree over the examples. predict_many
+    compares whole blocks of feature vectors with every example at once
+    unless there are more than brute_force_limit examples: that is
+    O(rows * examples) but runs in numpy, where the tree is O(rows * log
+    examples) in Python. For the 64k edges of a 20k node map they take
+    about as long at 2000 examples; data/walk.txt gives about a hundred.
+    '''
+
+    brute_force_limit = 2000
+
+    def __init__(self, examples, scalefactor=5):
+        self.scalefactor = scalefactor
+        self.features = np.array([xs for (xs, _) in examples], dtype=np.float64).reshape(len(examples), 2)
+        self.targets = np.array([y for (_, y) in examples], dtype=np.float64)
+        self._examples = [(float(d), float(e), y) for ((d, e), y) in zip(self.features.tolist(), [y for (_, y) in examples])]
+        scaled = self.features * [1, scalefactor]
+        self.tree = kdtree.KDTree(scaled)
+
+    def __call__(self, xs):
         [dist, elev] = xs
-        minimum = (float('inf'), None)
-        for [dist2, elev2], y in examples:
+        examples = self._examples
+        scalefactor = self.scalefactor
+
+        def key(i):
+            dist2, elev2, y = examples[i]
             delta_dist = dist2 - dist
             delta_elev = elev2 - elev
-            euclidean = math.sqrt(delta_dist**2 + (scalefactor*delta_elev)**2)
-            minimum = min(minimum, (euclidean, y))
-        return minimum[1]
-    return model
+            return (math.sqrt(delta_dist**2 + (scalefactor*delta_elev)**2), y)
+
+        nearest = self.tree.nearest([dist, scalefactor*elev], key)
+        return None if nearest is None else examples[nearest][2]
+
+    def predict_many(self, X, block=1 << 20):
+        '''Predict every row [dist, elev] of X, as an array.'''
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 2)
+        if len(self.targets) > self.brute_force_limit:
+            return np.array([self(xs) for xs in X.tolist()], dtype=np.float64)
+        result = np.empty(len(X))
+        rows = max(1, block // max(1, len(self.targets)))
+        for start in range(0, len(X), rows):
+            part = X[start:start + rows]
+            delta_dist = self.features[:, 0] - part[:, 0:1]
+            delta_elev = self.features[:, 1] - part[:, 1:2]
+            euclidean = np.sqrt(delta_dist**2 + (self.scalefactor*delta_elev)**2)
+            closest = euclidean == euclidean.min(axis=1, keepdims=True)
+            result[start:start + rows] = np.where(closest, self.targets, np.inf).min(axis=1)
+        return result
 
 
 def L2_loss(model, test_examples):
@@ -106,19 +270,56 @@ def path_dist(path, id_to_data):
     return xydistsum
 
 
+def walk_features(walks, id_to_data):
+    '''
+    Return (features, targets) arrays for walks. Row i of features is
+    [xy distance, net elevation change, total uphill, total downhill] of
+    walk i, worked out for every walk at once over the concatenated paths.
+    '''
+    lengths = np.array([len(path) for path, *_ in walks], dtype=np.int64)
+    targets = np.array([time for _, time, *_ in walks], dtype=np.float64)
+    if len(walks) == 0:
+        return (np.zeros((0, 4)), targets)
+    xyz = np.fromiter(chain.from_iterable(id_to_data[nid] for path, *_ in walks for nid in path),
+                      dtype=np.float64, count=3*int(lengths.sum())).reshape(-1, 3)
+
+    # segment j joins point j to point j + 1; the ones between the last point
+    # of a walk and the first of the next don't count
+    starts = np.cumsum(lengths) - lengths
+    step = np.diff(xyz, axis=0)
+    inside = np.ones(len(step), dtype=bool)
+    inside[(starts + lengths - 1)[:-1]] = False
+    dist = np.where(inside, np.sqrt(step[:, 0]**2 + step[:, 1]**2), 0)
+    dz = np.where(inside, step[:, 2], 0)
+
+    def per_walk(values):
+        # sums over each walk's segments, of which there are lengths - 1
+        sums = np.concatenate([[0], np.cumsum(values)])
+        ends = starts + lengths - 1
+        return sums[np.maximum(ends, starts)] - sums[starts]
+
+    features = np.column_stack([
+        per_walk(dist),
+        xyz[starts + lengths - 1, 2] - xyz[starts, 2],
+        per_walk(np.maximum(dz, 0)),
+        per_walk(np.maximum(-dz, 0)),
+    ])
+    return (features, targets)
+
+
+def _examples(walks, id_to_data, columns):
+    features, targets = walk_features(walks, id_to_data)
+    return [(xs, y) for xs, y in zip(features[:, columns].tolist(), targets.tolist())]
+
+
 def build_dist_examples(walks, id_to_data):
     '''Build example set with one feature: xy distance.'''
-    return [([path_dist(path, id_to_data)], time) for path, time, _, _ in walks]
+    return _examples(walks, id_to_data, [0])
 
 
 def build_dist_elev_examples(walks, id_to_data):
     '''Build example set with two features: xy distance and elevation'''
-    result = []
-    for path, time, _, _ in walks:
-        dist = path_dist(path, id_to_data)
-        delta_elev = id_to_data[path[-1]].z_m - id_to_data[path[0]].z_m
-        result.append(([dist, delta_elev], time))
-    return result
+    return _examples(walks, id_to_data, [0, 1])
 
 
 def build_dist_2elev_examples(walks, id_to_data):
@@ -126,19 +327,7 @@ def build_dist_2elev_examples(walks, id_to_data):
     Build example set with three features: xy distance and total upward
     elevation change and total downward elevation change
     '''
-    result = []
-    for path, time, _, _ in walks:
-        dist = path_dist(path, id_to_data)
-        downhill = 0
-        uphill = 0
-        for l, r in zip(path, path[1:]):
-            change = id_to_data[r].z_m - id_to_data[l].z_m
-            if change > 0:
-                uphill += change
-            else:
-                downhill -= change
-        result.append(([dist, uphill, downhill], time))
-    return result
+    return _examples(walks, id_to_data, [0, 2, 3])
 
 
 def pw(wsz):
@@ -148,9 +337,11 @@ def pw(wsz):
     return ws, wstest
 
 def compare_models(walks, id_to_data, sharedseed):
-    trainingA, testA = partition_walks(build_dist_examples(walks, id_to_data), seed=sharedseed)
-    trainingB, testB = partition_walks(build_dist_elev_examples(walks, id_to_data), seed=sharedseed)
-    trainingC, testC = partition_walks(build_dist_2elev_examples(walks, id_to_data), seed=sharedseed)
+    features, targets = walk_features(walks, id_to_data)
+    examples = lambda columns: list(zip(features[:, columns].tolist(), targets.tolist()))
+    trainingA, testA = partition_walks(examples([0]), seed=sharedseed)
+    trainingB, testB = partition_walks(examples([0, 1]), seed=sharedseed)
+    trainingC, testC = partition_walks(examples([0, 2, 3]), seed=sharedseed)
 
     ma = linear_model(trainingA)
     mb = linear_model(trainingB)
@@ -163,3 +354,87 @@ def compare_models(walks, id_to_data, sharedseed):
     print("  {}\tLinear model. Features: [distance, elevation].".format(stdev(mb, testB)))
     print("  {}\tLinear model. Features: [distance, uphill, downhill].".format(stdev(mc, testC)))
     print("  {}\tNearest neighbor.".format(stdev(md, testB)))
+
+
+# name -> (fit function, columns of walk_features used)
+evaluated_models = {
+    'linear [distance]': (linear_model, [0]),
+    'linear [distance, elevation]': (linear_model, [0, 1]),
+    'linear [distance, uphill, downhill]': (linear_model, [0, 2, 3]),
+    'nearest neighbor': (nearest_neighbor_model, [0, 1]),
+}
+
+
+def folds(count, k, repeats=1, seed=0):
+    '''
+    Return [(training indices, test indices), ...] for k-fold cross
+    validation over count examples, repeated with a fresh shuffle each time.
+    '''
+    result = []
+    for repeat in range(repeats):
+        order = np.random.default_rng([seed, repeat]).permutation(count)
+        for part in np.array_split(order, k):
+            result.append((np.setdiff1d(order, part), part))
+    return result
+
+
+def _evaluate(task):
+    (fit, X_train, y_train, X_test, y_test) = task
+    model = fit(list(zip(X_train.tolist(), y_train.tolist())))
+    errors = y_test - np.asarray(model.predict_many(X_test), dtype=np.float64)
+    return math.sqrt(np.mean(errors**2))
+
+
+def cross_validate(walks, id_to_data, k=5, repeats=1, seed=0, workers=0, names=None):
+    '''
+    Cross validate the evaluated_models (or those named) on walks. The
+    features of every walk are worked out once, then each model is fitted
+    and tested on every fold, in a pool of workers processes if workers is
+    more than 0. Return {name: {'mean': ..., 'var': ..., 'folds': [...]}}
+    of the root mean squared test error in minutes.
+    '''
+    features, targets = walk_features(walks, id_to_data)
+    k = max(2, min(k, len(walks)))
+    splits = folds(len(walks), k, repeats, seed)
+    names = list(evaluated_models) if names is None else names
+
+    tasks = []
+    for name in names:
+        (fit, columns) = evaluated_models[name]
+        X = features[:, columns]
+        for (train, test) in splits:
+            tasks.append((fit, X[train], targets[train], X[test], targets[test]))
+
+    if workers:
+        with ProcessPoolExecutor(workers) as pool:
+            errors = list(pool.map(_evaluate, tasks))
+    else:
+        errors = [_evaluate(task) for task in tasks]
+
+    results = {}
+    for i, name in enumerate(names):
+        errs = errors[i*len(splits):(i + 1)*len(splits)]
+        results[name] = {'mean': float(np.mean(errs)), 'var': float(np.var(errs)), 'folds': errs}
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    import config
+    import run
+
+    parser = argparse.ArgumentParser(description='cross validate the walking time models.')
+    parser.add_argument('-k', type=int, default=5, help='number of folds')
+    parser.add_argument('--repeats', type=int, default=1, help='repeat with this many different shuffles')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes to fit models in')
+    args = parser.parse_args()
+
+    (graph, ways, data) = run.load_map(config.osm_path, config.elev_path, config.cache_path)
+    walks = read_walk_data(config.walk_data_path, graph, data, config.walk_cache_path)
+    results = cross_validate(walks, data, args.k, args.repeats, args.seed, args.workers)
+    print('{}-fold cross validation of {} walks, repeated {} times.'.format(args.k, len(walks), args.repeats))
+    print('Root mean squared test error in minutes:')
+    for name, r in results.items():
+        print('  {:.3f} (variance {:.3f})\t{}'.format(r['mean'], r['var'], name))
@@ -0,0 +1,100 @@
+'''
+Answering a batch of queries on several cores.
+
+The compiled graph and its edge weights are written once to a file in the
+cache array format. Worker processes map that file in rather than being
+sent a pickled copy of the graph, and search it through memoryviews of the
+mapped arrays instead of copying them into lists, so starting a worker
+costs about the same whatever the size of the map, and the operating
+system shares the pages between them. Node ids are looked up by binary
+search over an index sorted with the file, rather than through a dict.
+'''
+from multiprocessing import Pool
+
+import numpy as np
+
+import astar
+import cache
+
+
+def write_compiled(path, graph, weights, min_cost_per_m=0.0):
+    '''
+    Write a CSRGraph and its edge weights to path. min_cost_per_m is a lower
+    bound on the cost of travelling a metre, used for the A* heuristic
+    (1/100 for toblers, which never exceeds 6 km/h).
+    '''
+    arrays = {
+        'ids': np.array(graph.ids, dtype=np.int64),
+        'xyz': np.column_stack([graph.x, graph.y, graph.z]),
+        'offsets': graph.offsets,
+        'targets': graph.targets,
+        'weights': np.asarray(weights, dtype=np.float64),
+        'order': np.argsort(np.array(graph.ids, dtype=np.int64), kind='stable'),
+    }
+    cache.save_arrays(path, arrays, {'kind': 'compiled', 'min_cost_per_m': min_cost_per_m})
+
+
+class _Mapped:
+    # just enough of a CSRGraph for astar_csr, over the mapped arrays
+
+    def __init__(self, offsets, targets):
+        self.lists = (memoryview(offsets), memoryview(targets))
+
+    def adjacency(self):
+        return self.lists
+
+
+class CompiledSearch:
+    '''A* over a graph and weights written by write_compiled.'''
+
+    def __init__(self, path):
+        meta, arrays = cache.load_arrays(path)
+        self.ids = arrays['ids']
+        self.order = arrays['order']
+        xyz = arrays['xyz']
+        (self.x, self.y) = (xyz[:, 0], xyz[:, 1])
+        self.graph = _Mapped(arrays['offsets'], arrays['targets'])
+        self.weights = memoryview(arrays['weights'])
+        self.min_cost_per_m = meta['min_cost_per_m']
+
+    def node(self, nid):
+        '''The index of node id nid, or None.'''
+        i = int(np.searchsorted(self.ids, nid, sorter=self.order))
+        if i < len(self.order) and self.ids[self.order[i]] == nid:
+            return int(self.order[i])
+        return None
+
+    def route(self, start, goal):
+        '''Return (path, path_cost) between node ids, or None.'''
+        s, t = self.node(start), self.node(goal)
+        if s is None or t is None:
+            return None
+        h = (self.min_cost_per_m * astar.euclidean_many(self.x, self.y, None, self.x[t], self.y[t], None)).tolist()
+        result = astar.astar_csr(self.graph, self.weights, h, s, t)
+        if result is None:
+            return None
+        ids = self.ids
+        return ([int(ids[i]) for i in result[0]], result[1])
+
+
+_search = None
+
+
+def _attach(path):
+    global _search
+    _search = CompiledSearch(path)
+
+
+def _route(query):
+    return _search.route(*query)
+
+
+def route_parallel(path, queries, workers, chunksize=8):
+    '''
+    Route (start id, goal id) queries over the graph written to path by
+    write_compiled, in workers processes. Results are yielded in query
+    order as they become available.
+    '''
+    with Pool(workers, initializer=_attach, initargs=(path,)) as pool:
+        for result in pool.imap(_route, queries, chunksize):
+            yield result
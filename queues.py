@@ -0,0 +1,146 @@
+'''
+Priority queues for the search frontier. Each holds (priority, node)
+entries and has push(priority, node), pop() -> (priority, node) of the
+smallest priority, and len().
+
+BinaryHeap      heapq; pushing a node again adds another entry, and the
+                search skips the outdated one when it comes off
+IndexedHeap     a binary heap that knows where every node is, so pushing a
+                node again lowers its priority in place (decrease-key) and
+                nothing outdated is ever popped
+BucketQueue     entries are grouped into buckets of priorities width wide
+                and only the bucket being popped from is kept in heap order,
+                so most pushes are an append to a short list
+'''
+from heapq import heapify, heappush, heappop
+
+
+inf = float('inf')
+
+
+class BinaryHeap:
+    def __init__(self):
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, priority, node):
+        heappush(self.heap, (priority, node))
+
+    def pop(self):
+        return heappop(self.heap)
+
+
+class IndexedHeap:
+    def __init__(self):
+        self.heap = []
+        self.position = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, priority, node):
+        '''Add node, or lower its priority if it is already queued for more.'''
+        i = self.position.get(node)
+        if i is None:
+            i = len(self.heap)
+            self.heap.append((priority, node))
+        elif priority < self.heap[i][0]:
+            self.heap[i] = (priority, node)
+        else:
+            return
+        self._up(i)
+
+    def pop(self):
+        heap = self.heap
+        top = heap[0]
+        del self.position[top[1]]
+        last = heap.pop()
+        if heap:
+            heap[0] = last
+            self.position[last[1]] = 0
+            self._down(0)
+        return top
+
+    def _up(self, i):
+        heap, position = self.heap, self.position
+        entry = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if heap[parent] <= entry:
+                break
+            heap[i] = heap[parent]
+            position[heap[i][1]] = i
+            i = parent
+        heap[i] = entry
+        position[entry[1]] = i
+
+    def _down(self, i):
+        heap, position = self.heap, self.position
+        n = len(heap)
+        entry = heap[i]
+        while True:
+            child = 2*i + 1
+            if child >= n:
+                break
+            if child + 1 < n and heap[child + 1] < heap[child]:
+                child += 1
+            if entry <= heap[child]:
+                break
+            heap[i] = heap[child]
+            position[heap[i][1]] = i
+            i = child
+        heap[i] = entry
+        position[entry[1]] = i
+
+
+class BucketQueue:
+    '''
+    Pops in exactly the same order as a heap. Priorities below the bucket
+    being popped from (from an inconsistent heuristic) go into that bucket,
+    which is still in heap order, so they come out next.
+    '''
+
+    def __init__(self, width):
+        self.width = width
+        self.buckets = {}
+        self.keys = [] # heap of the keys of the waiting buckets
+        self.current = [] # heap of the bucket being popped from
+        self.current_key = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, priority, node):
+        self.size += 1
+        key = priority // self.width if priority < inf else inf
+        if self.current_key is not None and key <= self.current_key:
+            heappush(self.current, (priority, node))
+            return
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [(priority, node)]
+            heappush(self.keys, key)
+        else:
+            bucket.append((priority, node))
+
+    def pop(self):
+        if not self.current:
+            self.current_key = heappop(self.keys)
+            self.current = self.buckets.pop(self.current_key)
+            heapify(self.current)
+        self.size -= 1
+        return heappop(self.current)
+
+
+def make(name, width=1.0):
+    '''A queue by name: 'heap', 'indexed' or 'bucket' (of the given width).'''
+    if name == 'heap':
+        return BinaryHeap()
+    if name == 'indexed':
+        return IndexedHeap()
+    if name == 'bucket':
+        return BucketQueue(width)
+    raise ValueError('unknown queue {!r}'.format(name))
@@ -2,13 +2,24 @@ import xml.etree.ElementTree as ET
 from collections import defaultdict, namedtuple
 import math
 import array
+import os
 import sys
 import argparse
 import graphics
+import alt
+import alternatives
 import astar
+import cache
+import ch
 import config
+import elevation
+import isochrone
+import lookup
 import models
 import random
+import simplify
+import tiles
+import numpy as np
 
 from astar import nodedata
 
@@ -38,14 +49,16 @@ def build_node_digraph(xml_root):
 def build_ways(xml_root):
     """
     Build a map of way names to node ids contained within. Note that not all
-    ways have names so only those that do are included.
+    ways have names so only those that do are included. A street is often
+    split into several ways with the same name; their nodes are concatenated
+    in file order.
     """
 
     ways = {}
 
     for child in xml_root.iterfind('way'):
         nds = [int(n.get('ref')) for n in child.iterfind('nd')]
-        tags = child.iterfind('tag')
+        tags = list(child.iterfind('tag'))
 
         if only_highways and not any((sub.get('k') == 'highway' for sub in tags)):
             continue
@@ -56,7 +69,7 @@ def build_ways(xml_root):
                 wayname = sub.get('v').lower()
 
         if not wayname is None:
-            ways[wayname] = nds
+            ways.setdefault(wayname, []).extend(nds)
 
     return ways
 
@@ -64,21 +77,32 @@ def build_ways(xml_root):
 def build_node_data(xml_root, elevation_data):
     """Build a map from node ids to NodeDatas (named tuples) with x y and z in meters"""
 
-    node_data = {}
+    node_ids = []
+    lats = []
+    lons = []
 
     for child in xml_root.iterfind('node'):
-        node_id = int(child.get('id'))
+        node_ids.append(int(child.get('id')))
+        lats.append(float(child.get('lat')))
+        lons.append(float(child.get('lon')))
 
-        lat = float(child.get('lat'))
-        lon = float(child.get('lon'))
+    return node_data_from_coords(node_ids, lats, lons, elevation_data)
 
-        y_m = lat * m_per_lat
-        x_m = lon * m_per_lon
-        z_m = lerped_elevation(elevation_data, lat, lon)
 
-        node_data[node_id] = nodedata(x_m, y_m, z_m)
+def node_data_from_coords(node_ids, lats, lons, elevation_data):
+    """Build a map from node ids to NodeDatas given parallel sequences of ids, lats and lons"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
 
-    return node_data
+    xs = (lons * m_per_lon).tolist()
+    ys = (lats * m_per_lat).tolist()
+    if isinstance(elevation_data, elevation.ElevationProvider):
+        elevation_data.check_coverage(lats, lons)
+        zs = elevation_data.elevations(lats, lons).tolist()
+    else:
+        zs = lerped_elevations(elevation_data, lats, lons).tolist()
+
+    return {node_id: nodedata(x_m, y_m, z_m) for node_id, x_m, y_m, z_m in zip(node_ids, xs, ys, zs)}
 
 
 def read_elevations(elevations_path):
@@ -91,6 +115,24 @@ def read_elevations(elevations_path):
     return data
 
 
+def open_elevations(elevations_path):
+    """
+    Open the elevation data at elevations_path, which is either a single
+    N42E018 tile or a directory of SRTM tiles.
+    """
+    if os.path.isdir(elevations_path):
+        return elevation.ElevationProvider(elevations_path)
+    return map_elevations(elevations_path)
+
+
+def map_elevations(elevations_path):
+    """
+    Memory map the elevation file as a read only 3601x3601 array of big
+    endian shorts. Only the pages that are actually looked at get read.
+    """
+    return np.memmap(elevations_path, dtype='>i2', mode='r', shape=(3601, 3601))
+
+
 def lerped_elevation(elevs, lat, lon):
     '''
     Get the linearly interpolated elevation between the closest four.
@@ -123,6 +165,36 @@ def lerped_elevation(elevs, lat, lon):
     return lerpboth
 
 
+def lerped_elevations(elevs, lats, lons):
+    '''
+    Vectorized lerped_elevation: take arrays of latitudes and longitudes and
+    return an array of interpolated elevations, clamped to the tile the same
+    way. elevs may be the flat array from read_elevations or the 3601x3601
+    array from map_elevations.
+    '''
+    elevs = np.asarray(elevs).reshape(-1)
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    lat_secs = np.clip(43*60*60 - lats*60*60, 0.001, 3599.99)
+    lon_secs = np.clip(lons*60*60 - 18*60*60, 0.001, 3599.99)
+
+    lat1 = np.floor(lat_secs).astype(np.intp)
+    lat2 = np.ceil(lat_secs).astype(np.intp)
+    lon1 = np.floor(lon_secs).astype(np.intp)
+    lon2 = np.ceil(lon_secs).astype(np.intp)
+
+    def lerp(l, e1, e2):
+        return (l % 1)*e2 + (1 - (l % 1))*e1
+
+    def at(plat, plon):
+        return elevs[plat*3601 + plon].astype(np.float64)
+
+    lerped1 = lerp(lon_secs, at(lat1, lon1), at(lat1, lon2))
+    lerped2 = lerp(lon_secs, at(lat2, lon1), at(lat2, lon2))
+    return lerp(lat_secs, lerped1, lerped2)
+
+
 def elevation_idx(lat, lon):
     """
     Get the index in the elevation array for the given latitude and longitude.
@@ -143,7 +215,7 @@ def read_xml(xml_path, elevations_path):
     root = tree.getroot()
     
     if root.tag != 'osm':
-        raise IOError('Expected root xml tag to be named "osm", got "{}".'.format(osm_elem.tag))
+        raise IOError('Expected root xml tag to be named "osm", got "{}".'.format(root.tag))
 
     version = root.get('version')
     if version != '0.6':
@@ -151,58 +223,263 @@ def read_xml(xml_path, elevations_path):
 
     graph = build_node_digraph(root)
     ways = build_ways(root)
-    data = build_node_data(root, read_elevations(elevations_path))
+    data = build_node_data(root, open_elevations(elevations_path))
 
     return (graph, ways, data)
 
 
-def run(source, destination, show, prediction, seed):
-    (graph, ways, data) = read_xml(config.osm_path, config.elev_path)
-    source = sys.argv[1].lower()
-    dest = sys.argv[2].lower()
+def read_xml_streaming(xml_path, elevations_path):
+    """
+    Return a tuple of (graph, ways, data) like read_xml, but in a single
+    incremental pass over the file instead of building the whole document.
 
-    try:
-        source = int(source)
-        assert source in graph
-    except:
-        if source in ways:
-            source = ways[source][0]
-        else:
-            print('Source must be a valid node ID or a street name')
+    Elements are discarded as soon as they have been read. Node coordinates
+    are held in flat arrays until the ways have been seen, and only the nodes
+    referenced by (highway) ways make it into data.
+    """
+    graph = defaultdict(list)
+    ways = {}
+    referenced = set()
+
+    node_ids = array.array('q')
+    node_lats = array.array('d')
+    node_lons = array.array('d')
+
+    root = None
+    for event, elem in ET.iterparse(xml_path, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+                if root.tag != 'osm':
+                    raise IOError('Expected root xml tag to be named "osm", got "{}".'.format(root.tag))
+                version = root.get('version')
+                if version != '0.6':
+                    print('Warning: Expected osm api version "0.6", got "{}".'.format(version))
+            continue
+
+        if elem.tag == 'node':
+            node_ids.append(int(elem.get('id')))
+            node_lats.append(float(elem.get('lat')))
+            node_lons.append(float(elem.get('lon')))
+        elif elem.tag == 'way':
+            tags = {sub.get('k'): sub.get('v') for sub in elem.iterfind('tag')}
+            if not only_highways or 'highway' in tags:
+                nds = [int(n.get('ref')) for n in elem.iterfind('nd')]
+                for (ref1, ref2) in zip(nds, nds[1:]):
+                    graph[ref1].append(ref2)
+                    graph[ref2].append(ref1)
+                referenced.update(nds)
+                if 'name' in tags:
+                    ways.setdefault(tags['name'].lower(), []).extend(nds)
+        elif elem.tag not in ('relation', 'bounds'):
+            continue
+        root.clear()
+
+    keep = np.isin(np.frombuffer(node_ids, dtype=np.int64), np.fromiter(referenced, dtype=np.int64))
+    data = node_data_from_coords(
+        np.frombuffer(node_ids, dtype=np.int64)[keep].tolist(),
+        np.frombuffer(node_lats)[keep],
+        np.frombuffer(node_lons)[keep],
+        open_elevations(elevations_path))
+
+    return (graph, ways, data)
+
+
+def compile_map(xml_path, elevations_path, cache_path, use_hash=False):
+    """Parse the map and write it to the cache. Return (graph, ways, data)"""
+    stamp = cache.source_stamp([xml_path, elevations_path], use_hash)
+    (graph, ways, data) = read_xml_streaming(xml_path, elevations_path)
+    cache.write_graph_cache(cache_path, graph, ways, data, stamp)
+    return (graph, ways, data)
+
+
+def load_map(xml_path, elevations_path, cache_path, use_hash=False):
+    """
+    Return the map as a cache.CachedMap, compiling it afresh first unless
+    the cache was built from the current map and elevation files. Its
+    compiled graph comes straight from the cache; it still unpacks as
+    (graph, ways, data) for code that wants the dicts.
+    """
+    stamp = cache.source_stamp([xml_path, elevations_path], use_hash)
+    cached = cache.read_graph_cache(cache_path, stamp)
+    if cached is None:
+        compile_map(xml_path, elevations_path, cache_path, use_hash)
+        cached = cache.read_graph_cache(cache_path)
+    return cached
+
+
+def load_hierarchy(compiled, weights, hierarchy_path):
+    """
+    Return the contraction hierarchy for the compiled graph and weights,
+    from hierarchy_path if it was built for this graph, otherwise building
+    and saving it.
+    """
+    fingerprint = compiled.fingerprint()
+    hierarchy = ch.ContractionHierarchy.load(hierarchy_path, fingerprint)
+    if hierarchy is None:
+        hierarchy = ch.ContractionHierarchy.build(compiled, weights)
+        hierarchy.save(hierarchy_path, fingerprint)
+    return hierarchy
+
+
+def load_landmarks(compiled, weights, landmarks_path):
+    """
+    Return the alt.Landmarks of the compiled graph and weights, from
+    landmarks_path if they were picked for this graph, otherwise building
+    and saving them.
+    """
+    fingerprint = compiled.fingerprint()
+    landmarks = alt.Landmarks.load(landmarks_path, fingerprint)
+    if landmarks is None:
+        landmarks = alt.Landmarks.build(compiled, weights)
+        landmarks.save(landmarks_path, fingerprint)
+    return landmarks
+
+
+def load_chains(compiled, chains_path):
+    """
+    Return the simplify.Chains of the compiled graph, from chains_path if
+    they were collapsed from this graph, otherwise collapsing and saving them.
+    """
+    fingerprint = compiled.fingerprint()
+    chains = simplify.Chains.load(chains_path, compiled, fingerprint)
+    if chains is None:
+        chains = simplify.Chains.build(compiled)
+        chains.save(chains_path, fingerprint)
+    return chains
+
+
+def load_tiles(xml_path, elevations_path, tiles_path, cell_size, max_cells=64, use_hash=False):
+    """
+    Return a tiles.TiledMap of the map, split into cells cell_size meters
+    wide in tiles_path. The tiles are (re)written from the map first if
+    they weren't built from the current map and elevation files.
+    """
+    stamp = cache.source_stamp([xml_path, elevations_path], use_hash)
+    index = tiles.read_index(tiles_path, stamp)
+    if index is None or index[0]['cell_size'] != cell_size:
+        (graph, ways, data) = load_map(xml_path, elevations_path, config.cache_path, use_hash)
+        tiles.write_tiles(tiles_path, graph, ways, data, cell_size, stamp)
+        index = None
+    return tiles.TiledMap(tiles_path, max_cells, index, m_per_lat, m_per_lon)
+
+
+def make_lookup(loaded):
+    """An index resolving node IDs, street names and "lat,lon" positions to nodes of a load_map map"""
+    return lookup.Lookup.from_compiled(loaded.compiled, loaded.ways, m_per_lat, m_per_lon)
+
+
+def training_examples(graph, data, seed):
+    """The [(features, minutes), ...] examples of seed's training set of the walk data"""
+    walks = models.read_walk_data(config.walk_data_path, graph, data, config.walk_cache_path)
+    training_walks, _ = models.partition_walks(walks, seed=seed)
+    return models.build_dist_elev_examples(training_walks, data)
+
+
+def linear_statistics(graph, data, seed):
+    """The models.IncrementalLinearModel the linear prediction is fitted to for seed"""
+    return models.IncrementalLinearModel.from_examples(training_examples(graph, data, seed), 2)
+
+
+def prepare_search(prediction, loaded, seed, added=None, base=None, stats=None):
+    """
+    Return (weights, heuristic) for searching loaded.compiled, where loaded
+    is the map as load_map returns it, with the given prediction. weights
+    is a list of edge costs and heuristic(goal) gives the list of heuristic
+    costs to the goal index (heuristic(goal, stats) counts the evaluations
+    in stats, as computing the weights does).
+    The linear and nearest predictions are trained on the walk data first,
+    which needs the map's dicts; the linear one also on the walks summed up
+    in added (a models.IncrementalLinearModel), if any. base may be the
+    linear_statistics for seed, if they are at hand, to save reading the
+    walk data again.
+    """
+    compiled = loaded.compiled
+    if prediction == 'toblers':
+        weights = astar.edge_weights(compiled, astar.toblers, stats).tolist()
+        heuristic = lambda goal, stats=None: astar.heuristic_values(compiled, astar.toblers_heuristic, goal, stats)
+    if prediction == 'linear':
+        if base is None:
+            base = linear_statistics(loaded.graph, loaded.data, seed)
+        model = (base if added is None else base + added).model()
+        (weights, heuristic) = astar.learned_search(compiled, astar.model_edge_weights(compiled, model, stats), model)
+    if prediction == 'nearest':
+        model = models.nearest_neighbor_model(training_examples(loaded.graph, loaded.data, seed))
+        (weights, heuristic) = astar.learned_search(compiled, astar.model_edge_weights(compiled, model, stats), model)
+    return (weights, heuristic)
+
+
+def run(source, destination, show, prediction, seed, hierarchy=False, stats=None, routes=1, chains=False, landmarks=False):
+    """
+    Find and print the best path, or with routes > 1 up to that many
+    alternative routes (see alternatives.alternatives), best first. With
+    chains the search runs on the graph with its chains of degree-2 nodes
+    collapsed (see simplify), which finds the same paths. With landmarks a
+    toblers search is a bidirectional ALT search (see alt) instead. If stats is an
+    astar.SearchStats it is filled in with the search counters and the time
+    spent in each phase.
+    """
+    with astar.phase(stats, 'load'):
+        loaded = load_map(config.osm_path, config.elev_path, config.cache_path)
+        compiled = loaded.compiled
+
+    with astar.phase(stats, 'resolve'):
+        places = make_lookup(loaded)
+        source = places.resolve(source)
+        dest = places.resolve(destination)
+    if source is None:
+        print('Source must be a valid node ID, street name or "lat,lon"')
+        return
+    if dest is None:
+        print('Destination must be a valid node ID, street name or "lat,lon"')
+        return
+
+    with astar.phase(stats, 'prepare'):
+        goal = compiled.index[dest]
+        (weights, heuristic) = prepare_search(prediction, loaded, seed, stats=stats)
+
+    if routes > 1:
+        with astar.phase(stats, 'heuristic'):
+            h = heuristic(goal, stats)
+        with astar.phase(stats, 'search'):
+            found = alternatives.alternatives(compiled, weights, compiled.index[source], goal, routes, h=h)
+        if not found:
+            print('No path to destination found')
             return
-    
-    try:
-        dest = int(dest)
-        assert dest in graph
-    except:
-        if dest in ways:
-            dest = ways[dest][0]
+        for (i, (path, cost)) in enumerate(found, 1):
+            print('\nroute {}: {}\n'.format(i, ', '.join(str(nd) for nd in compiled.path_ids(path))))
+            print('time: {:.2f} minutes\n'.format(cost))
+        if show:
+            graphics.display(loaded.graph, loaded.data, compiled.path_ids(found[0][0]), found[0][1])
+        return
+
+    if hierarchy and prediction == 'toblers':
+        with astar.phase(stats, 'prepare'):
+            contracted = load_hierarchy(compiled, weights, config.ch_path)
+        with astar.phase(stats, 'search'):
+            result = contracted.query(compiled.index[source], goal, stats)
+    elif landmarks and prediction == 'toblers':
+        with astar.phase(stats, 'prepare'):
+            marks = load_landmarks(compiled, weights, config.landmarks_path)
+        with astar.phase(stats, 'search'):
+            result = alt.bidirectional_astar(compiled, weights, marks, compiled.index[source], goal, stats=stats)
+    else:
+        with astar.phase(stats, 'heuristic'):
+            h = heuristic(goal, stats)
+        if chains:
+            with astar.phase(stats, 'prepare'):
+                collapsed = load_chains(compiled, config.chains_path)
+                reduced_weights = collapsed.weights(weights)
+            with astar.phase(stats, 'search'):
+                result = collapsed.search(weights, reduced_weights, h, compiled.index[source], goal, stats)
         else:
-            print('Destination must be a valid node ID or a street name')
-            return
-    
-    costfunc = None
-    heuristic = None
-    if prediction == 'toblers':
-        costfunc = astar.toblers
-        heuristic = astar.toblers_heuristic
-    if prediction in ('linear', 'nearest'):
-        walks = models.read_walk_data(config.walk_data_path, graph, data)
-        training_walks, test_walks = models.partition_walks(walks, seed=seed)
-        train = models.build_dist_elev_examples(training_walks, data)
-        test = models.build_dist_elev_examples(test_walks, data)
-        if prediction == 'linear':
-            model = models.linear_model(train)
-            costfunc = lambda a, b: model([astar.euclidean(a, b), b.z_m - a.z_m])
-            heuristic = costfunc
-        elif prediction == 'nearest':
-            model = models.nearest_neighbor_model(train)
-            costfunc = lambda a, b: model([astar.euclidean(a, b), b.z_m - a.z_m])
-            heuristic = lambda a, b: 0
-
-    result = astar.astar(costfunc, heuristic, graph, data, source, dest)
+            with astar.phase(stats, 'search'):
+                result = astar.astar_csr(compiled, weights, h, compiled.index[source], goal, stats)
     if result is None:
         print('No path to destination found')
+        return
+    with astar.phase(stats, 'path'):
+        result = (compiled.path_ids(result[0]), result[1])
 
     pathstr = ', '.join((str(nd) for nd in result[0]))
     print('\npath: {}\n'.format(pathstr))
@@ -215,15 +492,123 @@ def run(source, destination, show, prediction, seed):
     #models.compare_models(walk_data, data, seed)
 
     if show:
-        graphics.display(graph, data, result[0], result[1])
+        graphics.display(loaded.graph, loaded.data, result[0], result[1])
+
 
+def run_tiled(source, destination, margin=500.0, stats=None):
+    """
+    Find and print the best toblers path loading only the cells of the
+    tiled map around source and destination (node IDs, street names or
+    "lat,lon"), and any more the search reaches.
+    """
+    with astar.phase(stats, 'load'):
+        tiled = load_tiles(config.osm_path, config.elev_path, config.tiles_path, config.tile_size)
+    with astar.phase(stats, 'resolve'):
+        start = tiled.resolve(source)
+        goal = tiled.resolve(destination)
+    if start is None:
+        print('Source must be a valid node ID, street name or "lat,lon"')
+        return
+    if goal is None:
+        print('Destination must be a valid node ID, street name or "lat,lon"')
+        return
+
+    with astar.phase(stats, 'search'):
+        result = tiled.route(start, goal, margin, stats=stats)
+    if result is None:
+        print('No path to destination found')
+        return
+    print('\npath: {}\n'.format(', '.join(str(nd) for nd in result[0])))
+    print('time: {:.2f} minutes\n'.format(result[1]))
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='find the fastest walking paths through Dubrovnik.')
-    parser.add_argument('source', type=str, nargs=1, help='the source node ID or street name')
-    parser.add_argument('destination', type=str, nargs=1, help='the destination node ID or street name')
+
+def run_isochrone(sources, minutes, prediction='toblers', seed=None, times_path=None, edges_path=None):
+    """
+    Print how much of the map is within minutes walk of the nearest of
+    sources (node IDs, street names or "lat,lon"), and optionally write the
+    travel time to every node reached and the edges walkable in time.
+    Return the array of travel times, or None if a source is unknown.
+    The linear prediction can give downhill edges negative costs, which
+    are taken as free here, since the search needs them non-negative.
+    """
+    loaded = load_map(config.osm_path, config.elev_path, config.cache_path)
+    places = make_lookup(loaded)
+    nodes = [places.resolve(source) for source in sources]
+    if None in nodes:
+        print('Source {} must be a valid node ID, street name or "lat,lon"'.format(sources[nodes.index(None)]))
+        return None
+
+    compiled = loaded.compiled
+    (weights, _) = prepare_search(prediction, loaded, seed)
+    weights = np.maximum(weights, 0).tolist()
+    times = isochrone.travel_times(compiled, weights, [compiled.index[n] for n in nodes], minutes)
+    edges = isochrone.reachable_edges(compiled, weights, times, minutes)
+    print('{} of {} nodes and {} edges within {} minutes'.format(
+        int(np.isfinite(times).sum()), len(compiled), len(edges), minutes))
+
+    if times_path is not None:
+        isochrone.write_times(times_path, compiled, times)
+    if edges_path is not None:
+        isochrone.write_geojson(edges_path, isochrone.edges_geojson(compiled, edges, times, m_per_lat, m_per_lon))
+    return times
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ['isochrone']:
+    parser = argparse.ArgumentParser(prog='run.py isochrone', description='find everywhere within a walking time.')
+    parser.add_argument('minutes', type=float, help='the walking time budget')
+    parser.add_argument('sources', type=str, nargs='+', help='node IDs, street names or "lat,lon"s to walk from')
+    parser.add_argument('--prediction', choices=['toblers', 'linear', 'nearest'], default='toblers')
+    parser.add_argument('-seed', type=float, help='use the given random seed to select the training set')
+    parser.add_argument('--times', help='write "node id,minutes" for every node reached to this file')
+    parser.add_argument('--edges', help='write the edges walkable in time to this GeoJSON file')
+    args = parser.parse_args(sys.argv[2:])
+    run_isochrone(args.sources, args.minutes, args.prediction, args.seed, args.times, args.edges)
+
+elif __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='find the fastest walking paths through Dubrovnik.',
+                                     epilog='run.py isochrone MINUTES SOURCE... finds everywhere within MINUTES walk instead.')
+    parser.add_argument('source', type=str, nargs=1, help='the source node ID, street name or "lat,lon"')
+    parser.add_argument('destination', type=str, nargs=1, help='the destination node ID, street name or "lat,lon"')
     parser.add_argument('prediction', choices=['toblers', 'linear', 'nearest'])
     parser.add_argument('--show', action='store_true', help='show the best path on a graphics map')
     parser.add_argument('-seed', type=float, help='use the given random seed to select the training set')
+    parser.add_argument('--hierarchy', action='store_true', help='answer toblers queries with a (cached) contraction hierarchy')
+    parser.add_argument('--routes', type=int, default=1, help='print up to this many distinct routes, best first')
+    parser.add_argument('--chains', action='store_true', help='search with chains of degree-2 nodes collapsed into single edges')
+    parser.add_argument('--landmarks', action='store_true', help='answer toblers queries with bidirectional ALT over (cached) landmarks')
+    parser.add_argument('--tiles', action='store_true', help='load only the map tiles around the query (toblers only)')
+    parser.add_argument('--margin', type=float, default=500.0, help='meters of map around the query to load up front with --tiles')
+    parser.add_argument('--stats', action='store_true', help='print search counters and the time spent in each phase')
+    parser.add_argument('--profile', action='store_true', help='run under cProfile and print the most expensive functions')
     args = parser.parse_args()
-    run(args.source, args.destination, args.show, args.prediction, args.seed)
+
+    stats = astar.SearchStats() if args.stats else None
+    if args.tiles:
+        if args.prediction != 'toblers':
+            parser.error('--tiles only supports the toblers prediction')
+        for flag, used in (('--show', args.show), ('--routes', args.routes != 1), ('--chains', args.chains), ('--hierarchy', args.hierarchy),
+                           ('--landmarks', args.landmarks)):
+            if used:
+                parser.error('--tiles can\'t be used with {}'.format(flag))
+        query = lambda: run_tiled(args.source[0], args.destination[0], args.margin, stats)
+    else:
+        for flag, used in (('--hierarchy', args.hierarchy), ('--landmarks', args.landmarks)):
+            if used and args.prediction != 'toblers':
+                parser.error('{} only supports the toblers prediction'.format(flag))
+        # each of these picks how the search is done
+        searches = [flag for flag, used in (('--routes', args.routes != 1), ('--chains', args.chains), ('--hierarchy', args.hierarchy),
+                                            ('--landmarks', args.landmarks)) if used]
+        if len(searches) > 1:
+            parser.error('{} can\'t be used with {}'.format(searches[0], searches[1]))
+        query = lambda: run(args.source[0], args.destination[0], args.show, args.prediction, args.seed, args.hierarchy, stats, args.routes, args.chains,
+                            args.landmarks)
+    if args.profile:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.runcall(query)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+    else:
+        query()
+    if stats is not None:
+        print(stats.report())
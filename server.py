@@ -0,0 +1,386 @@
+'''
+A long running route server. The map is loaded (and models trained) once,
+then routing requests are answered as JSON lines, either over stdin/stdout
+
+    python server.py
+
+or over a local unix socket
+
+    python server.py --socket /tmp/dbv.sock
+
+A request looks like
+
+    {"id": 1, "source": "stradun", "destination": "436448503", "prediction": "toblers"}
+
+where source and destination are node IDs, street names (matched loosely)
+or positions as "lat,lon" strings or [lat, lon] pairs, prediction is
+one of toblers, linear or nearest, and an optional seed picks the training
+set for the learned models. The answer is
+
+    {"id": 1, "path": [...], "minutes": 12.3}
+
+or {"id": 1, "error": "..."}. A recorded walk can be added with
+
+    {"id": 2, "op": "add_walk", "path": [436448503, "stradun"], "minutes": 7.5}
+
+where path lists the waypoints walked through (anything a source can be).
+The walk is routed like the walk data and the linear prediction is refitted
+on it, in every worker, without retraining from scratch; the answer is
+{"id": 2, "walks": <walks added so far>}.
+
+Answers are written as soon as they are ready,
+so they can come back in a different order than the requests; use id to
+match them up. Searches run in a pool of worker processes, each of which
+loads the map from the cache on start up.
+
+    python server.py --bench requests.jsonl
+
+answers every request in the file and reports throughput and latency.
+'''
+import argparse
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import sys
+import time
+
+import astar
+import batch
+import config
+import models
+import run
+
+
+predictions = ('toblers', 'linear', 'nearest')
+
+
+class RouteService:
+    '''
+    Answers routing requests against one loaded map, a cache.CachedMap as
+    run.load_map returns it. Walks added through add_walk are summed up in
+    the file at added_path, if given, which is how the processes of a
+    Server share them. The searches of at most max_searches
+    (prediction, seed)s are kept, the least recently used going first.
+    '''
+
+    def __init__(self, loaded, added_path=None, max_searches=8):
+        self.map = loaded
+        self.compiled = loaded.compiled
+        self.places = run.make_lookup(loaded)
+        self.max_searches = max_searches
+        self.searches = OrderedDict()
+        self.bases = OrderedDict()
+        self.added_path = added_path
+        self.added = None
+        self.added_stamp = None
+
+    @classmethod
+    def from_files(cls, osm_path, elev_path, cache_path, added_path=None, max_searches=8):
+        return cls(run.load_map(osm_path, elev_path, cache_path), added_path=added_path, max_searches=max_searches)
+
+    def search(self, prediction, seed):
+        '''
+        The (weights, heuristic) for a prediction, prepared on first use.
+        Requests without a seed train on seed 0 so that every worker
+        process answers the same way; toblers doesn't train at all.
+        '''
+        if seed is None or prediction == 'toblers':
+            seed = 0
+        added = self.added_walks() if prediction == 'linear' else None
+
+        def prepare():
+            base = None
+            if prediction == 'linear':
+                # the walk data doesn't change, only the walks added to it
+                base = _remember(self.bases, seed, self.max_searches,
+                                 lambda: run.linear_statistics(self.map.graph, self.map.data, seed))
+            return run.prepare_search(prediction, self.map, seed, added, base)
+        return _remember(self.searches, (prediction, seed), self.max_searches, prepare)
+
+    def added_walks(self):
+        '''
+        The models.IncrementalLinearModel of the walks added so far, or None.
+        It is reloaded whenever another process has added to the file.
+        '''
+        if self.added_path is not None:
+            try:
+                st = os.stat(self.added_path)
+                stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamp = None
+            if stamp != self.added_stamp:
+                self.added = models.IncrementalLinearModel.load(self.added_path) if stamp else None
+                self.added_stamp = stamp
+                self.forget('linear')
+        return self.added
+
+    def forget(self, prediction):
+        for key in [key for key in self.searches if key[0] == prediction]:
+            del self.searches[key]
+
+    def add_walk(self, request):
+        '''Add a recorded walk (a request dict) to the linear model.'''
+        response = {'id': request.get('id')}
+        waypoints = request.get('path')
+        minutes = request.get('minutes')
+        if not isinstance(waypoints, list) or len(waypoints) < 2:
+            response['error'] = 'path must list at least two waypoints'
+            return response
+        if not isinstance(minutes, (int, float)) or isinstance(minutes, bool) or minutes <= 0:
+            response['error'] = 'minutes must be a positive number'
+            return response
+        nodes = [self.places.resolve(w) for w in waypoints]
+        if None in nodes:
+            response['error'] = 'waypoint {} is not a valid node ID, street name or position'.format(nodes.index(None))
+            return response
+        fullpath = batch.route_id_chains(self.map.graph, self.map.data, [nodes], graph=self.compiled)[0]
+        if fullpath is None:
+            response['error'] = 'the walk is impossible'
+            return response
+
+        features, _ = models.walk_features([(fullpath, minutes)], self.map.data)
+        current = self.added_walks()
+        added = models.IncrementalLinearModel(2)
+        if current is not None:
+            added = added + current
+        added.add(features[0, [0, 1]], minutes)
+        if self.added_path is not None:
+            added.save(self.added_path)
+        # picked up from the file (or not) by the next added_walks()
+        self.added = added
+        self.forget('linear')
+        if self.added_path is not None:
+            st = os.stat(self.added_path)
+            self.added_stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        response['walks'] = added.count
+        return response
+
+    def route(self, request):
+        '''Answer one request (a dict) with a response dict.'''
+        if request.get('op') == 'add_walk':
+            return self.add_walk(request)
+        response = {'id': request.get('id')}
+        prediction = request.get('prediction', 'toblers')
+        if prediction not in predictions:
+            response['error'] = 'prediction must be one of {}'.format(', '.join(predictions))
+            return response
+
+        source = self.places.resolve(request.get('source'))
+        if source is None:
+            response['error'] = 'source must be a valid node ID, street name or position'
+            return response
+        dest = self.places.resolve(request.get('destination'))
+        if dest is None:
+            response['error'] = 'destination must be a valid node ID, street name or position'
+            return response
+
+        (weights, heuristic) = self.search(prediction, request.get('seed'))
+        goal = self.compiled.index[dest]
+        result = astar.astar_csr(self.compiled, weights, heuristic(goal), self.compiled.index[source], goal)
+        if result is None:
+            response['error'] = 'no path to destination found'
+            return response
+
+        response['path'] = self.compiled.path_ids(result[0])
+        response['minutes'] = result[1]
+        return response
+
+
+def _remember(lru, key, size, make):
+    # lru[key], made first if it isn't there, dropping the least recently
+    # used entries of the OrderedDict lru beyond size
+    if key in lru:
+        lru.move_to_end(key)
+    else:
+        lru[key] = make()
+        while len(lru) > size:
+            lru.popitem(last=False)
+    return lru[key]
+
+
+_service = None
+
+
+def _init_worker(paths):
+    global _service
+    _service = RouteService.from_files(*paths)
+
+
+def _route_in_worker(request):
+    return _service.route(request)
+
+
+class Server:
+    '''
+    Handles JSON line requests concurrently. With workers > 0 searches run
+    in that many processes, otherwise in this one. At most max_pending
+    requests are in flight at once. Walks are added one at a time, so that
+    each process adds to the latest statistics, while routing carries on.
+    '''
+
+    def __init__(self, paths, workers=os.cpu_count(), max_pending=None):
+        self.paths = paths
+        self.workers = workers
+        if workers:
+            self.pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(paths,))
+            self.service = None
+        else:
+            self.pool = None
+            self.service = RouteService.from_files(*paths)
+        self.pending = asyncio.Semaphore(max_pending or 4 * max(1, workers or 1))
+        self.adding = asyncio.Lock()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    async def answer(self, request):
+        if request.get('op') == 'add_walk':
+            async with self.adding:
+                return await self.route(request)
+        return await self.route(request)
+
+    async def route(self, request):
+        loop = asyncio.get_running_loop()
+        if self.pool is not None:
+            return await loop.run_in_executor(self.pool, _route_in_worker, request)
+        return self.service.route(request)
+
+    async def answer_line(self, line):
+        '''Answer one request line with a response line.'''
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request must be a json object')
+        except ValueError as e:
+            return json.dumps({'id': None, 'error': 'bad request: {}'.format(e)})
+        try:
+            response = await self.answer(request)
+        except Exception as e:
+            response = {'id': request.get('id'), 'error': 'internal error: {}'.format(e)}
+        return json.dumps(response)
+
+    async def serve_stream(self, reader, write):
+        '''Answer request lines from reader, passing response lines to write.'''
+        tasks = set()
+
+        async def handle(line):
+            try:
+                write(await self.answer_line(line))
+            finally:
+                self.pending.release()
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            await self.pending.acquire()
+            task = asyncio.ensure_future(handle(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def serve_stdin(self):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+        def write(line):
+            sys.stdout.write(line + '\n')
+            sys.stdout.flush()
+
+        await self.serve_stream(reader, write)
+
+    async def serve_socket(self, path):
+        async def client(reader, writer):
+            def write(line):
+                writer.write(line.encode('utf-8') + b'\n')
+            try:
+                await self.serve_stream(reader, write)
+                await writer.drain()
+            finally:
+                writer.close()
+
+        server = await asyncio.start_unix_server(client, path)
+        async with server:
+            await server.serve_forever()
+
+    async def benchmark(self, requests):
+        '''
+        Answer every request (dicts) and return a dict with the wall time,
+        throughput, latency percentiles in milliseconds and error count.
+        '''
+        latencies = []
+        errors = 0
+
+        async def timed(request):
+            nonlocal errors
+            async with self.pending:
+                start = time.perf_counter()
+                response = await self.answer(request)
+                latencies.append(time.perf_counter() - start)
+                if 'error' in response:
+                    errors += 1
+
+        # make sure every worker has loaded the map before timing anything
+        await asyncio.gather(*(self.answer({'id': None}) for _ in range(self.workers or 1)))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(timed(request) for request in requests))
+        seconds = time.perf_counter() - start
+
+        latencies.sort()
+        def percentile(p):
+            return 1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0
+        return {
+            'requests': len(requests),
+            'errors': errors,
+            'seconds': seconds,
+            'per_second': len(requests) / seconds if seconds else 0,
+            'p50_ms': percentile(.5),
+            'p95_ms': percentile(.95),
+            'p99_ms': percentile(.99),
+        }
+
+
+def read_requests(path):
+    '''The routing requests (json objects with a source) in a json lines file.'''
+    requests = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                request = json.loads(line)
+                if isinstance(request, dict) and 'source' in request:
+                    requests.append(request)
+    return requests
+
+
+async def main(args):
+    paths = (config.osm_path, config.elev_path, config.cache_path, config.added_walks_path)
+    # compile the cache once up front rather than in every worker
+    run.load_map(*paths[:3])
+    server = Server(paths, args.workers)
+    try:
+        if args.bench:
+            results = await server.benchmark(read_requests(args.bench))
+            print(json.dumps(results))
+        elif args.socket:
+            await server.serve_socket(args.socket)
+        else:
+            await server.serve_stdin()
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='answer walking route requests as json lines.')
+    parser.add_argument('--socket', help='listen on this unix socket instead of stdin')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='search processes (0 to search in the server process)')
+    parser.add_argument('--bench', metavar='REQUESTS', help='answer the requests in this json lines file and report throughput')
+    asyncio.run(main(parser.parse_args()))
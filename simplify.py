@@ -0,0 +1,274 @@
+'''
+Collapsing chains of degree-2 nodes.
+
+build_node_digraph links every consecutive pair of a way's nds, so a curved
+street is a long chain of nodes that only lead on to the next one, and a
+search pops and relaxes them one at a time. Chains.build keeps the nodes
+where something happens (junctions, dead ends and where a one way street
+starts or ends) and joins the edges between them into single edges that
+remember the edges they replace.
+
+Edge costs only depend on the two ends of an edge, so any per edge weights
+(Tobler's, the learned models') summed along the chains give the reduced
+graph's weights, and a path found on it is expanded back into the original
+nodes. Searches may start and end part way along a chain.
+'''
+from heapq import heappush, heappop
+import random
+
+import numpy as np
+
+import astar
+import cache
+import csr
+
+
+inf = float('inf')
+
+
+class Chains:
+    '''
+    A CSRGraph with its chains collapsed. reduced is a CSRGraph of the kept
+    nodes of graph (kept[i] is the index in graph of reduced node i) and
+    reduced edge r stands for the edges
+    edges[offsets[r]:offsets[r + 1]] of graph, in order.
+    '''
+
+    def __init__(self, graph, kept, reduced, offsets, edges):
+        self.graph = graph
+        self.kept = list(kept)
+        self.reduced = reduced
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.edges = np.asarray(edges, dtype=np.int64)
+        self.position = {v: i for i, v in enumerate(self.kept)}
+        self._ends = None
+        self._lists = None
+
+    @classmethod
+    def build(cls, graph):
+        '''Collapse the chains of a CSRGraph.'''
+        offsets, targets = graph.adjacency()
+        roffsets, rsources, _ = graph.reverse_adjacency()
+
+        def passing(v):
+            # whether every way through v comes from one neighbour and goes on
+            # to the other, in one or both directions
+            outs = set(targets[offsets[v]:offsets[v + 1]])
+            ins = set(rsources[roffsets[v]:roffsets[v + 1]])
+            neighbours = outs | ins
+            if len(neighbours) != 2 or v in neighbours:
+                return False
+            (u, w) = neighbours
+            return (u in ins) == (w in outs) and (w in ins) == (u in outs)
+
+        keep = [not passing(v) for v in range(len(graph))]
+        covered = list(keep)
+        chains = []
+
+        def walk(a):
+            walked = set()
+            for e in range(offsets[a], offsets[a + 1]):
+                if targets[e] in walked:
+                    continue # a duplicate edge, which would give the same chain
+                walked.add(targets[e])
+                (previous, v) = (a, targets[e])
+                chain = [e]
+                while not keep[v]:
+                    covered[v] = True
+                    e = next(f for f in range(offsets[v], offsets[v + 1]) if targets[f] != previous)
+                    chain.append(e)
+                    (previous, v) = (v, targets[e])
+                chains.append((a, chain))
+
+        for a in range(len(graph)):
+            if keep[a]:
+                walk(a)
+        # what's left are rings of passing nodes, which need one kept node each
+        for v in range(len(graph)):
+            if not covered[v]:
+                keep[v] = covered[v] = True
+                walk(v)
+
+        kept = [v for v in range(len(graph)) if keep[v]]
+        position = {v: i for i, v in enumerate(kept)}
+        chains.sort(key=lambda chain: position[chain[0]])
+
+        reduced_offsets = np.zeros(len(kept) + 1, dtype=np.int64)
+        np.cumsum(np.bincount([position[a] for (a, _) in chains], minlength=len(kept)), out=reduced_offsets[1:])
+        reduced_targets = [position[targets[chain[-1]]] for (_, chain) in chains]
+        xyz = np.column_stack([graph.x, graph.y, graph.z])[kept]
+        reduced = csr.CSRGraph([graph.ids[v] for v in kept], xyz, reduced_offsets, reduced_targets)
+
+        edge_offsets = np.zeros(len(chains) + 1, dtype=np.int64)
+        np.cumsum([len(chain) for (_, chain) in chains], out=edge_offsets[1:])
+        edges = [e for (_, chain) in chains for e in chain]
+        return cls(graph, kept, reduced, edge_offsets, edges)
+
+    def weights(self, weights):
+        '''The weights of the reduced edges given the weights of the original ones, as a list.'''
+        if len(self.edges) == 0:
+            return []
+        return np.add.reduceat(np.asarray(weights, dtype=np.float64)[self.edges], self.offsets[:-1]).tolist()
+
+    def save(self, path, fingerprint):
+        '''Save to path, tagged with the fingerprint of the graph it was built from.'''
+        arrays = {'kept': np.array(self.kept, dtype=np.int64), 'reduced_offsets': self.reduced.offsets,
+                  'reduced_targets': self.reduced.targets, 'offsets': self.offsets, 'edges': self.edges}
+        cache.save_arrays(path, arrays, {'kind': 'chains', 'fingerprint': fingerprint})
+
+    @classmethod
+    def load(cls, path, graph, fingerprint=None):
+        '''Load the chains of graph from path, or return None if missing or built from another graph.'''
+        loaded = cache.load_arrays(path)
+        if loaded is None:
+            return None
+        meta, arrays = loaded
+        if meta.get('kind') != 'chains' or (fingerprint is not None and meta.get('fingerprint') != fingerprint):
+            return None
+        kept = arrays['kept']
+        xyz = np.column_stack([graph.x, graph.y, graph.z])[kept]
+        ids = graph.ids
+        reduced = csr.CSRGraph([ids[v] for v in kept.tolist()], xyz, arrays['reduced_offsets'], arrays['reduced_targets'])
+        return cls(graph, kept.tolist(), reduced, arrays['offsets'], arrays['edges'])
+
+    def lists(self):
+        if self._lists is None:
+            self._lists = (self.offsets.tolist(), self.edges.tolist())
+        return self._lists
+
+    def along(self, node):
+        '''
+        The list of (reduced edge, i) such that node, a collapsed node of
+        graph, is where the i-th edge of the chain leads to.
+        '''
+        if self._ends is None:
+            self._ends = self.graph.targets[self.edges]
+        found = np.flatnonzero(self._ends == node)
+        chains = np.searchsorted(self.offsets, found, side='right') - 1
+        offsets = self.lists()[0]
+        return [(r, k - offsets[r]) for (r, k) in zip(chains.tolist(), found.tolist())]
+
+    def search(self, weights, reduced_weights, h, start, goal, stats=None):
+        '''
+        A* over the reduced graph from start to goal, which are node
+        indices of the original graph and may be collapsed ones. weights
+        are the original edge weights, reduced_weights self.weights(weights)
+        and h the heuristic over the original nodes. Return (path of
+        original node indices, path_cost) or None, like astar.astar_csr.
+        '''
+        if start == goal:
+            return ([start], 0)
+
+        offsets, edges = self.lists()
+        targets = self.graph.adjacency()[1]
+        roffsets, rtargets = self.reduced.adjacency()
+        kept = self.kept
+
+        def chain_cost(r, begin, end):
+            return sum(weights[e] for e in edges[offsets[r] + begin:offsets[r] + end])
+
+        # where the search starts on the reduced graph, and how it gets there
+        best, best_end = inf, None
+        goal_along = [] if goal in self.position else self.along(goal)
+        seeds = {}
+        if start in self.position:
+            seeds[self.position[start]] = (0, None)
+        else:
+            for (r, i) in self.along(start):
+                head = rtargets[r]
+                cost = chain_cost(r, i + 1, offsets[r + 1] - offsets[r])
+                if cost < seeds.get(head, (inf,))[0]:
+                    seeds[head] = (cost, (r, i))
+                # the goal may be further along the same chain
+                for (q, j) in goal_along:
+                    if q == r and j > i:
+                        cost = chain_cost(r, i + 1, j + 1)
+                        if cost < best:
+                            best, best_end = cost, ('chain', r, i, j)
+
+        # and where it may stop
+        ends = {}
+        if goal in self.position:
+            ends[self.position[goal]] = [(0, None)]
+        else:
+            for (r, j) in goal_along:
+                tail = int(np.searchsorted(self.reduced.offsets, r, side='right')) - 1
+                ends.setdefault(tail, []).append((chain_cost(r, 0, j + 1), (r, j)))
+
+        history = {}
+        path_costs = {}
+        frontier = []
+        for (node, (cost, _)) in seeds.items():
+            path_costs[node] = cost
+            heappush(frontier, (cost + h[kept[node]], node))
+        expanded = 0
+
+        while frontier:
+            (cost, cur_node) = heappop(frontier)
+            if cost >= best:
+                break
+            cur_cost = path_costs[cur_node]
+            if cost > cur_cost + h[kept[cur_node]]:
+                continue
+            expanded += 1
+            for (extra, end) in ends.get(cur_node, ()):
+                if cur_cost + extra < best:
+                    best, best_end = cur_cost + extra, (cur_node, end)
+
+            for r in range(roffsets[cur_node], roffsets[cur_node + 1]):
+                successor = rtargets[r]
+                new_path_cost = cur_cost + reduced_weights[r]
+                if successor not in path_costs or new_path_cost < path_costs[successor]:
+                    history[successor] = (cur_node, r)
+                    path_costs[successor] = new_path_cost
+                    heappush(frontier, (new_path_cost + h[kept[successor]], successor))
+
+        if stats is not None:
+            stats['expanded'] = expanded
+        if best_end is None:
+            return None
+
+        def chain_nodes(r, begin, end):
+            return [targets[e] for e in edges[offsets[r] + begin:offsets[r] + end]]
+
+        path = [start]
+        if best_end[0] == 'chain':
+            (_, r, i, j) = best_end
+            return (path + chain_nodes(r, i + 1, j + 1), best)
+
+        (node, end) = best_end
+        reduced_edges = []
+        while node in history:
+            (node, r) = history[node]
+            reduced_edges.append(r)
+        entry = seeds[node][1]
+        if entry is not None:
+            (r, i) = entry
+            path += chain_nodes(r, i + 1, offsets[r + 1] - offsets[r])
+        for r in reversed(reduced_edges):
+            path += chain_nodes(r, 0, offsets[r + 1] - offsets[r])
+        if end is not None:
+            (r, j) = end
+            path += chain_nodes(r, 0, j + 1)
+        return (path, best)
+
+
+def check_against_astar(graph, weights, chains, count=100, seed=0, rel_tol=1e-9):
+    '''
+    Route count random pairs both with the chains collapsed and with plain
+    A* and return the pairs where the costs disagree (an empty list is good).
+    '''
+    r = random.Random(seed)
+    weights = list(weights)
+    reduced_weights = chains.weights(weights)
+    mismatches = []
+    for _ in range(count):
+        s, t = r.randrange(len(graph)), r.randrange(len(graph))
+        h = astar.heuristic_values(graph, astar.toblers_heuristic, t)
+        expected = astar.astar_csr(graph, weights, h, s, t)
+        got = chains.search(weights, reduced_weights, h, s, t)
+        if (expected is None) != (got is None):
+            mismatches.append((s, t))
+        elif expected is not None and abs(expected[1] - got[1]) > rel_tol * max(1, expected[1]):
+            mismatches.append((s, t))
+    return mismatches
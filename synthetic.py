@@ -0,0 +1,223 @@
+'''
+Synthetic map and elevation files for tests and benchmarks, for when the
+real Dubrovnik extract isn't around or isn't big enough.
+'''
+from collections import defaultdict
+import math
+import random
+
+import numpy as np
+
+from astar import nodedata
+
+
+def hill_elevations(size=3601, seed=0):
+    '''
+    Return a size x size int16 array of smooth, hilly elevations in meters,
+    row 0 being the north edge like in an HGT tile.
+    '''
+    r = random.Random(seed)
+    ys, xs = np.mgrid[0:size, 0:size] / (size - 1)
+    z = np.full((size, size), 50.0)
+    for _ in range(6):
+        cx, cy = r.random(), r.random()
+        height = r.uniform(50, 400)
+        width = r.uniform(0.05, 0.3)
+        z += height * np.exp(-((xs - cx)**2 + (ys - cy)**2) / width**2)
+    return z.astype(np.int16)
+
+
+def write_hgt(path, elevs=None):
+    '''Write an SRTM1 style tile: 3601x3601 big endian shorts.'''
+    if elevs is None:
+        elevs = hill_elevations()
+    np.asarray(elevs, dtype='>i2').tofile(path)
+
+
+def write_osm(path, rows, cols, lat0=42.60, lon0=18.05, spacing=0.0005, buildings=2, seed=0, bends=0):
+    '''
+    Write an OSM 0.6 file with a rows x cols grid of named streets, jittered
+    a little so the geometry isn't perfectly regular. Each grid cell also
+    gets some building outlines whose nodes aren't part of any highway.
+    With bends, streets curve through that many more nodes between every
+    two crossings.
+    '''
+    r = random.Random(seed)
+    next_id = [1]
+
+    def new_id():
+        next_id[0] += 1
+        return next_id[0]
+
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+
+        positions = {}
+
+        def node(lat, lon):
+            nid = new_id()
+            positions[nid] = (lat, lon)
+            f.write('  <node id="{}" lat="{:.7f}" lon="{:.7f}"/>\n'.format(nid, lat, lon))
+            return nid
+
+        grid = [[node(lat0 + i*spacing + r.uniform(-.1, .1)*spacing,
+                      lon0 + j*spacing + r.uniform(-.1, .1)*spacing)
+                 for j in range(cols)] for i in range(rows)]
+
+        outlines = []
+        for i in range(rows):
+            for j in range(cols):
+                for _ in range(buildings):
+                    lat = lat0 + (i + r.uniform(.2, .6))*spacing
+                    lon = lon0 + (j + r.uniform(.2, .6))*spacing
+                    d = spacing / 10
+                    corners = [node(lat, lon), node(lat + d, lon), node(lat + d, lon + d), node(lat, lon + d)]
+                    outlines.append(corners + corners[:1])
+
+        def bent(nds):
+            street = nds[:1]
+            for a, b in zip(nds, nds[1:]):
+                for k in range(1, bends + 1):
+                    t = k / (bends + 1)
+                    street.append(node((1 - t)*positions[a][0] + t*positions[b][0] + r.uniform(-.1, .1)*spacing,
+                                       (1 - t)*positions[a][1] + t*positions[b][1] + r.uniform(-.1, .1)*spacing))
+                street.append(b)
+            return street
+
+        streets = [bent(grid[i]) for i in range(rows)]
+        streets += [bent([grid[i][j] for i in range(rows)]) for j in range(cols)]
+
+        def way(nds, tags):
+            f.write('  <way id="{}">\n'.format(new_id()))
+            for nd in nds:
+                f.write('    <nd ref="{}"/>\n'.format(nd))
+            for k, v in tags:
+                f.write('    <tag k="{}" v="{}"/>\n'.format(k, v))
+            f.write('  </way>\n')
+
+        for i in range(rows):
+            way(streets[i], [('highway', 'residential'), ('name', 'Ulica {}'.format(i))])
+        for j in range(cols):
+            way(streets[rows + j], [('highway', 'footway'), ('name', 'Put {}'.format(j))])
+        for outline in outlines:
+            way(outline, [('building', 'yes')])
+
+        f.write('</osm>\n')
+
+
+def hills(xs, ys, extent, seed=0):
+    '''Smooth hilly elevations in meters at points of a square extent meters wide.'''
+    r = random.Random(seed)
+    z = np.full(np.shape(xs), 20.0)
+    for _ in range(6):
+        cx, cy = r.uniform(0, extent), r.uniform(0, extent)
+        height = r.uniform(30, 250)
+        width = r.uniform(0.05, 0.3) * extent
+        z += height * np.exp(-((xs - cx)**2 + (ys - cy)**2) / width**2)
+    return z
+
+
+def grid_graph(rows, cols, spacing=40.0, drop=0.1, seed=0, bends=0):
+    '''
+    Return (id_digraph, id_to_data) for a jittered rows x cols street grid on
+    hilly ground, with about a fraction drop of the streets missing. Node ids
+    are 1..rows*cols for the crossings; with bends, every street between two
+    crossings curves through that many more nodes, numbered after them.
+    '''
+    r = random.Random(seed)
+    ids = np.arange(1, rows*cols + 1).reshape(rows, cols)
+    ys, xs = np.mgrid[0:rows, 0:cols] * spacing
+    xs = xs + np.array([r.uniform(-.2, .2) for _ in range(rows*cols)]).reshape(rows, cols) * spacing
+    ys = ys + np.array([r.uniform(-.2, .2) for _ in range(rows*cols)]).reshape(rows, cols) * spacing
+    extent = max(rows, cols) * spacing
+    zs = hills(xs, ys, extent, seed)
+
+    id_to_data = {nid: nodedata(x, y, z) for nid, x, y, z in
+                  zip(ids.ravel().tolist(), xs.ravel().tolist(), ys.ravel().tolist(), zs.ravel().tolist())}
+
+    id_digraph = defaultdict(list)
+    pairs = list(zip(ids[:, :-1].ravel().tolist(), ids[:, 1:].ravel().tolist()))
+    pairs += list(zip(ids[:-1, :].ravel().tolist(), ids[1:, :].ravel().tolist()))
+    next_id = rows*cols + 1
+    for a, b in pairs:
+        if r.random() >= drop:
+            street = [a]
+            for k in range(1, bends + 1):
+                t = k / (bends + 1)
+                x = (1 - t)*id_to_data[a].x_m + t*id_to_data[b].x_m + r.uniform(-.1, .1)*spacing
+                y = (1 - t)*id_to_data[a].y_m + t*id_to_data[b].y_m + r.uniform(-.1, .1)*spacing
+                id_to_data[next_id] = nodedata(x, y, float(hills(x, y, extent, seed)))
+                street.append(next_id)
+                next_id += 1
+            street.append(b)
+            for u, v in zip(street, street[1:]):
+                id_digraph[u].append(v)
+                id_digraph[v].append(u)
+
+    return (id_digraph, id_to_data)
+
+
+def geometric_graph(n, spacing=40.0, seed=0):
+    '''
+    Return (id_digraph, id_to_data) for a random geometric graph: n points
+    scattered uniformly over a square on hilly ground, each linked both ways
+    to every point within spacing meters (about six on average). Node ids
+    are 1..n.
+    '''
+    rng = np.random.default_rng(seed)
+    # two points per spacing x spacing cell gives pi * 2 neighbours each
+    side = spacing * math.sqrt(n / 2)
+    cells = max(1, int(side // spacing))
+    xs = rng.uniform(0, side, n)
+    ys = rng.uniform(0, side, n)
+    zs = hills(xs, ys, side, seed)
+
+    # table[cell] lists the points in that cell, padded with -1
+    cx = np.minimum((xs / spacing).astype(np.int64), cells - 1)
+    cy = np.minimum((ys / spacing).astype(np.int64), cells - 1)
+    cell = cx * cells + cy
+    order = np.argsort(cell, kind='stable')
+    counts = np.bincount(cell, minlength=cells*cells)
+    starts = np.cumsum(counts) - counts
+    slot = np.arange(n) - starts[cell[order]]
+    table = np.full((cells*cells, counts.max()), -1, dtype=np.int64)
+    table[cell[order], slot] = order
+
+    sources, targets = [], []
+    grid_x, grid_y = np.divmod(np.arange(cells*cells), cells)
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        ok = (grid_x + dx < cells) & (grid_y + dy >= 0) & (grid_y + dy < cells)
+        a = np.flatnonzero(ok)
+        b = (grid_x[ok] + dx) * cells + grid_y[ok] + dy
+        for i in range(table.shape[1]):
+            for j in range(table.shape[1]):
+                if (dx, dy) == (0, 0) and j <= i:
+                    continue
+                u, v = table[a, i], table[b, j]
+                keep = (u >= 0) & (v >= 0)
+                u, v = u[keep], v[keep]
+                near = (xs[u] - xs[v])**2 + (ys[u] - ys[v])**2 < spacing**2
+                sources.append(u[near])
+                targets.append(v[near])
+
+    id_to_data = {nid: nodedata(x, y, z) for nid, x, y, z in
+                  zip(range(1, n + 1), xs.tolist(), ys.tolist(), zs.tolist())}
+    id_digraph = defaultdict(list)
+    for u, v in zip((np.concatenate(sources) + 1).tolist(), (np.concatenate(targets) + 1).tolist()):
+        id_digraph[u].append(v)
+        id_digraph[v].append(u)
+
+    return (id_digraph, id_to_data)
+
+
+def write_walks(path, ids, count, waypoints=4, seed=0):
+    '''
+    Write count walks in the walk data format, each through waypoints
+    random node ids, with made up times.
+    '''
+    r = random.Random(seed)
+    with open(path, 'w') as f:
+        for i in range(count):
+            nds = [r.choice(ids) for _ in range(waypoints)]
+            f.write(','.join(str(nd) for nd in nds) + ',{},{},walker {},{}\n'.format(
+                r.randrange(5, 60), r.randrange(60), i % 5, i % 2))
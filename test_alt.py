@@ -0,0 +1,61 @@
+import math
+import random
+
+from alt import *
+import astar
+import csr
+import synthetic
+
+
+def setup(rows=30, cols=30):
+    graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(rows, cols, drop=0.2))
+    weights = astar.edge_weights(graph, astar.toblers).tolist()
+    return graph, weights
+
+
+def path_cost(graph, weights, path):
+    offsets, targets = graph.adjacency()
+    total = 0
+    for a, b in zip(path, path[1:]):
+        total += min(weights[e] for e in range(offsets[a], offsets[a + 1]) if targets[e] == b)
+    return total
+
+
+def test_alt_matches_plain_astar():
+    graph, weights = setup()
+    landmarks = Landmarks.build(graph, weights, count=6)
+    r = random.Random(0)
+    plain_expanded = alt_expanded = 0
+
+    for _ in range(40):
+        s, t = r.randrange(len(graph)), r.randrange(len(graph))
+        stats = {}
+        expected = astar.astar_csr(graph, weights, astar.heuristic_values(graph, astar.toblers_heuristic, t), s, t, stats)
+        plain_expanded += stats['expanded']
+
+        got = astar.astar_csr(graph, weights, heuristic(graph, landmarks, t, s), s, t, stats)
+        alt_expanded += stats['expanded']
+        bidirectional = bidirectional_astar(graph, weights, landmarks, s, t, active=3)
+
+        if expected is None:
+            assert got is None and bidirectional is None
+            continue
+        for (path, cost) in (got, bidirectional):
+            assert math.isclose(cost, expected[1], rel_tol=1e-9)
+            assert (path[0], path[-1]) == (s, t)
+            assert math.isclose(path_cost(graph, weights, path), cost, rel_tol=1e-9)
+
+    assert alt_expanded < plain_expanded
+
+
+def test_save_and_load(tmp_path):
+    graph, weights = setup(8, 8)
+    landmarks = Landmarks.build(graph, weights, count=3)
+    path = str(tmp_path / 'landmarks')
+    landmarks.save(path, graph.fingerprint())
+    other, _ = setup(8, 9)
+    assert Landmarks.load(path, other.fingerprint()) is None
+    loaded = Landmarks.load(path, graph.fingerprint())
+    assert loaded.landmarks == landmarks.landmarks
+    assert (loaded.to_landmark == landmarks.to_landmark).all()
+    assert (loaded.lower_bounds_to(5) == landmarks.lower_bounds_to(5)).all()
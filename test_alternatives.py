@@ -0,0 +1,107 @@
+import math
+import random
+
+from alternatives import *
+import astar
+import batch
+import csr
+import synthetic
+
+
+def setup(rows, cols):
+    graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(rows, cols, drop=0.2, seed=3))
+    weights = astar.edge_weights(graph, astar.toblers).tolist()
+    return graph, weights
+
+
+def simple_paths(graph, weights, start, goal, limit):
+    # every loopless path costing at most limit, by brute force
+    offsets, targets = graph.adjacency()
+    found = []
+    def walk(node, visited, cost):
+        if cost > limit:
+            return
+        if node == goal:
+            found.append(cost)
+            return
+        for e in range(offsets[node], offsets[node + 1]):
+            if targets[e] not in visited:
+                walk(targets[e], visited | {targets[e]}, cost + weights[e])
+    walk(start, {start}, 0)
+    return sorted(found)
+
+
+def check_path(graph, weights, path, cost, start, goal):
+    # check path is a loopless path from start to goal costing cost, and
+    # return its edges
+    offsets, targets = graph.adjacency()
+    assert (path[0], path[-1]) == (start, goal)
+    assert len(set(path)) == len(path)
+    edges = []
+    for (a, b) in zip(path, path[1:]):
+        edges.append(min((e for e in range(offsets[a], offsets[a + 1]) if targets[e] == b), key=weights.__getitem__))
+    assert math.isclose(sum(weights[e] for e in edges), cost, rel_tol=1e-9)
+    return edges
+
+
+def test_k_shortest_matches_brute_force():
+    graph, weights = setup(5, 5)
+    r = random.Random(1)
+    for _ in range(20):
+        start, goal = r.randrange(len(graph)), r.randrange(len(graph))
+        best = reverse_tree(graph, weights, goal)[0][start]
+        got = k_shortest(graph, weights, start, goal, k=6, max_stretch=1.3)
+        if math.isinf(best):
+            assert got == []
+            continue
+        expected = simple_paths(graph, weights, start, goal, best * 1.3 + 1e-9)[:6]
+        assert len(got) == len(expected)
+        for (path, cost), c in zip(got, expected):
+            assert math.isclose(cost, c, rel_tol=1e-9)
+            check_path(graph, weights, path, cost, start, goal)
+
+
+def test_alternatives_are_distinct():
+    graph, weights = setup(30, 30)
+    lengths = graph.edge_features()[0].tolist()
+    r = random.Random(2)
+    for _ in range(10):
+        start, goal = r.randrange(len(graph)), r.randrange(len(graph))
+        best = reverse_tree(graph, weights, goal)[0][start]
+        if math.isinf(best) or start == goal:
+            continue
+        h = astar.heuristic_values(graph, astar.toblers_heuristic, goal)
+        for got in (alternatives(graph, weights, start, goal, k=3, max_overlap=0.6, max_stretch=1.4),
+                    alternatives(graph, weights, start, goal, k=3, max_overlap=0.6, max_stretch=1.4, h=h)):
+            assert len(got) > 1
+            assert math.isclose(got[0][1], best, rel_tol=1e-9)
+            routes = []
+            for (path, cost) in got:
+                assert cost <= best * 1.4 + 1e-9
+                edges = check_path(graph, weights, path, cost, start, goal)
+                total = sum(lengths[e] for e in edges)
+                for other in routes:
+                    assert sum(lengths[e] for e in edges if e in other) <= 0.6 * total
+                routes.append(set(edges))
+
+
+def test_route_alternatives_matches_alternatives():
+    graph, weights = setup(20, 20)
+    r = random.Random(3)
+    pairs = [(r.randrange(len(graph)), r.randrange(len(graph))) for _ in range(8)]
+    pairs += [(r.randrange(len(graph)), pairs[0][1]) for _ in range(4)]
+    for (s, t), got in zip(pairs, batch.route_alternatives(graph, weights, pairs, k=3)):
+        assert got == alternatives(graph, weights, s, t, k=3)
+
+
+def test_route_alternatives_with_heuristic():
+    graph, weights = setup(20, 20)
+    (weights, heuristic) = astar.learned_search(graph, weights)
+    r = random.Random(4)
+    pairs = [(r.randrange(len(graph)), r.randrange(len(graph))) for _ in range(8)]
+    pairs += [(r.randrange(len(graph)), pairs[0][1]) for _ in range(4)]
+    for (s, t), got in zip(pairs, batch.route_alternatives(graph, weights, pairs, k=3, heuristic=heuristic)):
+        expected = alternatives(graph, weights, s, t, k=3, h=heuristic(t))
+        assert [path for (path, _) in got] == [path for (path, _) in expected]
+        for (_, cost), (_, c) in zip(got, expected):
+            assert math.isclose(cost, c, rel_tol=1e-9)
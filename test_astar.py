@@ -23,3 +23,185 @@ def test_a_star():
 
     (optimal_path, cost) = astar(toblers, toblers_heuristic, id_digraph, id_to_data, 'A', 'E')
     assert optimal_path == ['A', 'B', 'D', 'E']
+
+
+def toy_graph():
+    id_digraph = {
+        'A': ['B', 'G'],
+        'B': ['A', 'C', 'G', 'D'],
+        'C': ['B', 'D'],
+        'D': ['C', 'B', 'F', 'E'],
+        'E': ['D', 'F'],
+        'F': ['E', 'D', 'G'],
+        'G': ['A', 'B', 'F']
+    }
+
+    id_to_data = {
+        'A': nodedata(0, 0, 0),
+        'B': nodedata(0, 1, 3),
+        'C': nodedata(0, 2, 0),
+        'D': nodedata(2, 2, 1),
+        'E': nodedata(3, 2, 0),
+        'F': nodedata(2, -1, 0),
+        'G': nodedata(1, 0, 2),
+    }
+    return id_digraph, id_to_data
+
+
+def test_vectorized_costs_match():
+    id_digraph, id_to_data = toy_graph()
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    offsets, targets = graph.adjacency()
+    for costfunc in (toblers, euclidean):
+        weights = edge_weights(graph, costfunc)
+        for i, nid in enumerate(graph.ids):
+            for e in range(offsets[i], offsets[i + 1]):
+                expected = costfunc(id_to_data[nid], id_to_data[graph.ids[targets[e]]])
+                assert math.isclose(weights[e], expected, rel_tol=1e-12)
+
+
+def test_astar_csr():
+    id_digraph, id_to_data = toy_graph()
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    weights = edge_weights(graph, toblers).tolist()
+    goal = graph.index['E']
+    h = heuristic_values(graph, toblers_heuristic, goal)
+    (path, cost) = astar_csr(graph, weights, h, graph.index['A'], goal)
+    assert (graph.path_ids(path), cost) == astar(toblers, toblers_heuristic, id_digraph, id_to_data, 'A', 'E')
+
+
+def test_trivial_and_missing_endpoints():
+    id_digraph, id_to_data = toy_graph()
+    assert astar(toblers, toblers_heuristic, id_digraph, id_to_data, 'A', 'A') == (['A'], 0)
+    assert astar(toblers, toblers_heuristic, id_digraph, id_to_data, 'A', 'Z') is None
+
+
+def test_graph_changes_are_seen():
+    id_digraph, id_to_data = toy_graph()
+    assert astar(toblers, toblers_heuristic, id_digraph, id_to_data, 'A', 'E')[0] != ['A', 'E']
+    id_digraph['A'].append('E')
+    direct = astar(toblers, toblers_heuristic, id_digraph, id_to_data, 'A', 'E')
+    assert direct == (['A', 'E'], toblers(id_to_data['A'], id_to_data['E']))
+    id_to_data['E'] = nodedata(3, 2, 2)
+    climb = astar(toblers, toblers_heuristic, id_digraph, id_to_data, 'A', 'E')
+    assert climb[1] != direct[1]
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    assert astar(toblers, toblers_heuristic, None, None, 'A', 'E', graph=graph) == climb
+
+
+def test_model_edge_weights():
+    import models
+    id_digraph, id_to_data = toy_graph()
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    model = models.LinearModel([2.0, 0.5])
+    weights = model_edge_weights(graph, model)
+    offsets, targets = graph.adjacency()
+    for i, nid in enumerate(graph.ids):
+        for e in range(offsets[i], offsets[i + 1]):
+            a, b = id_to_data[nid], id_to_data[graph.ids[targets[e]]]
+            assert math.isclose(weights[e], model([euclidean(a, b), b.z_m - a.z_m]))
+
+
+def test_learned_search_is_optimal_and_expands_less():
+    import models
+    import synthetic
+    graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(20, 20, seed=3))
+    dist, dz = graph.edge_features()
+    examples = [(x, 0.02*x[0] + 0.002*x[1] + 0.001*(i % 7)) for i, x in enumerate(zip(dist[:200], dz[:200]))]
+    for model in (models.linear_model(examples), models.nearest_neighbor_model(examples)):
+        (weights, heuristic) = learned_search(graph, model_edge_weights(graph, model), model)
+        assert min(weights) >= 0
+        for (s, t) in ((0, len(graph) - 1), (17, 342), (390, 5)):
+            informed, blind = {}, {}
+            result = astar_csr(graph, weights, heuristic(t), s, t, informed)
+            expected = astar_csr(graph, weights, [0] * len(graph), s, t, blind)
+            assert math.isclose(result[1], expected[1], rel_tol=1e-9)
+            assert informed['expanded'] <= blind['expanded']
+            assert all(h <= d + 1e-9 for h, d in zip(heuristic(t), dijkstra_to(graph, weights, t)))
+
+
+def test_learned_search_negative_costs():
+    import models
+    import synthetic
+    graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(12, 12, seed=1))
+    # steep enough that going downhill costs less than nothing
+    model = models.LinearModel([0.01, 0.5])
+    raw = model_edge_weights(graph, model)
+    assert min(raw) < 0
+    (weights, heuristic) = learned_search(graph, raw, model)
+    assert weights == list(raw)
+    t = len(graph) - 1
+    d = bellman_ford_to(graph, weights, t)
+    for s in (0, 30, 77):
+        assert math.isclose(astar_csr(graph, weights, heuristic(t), s, t)[1], d[s], rel_tol=1e-9, abs_tol=1e-9)
+
+    (weights, heuristic) = learned_search(graph, raw, models.LinearModel([-0.01, 0.5]))
+    assert min(weights) >= 0
+
+
+def dijkstra_to(graph, weights, t):
+    roffsets, rsources, redges = graph.reverse()
+    rweights = np.asarray(weights)[redges].tolist()
+    return dijkstra(roffsets.tolist(), rsources.tolist(), rweights, [t])
+
+
+def bellman_ford_to(graph, weights, t):
+    d = [float('inf')] * len(graph)
+    d[t] = 0
+    sources = graph.edge_sources().tolist()
+    targets = graph.targets.tolist()
+    for _ in range(len(graph)):
+        changed = False
+        for e, (u, v) in enumerate(zip(sources, targets)):
+            if d[v] + weights[e] < d[u]:
+                d[u] = d[v] + weights[e]
+                changed = True
+        if not changed:
+            break
+    return d
+
+
+def test_search_stats():
+    import synthetic
+    graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(15, 15, seed=4))
+    weights = edge_weights(graph, toblers).tolist()
+    # an inconsistent heuristic, so that nodes get reached more cheaply
+    # after they have been expanded
+    h = [3 * v for v in heuristic_values(graph, toblers_heuristic, 200)]
+    stats = SearchStats()
+    assert astar_csr(graph, weights, h, 3, 200, stats) == astar_csr(graph, weights, h, 3, 200)
+    assert stats['pops'] == stats['expanded'] + stats['stale'] + 1
+    assert stats['pushes'] >= stats['pops']
+    assert stats['stale'] > 0
+
+    stats = SearchStats()
+    astar_csr(graph, weights, heuristic_values(graph, toblers_heuristic, 200), 3, 200, stats)
+    assert stats['reexpanded'] == 0
+    # building the path is part of the search, not a phase inside it
+    assert stats['phases'] == {}
+
+
+def test_queues_agree():
+    import synthetic
+    graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(20, 20, seed=5))
+    weights = edge_weights(graph, toblers).tolist()
+    for (s, t) in ((0, 399), (45, 310), (399, 0)):
+        h = heuristic_values(graph, toblers_heuristic, t)
+        expected = astar_csr(graph, weights, h, s, t)
+        for queue, width in (('heap', None), ('indexed', None), ('bucket', None), ('bucket', 0.01), ('bucket', 100)):
+            result = astar_csr(graph, weights, h, s, t, queue=queue, width=width)
+            assert math.isclose(result[1], expected[1], rel_tol=1e-12)
+            assert result[0][0] == s and result[0][-1] == t
+
+    id_digraph, id_to_data = toy_graph()
+    stats = SearchStats()
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    astar(euclidean, euclidean, None, None, 'A', 'E', stats, graph)
+    assert graph.num_edges() < stats['cost_calls'] <= graph.num_edges() + len(graph)
+    assert set(stats['phases']) == {'compile', 'search', 'path'}
+    assert 'expanded' in stats.report()
+
+    # the weights are kept on the graph, so only the heuristic is evaluated again
+    again = SearchStats()
+    astar(euclidean, euclidean, None, None, 'A', 'E', again, graph)
+    assert again['cost_calls'] == stats['cost_calls'] - graph.num_edges()
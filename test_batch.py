@@ -0,0 +1,45 @@
+import math
+import models
+import random
+
+from batch import *
+import synthetic
+
+
+def setup():
+    id_digraph, id_to_data = synthetic.grid_graph(15, 15, drop=0.3)
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    weights = astar.edge_weights(graph, astar.toblers).tolist()
+    return id_digraph, id_to_data, graph, weights
+
+
+def test_route_many_matches_astar():
+    id_digraph, id_to_data, graph, weights = setup()
+    r = random.Random(0)
+    sources = [r.randrange(len(graph)) for _ in range(4)]
+    pairs = [(r.choice(sources), r.randrange(len(graph))) for _ in range(60)]
+
+    for (s, t), got in zip(pairs, route_many(graph, weights, pairs)):
+        h = astar.heuristic_values(graph, astar.toblers_heuristic, t)
+        expected = astar.astar_csr(graph, weights, h, s, t)
+        if expected is None:
+            assert got is None
+        else:
+            assert math.isclose(got[1], expected[1], rel_tol=1e-12)
+            assert (got[0][0], got[0][-1]) == (s, t)
+
+
+def test_route_id_chains_matches_construct_full_path():
+    id_digraph, id_to_data, graph, weights = setup()
+    r = random.Random(1)
+    ids = list(id_digraph)
+    chains = [[r.choice(ids) for _ in range(r.randint(2, 4))] for _ in range(20)]
+    chains.append([ids[0], 10**9])
+
+    for chain, got in zip(chains, route_id_chains(id_digraph, id_to_data, chains)):
+        expected = models.construct_full_path(chain, id_digraph, id_to_data)
+        if expected is None:
+            assert got is None
+        else:
+            assert len(got) == len(expected)
+            assert [got[0], got[-1]] == [expected[0], expected[-1]]
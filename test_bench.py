@@ -0,0 +1,29 @@
+import itertools
+import json
+
+from bench import *
+
+
+def test_geometric_graph_links_every_close_pair():
+    (id_digraph, id_to_data) = synthetic.geometric_graph(300, spacing=40.0, seed=2)
+    expected = set()
+    for a, b in itertools.combinations(id_to_data, 2):
+        if (id_to_data[a].x_m - id_to_data[b].x_m)**2 + (id_to_data[a].y_m - id_to_data[b].y_m)**2 < 40.0**2:
+            expected.update([(a, b), (b, a)])
+    assert {(a, b) for a in id_digraph for b in id_digraph[a]} == expected
+
+
+def test_suite_results_are_json_and_comparable(monkeypatch):
+    monkeypatch.setattr(config, 'osm_path', 'no such file')
+    results = suite([100], ['grid', 'geometric'], queries=5, walks=3)
+    results = json.loads(json.dumps(results))
+    benchmarks = {(e['benchmark'], e['graph'], e.get('prediction')) for e in results['results']}
+    for kind in ('grid', 'geometric'):
+        for prediction in ('toblers', 'linear', 'nearest'):
+            assert ('query', kind, prediction) in benchmarks
+        assert ('batch', kind, None) in benchmarks
+        assert ('walks', kind, None) in benchmarks
+    assert ('load_streaming', 'osm', None) in benchmarks
+    assert ('elevation', 'points', None) in benchmarks
+    changes = compare(results, results)
+    assert changes and all(old == new for (_, _, old, new) in changes)
@@ -0,0 +1,94 @@
+from collections import defaultdict
+import os
+
+from cache import *
+import run
+
+
+OSM = '''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="42.64" lon="18.10"/>
+  <node id="2" lat="42.65" lon="18.11"/>
+  <node id="3" lat="42.66" lon="18.11"/>
+  <way id="10">
+    <nd ref="1"/>
+    <nd ref="2"/>
+    <nd ref="3"/>
+    <tag k="highway" v="footway"/>
+    <tag k="name" v="Stradun"/>
+  </way>
+</osm>
+'''
+
+
+def write_map(tmp_path):
+    osm_path = str(tmp_path / 'map.osm')
+    elev_path = str(tmp_path / 'N42E018.HGT')
+    with open(osm_path, 'w') as f:
+        f.write(OSM)
+    np.full(3601*3601, 100, dtype='>i2').tofile(elev_path)
+    return osm_path, elev_path
+
+
+def small_map():
+    graph = defaultdict(list, {1: [2], 2: [1, 3], 3: [2]})
+    ways = {'stradun': [1, 2, 3]}
+    data = {
+        1: nodedata(0.0, 0.0, 1.0),
+        2: nodedata(1.0, 0.0, 2.0),
+        3: nodedata(1.0, 1.0, 3.0),
+    }
+    return graph, ways, data
+
+
+def test_roundtrip(tmp_path):
+    path = str(tmp_path / 'map.cache')
+    graph, ways, data = small_map()
+    write_graph_cache(path, graph, ways, data, [])
+    assert tuple(read_graph_cache(path)) == (graph, ways, data)
+
+
+def test_stale_stamp_is_rejected(tmp_path):
+    path = str(tmp_path / 'map.cache')
+    source = tmp_path / 'map.osm'
+    source.write_text('a')
+    stamp = source_stamp([str(source)])
+    write_graph_cache(path, *small_map(), stamp)
+    assert read_graph_cache(path, stamp) is not None
+
+    source.write_text('ab')
+    assert read_graph_cache(path, source_stamp([str(source)])) is None
+
+
+def test_missing_or_foreign_file(tmp_path):
+    path = tmp_path / 'map.cache'
+    assert read_graph_cache(str(path)) is None
+    path.write_bytes(b'not a cache')
+    assert read_graph_cache(str(path)) is None
+
+
+def test_load_map_uses_cache(tmp_path, monkeypatch):
+    osm_path, elev_path = write_map(tmp_path)
+    cache_path = str(tmp_path / 'map.cache')
+
+    compiled = run.load_map(osm_path, elev_path, cache_path)
+    assert os.path.exists(cache_path)
+
+    def fail(*args):
+        raise AssertionError('map should have come from the cache')
+    monkeypatch.setattr(run, 'read_xml_streaming', fail)
+    load = run.load_map(osm_path, elev_path, cache_path)
+    assert tuple(load) == tuple(compiled)
+    assert load.compiled.fingerprint() == compiled.compiled.fingerprint()
+
+
+def test_cached_map_builds_dicts_on_demand(tmp_path):
+    path = str(tmp_path / 'map.cache')
+    graph, ways, data = small_map()
+    write_graph_cache(path, graph, ways, data, [])
+    cached = read_graph_cache(path)
+    assert cached.compiled.ids == [1, 2, 3]
+    assert cached._dicts is None
+    assert cached.ways == ways
+    assert cached._dicts is None
+    assert (cached.graph, cached.data) == (graph, data)
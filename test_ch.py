@@ -0,0 +1,40 @@
+from ch import *
+import csr
+import synthetic
+
+
+def setup(rows=20, cols=20):
+    graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(rows, cols, drop=0.2))
+    weights = astar.edge_weights(graph, astar.toblers).tolist()
+    return graph, weights
+
+
+def test_matches_astar():
+    graph, weights = setup()
+    hierarchy = ContractionHierarchy.build(graph, weights)
+    assert check_against_astar(graph, weights, hierarchy, count=150) == []
+
+
+def test_paths_are_unpacked():
+    graph, weights = setup()
+    hierarchy = ContractionHierarchy.build(graph, weights)
+    offsets, targets = graph.adjacency()
+    for (s, t) in [(0, len(graph) - 1), (5, 250), (390, 12)]:
+        (path, cost) = hierarchy.query(s, t)
+        assert (path[0], path[-1]) == (s, t)
+        total = 0
+        for a, b in zip(path, path[1:]):
+            total += min(weights[e] for e in range(offsets[a], offsets[a + 1]) if targets[e] == b)
+        assert abs(total - cost) < 1e-9
+        assert hierarchy.route(graph.ids[s], graph.ids[t]) == (graph.path_ids(path), cost)
+
+
+def test_save_and_load(tmp_path):
+    graph, weights = setup(6, 6)
+    hierarchy = ContractionHierarchy.build(graph, weights)
+    path = str(tmp_path / 'map.ch')
+    hierarchy.save(path, graph.fingerprint())
+
+    assert ContractionHierarchy.load(path, 'another graph') is None
+    loaded = ContractionHierarchy.load(path, graph.fingerprint())
+    assert loaded.query(0, 35) == hierarchy.query(0, 35)
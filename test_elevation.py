@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from elevation import *
+import run
+import synthetic
+
+
+def test_tile_name():
+    assert tile_name(42, 18) == 'N42E018.HGT'
+    assert tile_name(-1, -72) == 'S01W072.HGT'
+
+
+def write_tiles(tmp_path, rng):
+    '''Cut two SRTM3 tiles side by side out of one 1201x2401 grid.'''
+    whole = rng.integers(0, 1000, size=(1201, 2401)).astype(np.int16)
+    synthetic.write_hgt(str(tmp_path / 'N42E018.HGT'), whole[:, :1201])
+    synthetic.write_hgt(str(tmp_path / 'n42e019.hgt'), whole[:, 1200:])
+    return whole
+
+
+def test_interpolates_across_seam(tmp_path):
+    rng = np.random.default_rng(0)
+    whole = write_tiles(tmp_path, rng).astype(np.float64)
+    provider = ElevationProvider(str(tmp_path))
+
+    lats = rng.uniform(42, 43, 300)
+    lons = np.concatenate([rng.uniform(18.99, 19.01, 200), rng.uniform(18, 20, 99), [19]])
+    got = provider.elevations(lats, lons)
+
+    rows = (43 - lats) * 1200
+    cols = (lons - 18) * 1200
+    r1, c1 = np.floor(rows).astype(int), np.floor(cols).astype(int)
+    r2, c2 = np.minimum(r1 + 1, 1200), np.minimum(c1 + 1, 2400)
+    fr, fc = rows - r1, cols - c1
+    top = fc*whole[r1, c2] + (1 - fc)*whole[r1, c1]
+    bottom = fc*whole[r2, c2] + (1 - fc)*whole[r2, c1]
+    assert np.allclose(got, fr*bottom + (1 - fr)*top)
+
+
+def test_missing_tiles_and_lru(tmp_path):
+    write_tiles(tmp_path, np.random.default_rng(1))
+    provider = ElevationProvider(str(tmp_path), max_open=1, missing=-1)
+
+    assert provider.elevation(10.5, 10.5) == -1
+    provider.elevations([42.5, 42.5], [18.5, 19.5])
+    assert list(provider.tiles) == [(42, 19)]
+
+
+def test_no_tiles_for_the_map(tmp_path):
+    write_tiles(tmp_path, np.random.default_rng(3))
+    provider = ElevationProvider(str(tmp_path))
+    provider.check_coverage(np.array([41.5, 42.5]), np.array([17.5, 18.5]))
+    with pytest.raises(IOError):
+        provider.check_coverage(np.array([10.5, 11.5]), np.array([10.5, 10.6]))
+
+    osm_path = str(tmp_path / 'map.osm')
+    synthetic.write_osm(osm_path, 3, 3)
+    empty = tmp_path / 'empty'
+    empty.mkdir()
+    with pytest.raises(IOError):
+        run.read_xml_streaming(osm_path, str(empty))
+
+
+def test_agrees_with_single_tile_lookup(tmp_path):
+    rng = np.random.default_rng(2)
+    elevs = rng.integers(0, 1000, size=(3601, 3601)).astype(np.int16)
+    synthetic.write_hgt(str(tmp_path / 'N42E018.HGT'), elevs)
+    provider = ElevationProvider(str(tmp_path))
+
+    lats = rng.uniform(42.01, 42.99, 100)
+    lons = rng.uniform(18.01, 18.99, 100)
+    expected = run.lerped_elevations(elevs, lats, lons)
+    assert np.allclose(provider.elevations(lats, lons), expected)
@@ -0,0 +1,69 @@
+from graphics import *
+from astar import nodedata
+
+
+def at(u, v):
+    # the node data that norm maps to (u, 1 - v)
+    return nodedata((18 + u) * m_per_lon, (42 + v) * m_per_lat, 0)
+
+
+def undirected(edges):
+    id_digraph = defaultdict(list)
+    for (a, b) in edges:
+        id_digraph[a].append(b)
+        id_digraph[b].append(a)
+    return id_digraph
+
+
+def endpoints(line):
+    return {tuple(round(c, 6) for c in line[0]), tuple(round(c, 6) for c in line[-1])}
+
+
+def test_create_lines_merges_chains():
+    # a T: a street 1-2-3-4 with a branch 3-5-6
+    id_to_data = {1: at(0.1, 0.1), 2: at(0.2, 0.1), 3: at(0.3, 0.1), 4: at(0.4, 0.1),
+                  5: at(0.3, 0.2), 6: at(0.3, 0.3)}
+    lines = create_lines(undirected([(1, 2), (2, 3), (3, 4), (3, 5), (5, 6)]), id_to_data)
+    assert sorted(len(line) for line in lines) == [2, 3, 3]
+    assert sum(len(line) - 1 for line in lines) == 5
+    junction = tuple(round(c, 6) for c in norm(id_to_data[3].x_m, id_to_data[3].y_m))
+    assert all(junction in endpoints(line) for line in lines)
+
+
+def test_create_lines_loops():
+    # a ring on its own, and a ring hanging off a street
+    id_to_data = {i: at(0.1 * i, 0.5 + 0.05 * (i % 2)) for i in range(1, 10)}
+    ring = [(1, 2), (2, 3), (3, 4), (4, 1)]
+    lasso = [(5, 6), (6, 7), (7, 8), (8, 9), (9, 6)]
+    lines = create_lines(undirected(ring + lasso), id_to_data)
+    assert sum(len(line) - 1 for line in lines) == len(ring) + len(lasso)
+    assert sorted(len(line) for line in lines) == [2, 5, 5]
+    for line in lines:
+        if len(line) == 5:
+            assert line[0] == line[-1]
+
+
+def test_create_lines_skips_unknown_nodes():
+    id_to_data = {1: at(0.1, 0.1), 2: at(0.2, 0.1)}
+    lines = create_lines({1: [2, 3], 2: [1], 3: [1]}, id_to_data)
+    assert len(lines) == 1 and len(lines[0]) == 2
+
+
+def test_simplify():
+    line = [(0, 0), (0.001, 0), (0.002, 0.001), (0.5, 0), (0.501, 0), (1, 1)]
+    assert simplify(line, 0.01) == [(0, 0), (0.5, 0), (1, 1)]
+    assert simplify(line, 0) == line
+    assert simplify([(0, 0), (0.001, 0.001), (0.002, 0)], 0.01) is None
+    assert simplify([(0, 0), (0.001, 0.001), (0.02, 0)], 0.01) == [(0, 0), (0.02, 0)]
+
+
+def test_line_grid_query():
+    lines = [[(0.1, 0.1), (0.2, 0.1)], [(0.8, 0.8), (0.9, 0.9)], [(0.1, 0.5), (0.9, 0.5)]]
+    grid = LineGrid(lines, cells=10)
+    assert grid.query(0.05, 0.05, 0.25, 0.15) == [0]
+    assert grid.query(0.75, 0.75, 0.95, 0.95) == [1]
+    assert grid.query(0.45, 0.45, 0.55, 0.55) == [2]
+    assert grid.query(0.0, 0.0, 1.0, 1.0) == [0, 1, 2]
+    assert grid.query(0.5, 0.1, 0.6, 0.2) == []
+    # boxes past the unit square are clamped to it
+    assert grid.query(-1, -1, 0.15, 0.15) == [0]
@@ -0,0 +1,56 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+from isochrone import *
+import csr
+import synthetic
+
+
+def setup():
+    graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(12, 12, drop=0.2, seed=3))
+    weights = astar.edge_weights(graph, astar.toblers).tolist()
+    return graph, weights
+
+
+def test_travel_times_match_astar():
+    graph, weights = setup()
+    budget = 5.0
+    times = travel_times(graph, weights, [0], budget)
+    for t in range(len(graph)):
+        result = astar.astar_csr(graph, weights, [0] * len(graph), 0, t)
+        if result is None or result[1] > budget:
+            assert math.isinf(times[t])
+        else:
+            assert math.isclose(times[t], result[1], rel_tol=1e-12)
+
+
+def test_several_sources_take_the_nearest():
+    graph, weights = setup()
+    a = travel_times(graph, weights, [0])
+    b = travel_times(graph, weights, [143])
+    assert np.allclose(travel_times(graph, weights, [0, 143]), np.minimum(a, b))
+
+
+def test_reachable_edges_and_export(tmp_path):
+    graph, weights = setup()
+    times = travel_times(graph, weights, [60], 3.0)
+    edges = reachable_edges(graph, weights, times, 3.0)
+    sources = graph.edge_sources()
+    for e in range(graph.num_edges()):
+        assert (e in edges) == (times[sources[e]] + weights[e] <= 3.0)
+
+    collection = edges_geojson(graph, edges, times, 111000, 82000)
+    path = str(tmp_path / 'edges.geojson')
+    write_geojson(path, collection)
+    with open(path) as f:
+        assert len(json.load(f)['features']) == len(edges)
+
+
+def test_negative_weights_are_rejected():
+    graph, weights = setup()
+    weights[5] = -0.1
+    with pytest.raises(ValueError):
+        travel_times(graph, weights, [0], 3.0)
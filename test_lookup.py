@@ -0,0 +1,68 @@
+import random
+
+from lookup import *
+from astar import nodedata
+import csr
+
+
+def small_map():
+    graph = {1: [2], 2: [1, 3], 3: [2, 4], 4: [3], 5: []}
+    data = {1: nodedata(0, 0, 0), 2: nodedata(10, 0, 0), 3: nodedata(10, 10, 0), 4: nodedata(0, 10, 0), 5: nodedata(1, 1, 0)}
+    ways = {'ulica od puča': [5, 1, 2, 2, 3], 'stradun': [3, 4], 'put': [5]}
+    return Lookup(graph, ways, data, 100, 10)
+
+
+def test_names():
+    places = small_map()
+    assert places.resolve('Ulica Od Puca') == 1
+    assert places.resolve('ulica') == 1
+    assert places.resolve('stradnu') == 3
+    assert places.resolve(' STRADUN ') == 3
+    assert places.resolve('put') is None
+    assert places.resolve('nowhere') is None
+    assert places.prefixed('s') == ['stradun']
+
+
+def test_fuzzy_matches_are_bounded():
+    places = small_map()
+    for i in range(3000):
+        places.resolve('stradnu{}'.format(i))
+    assert places._fuzzy.cache_info().currsize == 1024
+    assert places.resolve('stradnu') == 3
+
+
+def test_ids_and_positions():
+    places = small_map()
+    assert places.resolve('4') == 4
+    assert places.resolve(5) is None
+    assert places.resolve('0.09,0.9') == 3
+    assert places.resolve([0.01, 0.1]) == 1
+    assert places.resolve(['a', 'b']) is None
+    assert places.nearest(8, 1) == 2
+
+
+def test_nearest_matches_scan():
+    r = random.Random(0)
+    data = {i: nodedata(r.uniform(0, 1000), r.uniform(0, 1000), 0) for i in range(500)}
+    graph = {i: [(i + 1) % 500] for i in range(0, 500, 2)}
+    places = Lookup(graph, {}, data, 1, 1)
+    for _ in range(100):
+        x, y = r.uniform(-100, 1100), r.uniform(-100, 1100)
+        expected = min(graph, key=lambda i: ((data[i].x_m - x)**2 + (data[i].y_m - y)**2, i))
+        assert places.nearest(x, y) == expected
+
+
+def test_from_compiled_matches():
+    r = random.Random(1)
+    data = {i: nodedata(r.uniform(0, 1000), r.uniform(0, 1000), 0) for i in range(300)}
+    graph = {i: [(i + 1) % 300] for i in range(0, 300, 3)}
+    ways = {'stradun': [1, 2, 3, 4], 'put': [7, 8]}
+    places = Lookup(graph, ways, data, 1, 1)
+    compiled = Lookup.from_compiled(csr.CSRGraph.from_digraph(graph, data), ways, 1, 1)
+    assert compiled._tree is None
+    assert compiled.resolve('stradun') == places.resolve('stradun') == 3
+    assert compiled.resolve('put') is None
+    assert compiled.resolve('2') is None and compiled.resolve('6') == 6
+    for _ in range(50):
+        x, y = r.uniform(0, 1000), r.uniform(0, 1000)
+        assert compiled.nearest(x, y) == places.nearest(x, y)
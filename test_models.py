@@ -38,3 +38,134 @@ def test_partition_walks_predictability():
     a = partition_walks(examples, 'seed')
     b = partition_walks(examples, 'seed')
     assert a == b
+
+
+def old_nearest_neighbor_model(examples):
+    '''The linear scan nearest neighbor model, for reference.'''
+    def model(xs):
+        [dist, elev] = xs
+        minimum = (float('inf'), None)
+        for [dist2, elev2], y in examples:
+            euclidean = math.sqrt((dist2 - dist)**2 + (5*(elev2 - elev))**2)
+            minimum = min(minimum, (euclidean, y))
+        return minimum[1]
+    return model
+
+
+def test_nearest_neighbor_model_matches_scan():
+    r = random.Random(0)
+    # a coarse grid of features makes for plenty of exact ties
+    examples = [([r.randint(0, 20) * 50.0, r.randint(-5, 5) * 2.0], r.randint(1, 30)) for _ in range(300)]
+    model = nearest_neighbor_model(examples)
+    reference = old_nearest_neighbor_model(examples)
+
+    queries = [[r.randint(0, 40) * 25.0, r.randint(-10, 10) * 1.0] for _ in range(300)]
+    queries += [[r.uniform(-100, 1100), r.uniform(-15, 15)] for _ in range(300)]
+    expected = [reference(xs) for xs in queries]
+    assert [model(xs) for xs in queries] == expected
+    assert model.predict_many(queries).tolist() == expected
+    model.brute_force_limit = 100
+    assert model.predict_many(queries).tolist() == expected
+
+
+def test_linear_model_predict_many():
+    examples = [([1, 2], 5), ([2, 1], 4), ([3, 3], 9), ([0, 1], 2)]
+    model = linear_model(examples)
+    X = [[1, 1], [2, 5], [-1, 0.5]]
+    assert np.allclose(model.predict_many(X), [model(xs) for xs in X])
+
+
+def test_read_walk_data_routes_only_new_rows(tmp_path, monkeypatch):
+    import synthetic
+    id_digraph, id_to_data = synthetic.grid_graph(10, 10, drop=0)
+    walk_path = str(tmp_path / 'walk.txt')
+    cache_path = str(tmp_path / 'walk.cache')
+    with open(walk_path, 'w') as f:
+        f.write('1,55,100,10,30,a,1\n2,99,5,20,0,b,1\n')
+
+    routed = []
+    route_id_chains = batch.route_id_chains
+    def counting(id_digraph, id_to_data, chains, **kwargs):
+        routed.append(len(chains))
+        return route_id_chains(id_digraph, id_to_data, chains, **kwargs)
+    monkeypatch.setattr(batch, 'route_id_chains', counting)
+
+    first = read_walk_data(walk_path, id_digraph, id_to_data, cache_path)
+    assert first == read_walk_data(walk_path, id_digraph, id_to_data)
+    with open(walk_path, 'a') as f:
+        f.write('3,40,12,0,b,2\n')
+    second = read_walk_data(walk_path, id_digraph, id_to_data, cache_path)
+    assert second[:2] == first
+    assert second == read_walk_data(walk_path, id_digraph, id_to_data)
+    assert routed == [2, 2, 1, 3]
+
+    # a different map means routing everything again
+    id_to_data[1] = astar.nodedata(1.0, 2.0, 3.0)
+    read_walk_data(walk_path, id_digraph, id_to_data, cache_path)
+    assert routed[-1] == 3
+
+
+def walks_on_grid(count=40, seed=0):
+    import synthetic
+    id_digraph, id_to_data = synthetic.grid_graph(12, 12, drop=0)
+    r = random.Random(seed)
+    walks = []
+    for i in range(count):
+        path = [r.randint(1, 144) for _ in range(r.randint(1, 8))]
+        walks.append((path, r.uniform(5, 60), 'walker', str(i % 3)))
+    return walks, id_to_data
+
+
+def test_walk_features_match_loops():
+    walks, id_to_data = walks_on_grid()
+    features, targets = walk_features(walks, id_to_data)
+    for (path, time, _, _), row, y in zip(walks, features.tolist(), targets.tolist()):
+        zs = [id_to_data[nid].z_m for nid in path]
+        changes = [b - a for a, b in zip(zs, zs[1:])]
+        assert math.isclose(row[0], path_dist(path, id_to_data), rel_tol=1e-9, abs_tol=1e-9)
+        assert math.isclose(row[1], zs[-1] - zs[0], abs_tol=1e-9)
+        assert math.isclose(row[2], sum(c for c in changes if c > 0), abs_tol=1e-9)
+        assert math.isclose(row[3], -sum(c for c in changes if c < 0), abs_tol=1e-9)
+        assert y == time
+
+
+def test_cross_validate():
+    walks, id_to_data = walks_on_grid()
+    results = cross_validate(walks, id_to_data, k=4, repeats=2)
+    assert set(results) == set(evaluated_models)
+    for r in results.values():
+        assert len(r['folds']) == 8
+        assert math.isclose(r['mean'], sum(r['folds']) / 8)
+    assert cross_validate(walks, id_to_data, k=4, repeats=2, workers=2) == results
+
+    for train, test in folds(10, 3):
+        assert sorted(train.tolist() + test.tolist()) == list(range(10))
+
+
+def test_incremental_linear_model_matches_batch(tmp_path):
+    r = random.Random(1)
+    examples = [([r.uniform(0, 2000), r.uniform(-50, 50)], r.uniform(1, 40)) for _ in range(60)]
+    stats = IncrementalLinearModel(2)
+    for xs, y in examples[:40]:
+        stats.add(xs, y)
+    rest = IncrementalLinearModel.from_examples(examples[40:])
+    combined = stats + rest
+    assert combined.count == 60
+    assert np.allclose(combined.model().weights, linear_model(examples).weights, rtol=1e-9)
+
+    path = str(tmp_path / 'stats')
+    combined.save(path)
+    loaded = IncrementalLinearModel.load(path)
+    assert loaded.count == 60
+    assert np.array_equal(loaded.model().weights, combined.model().weights)
+    assert IncrementalLinearModel.load(str(tmp_path / 'missing')) is None
+
+
+def test_incremental_linear_model_degenerate():
+    assert np.array_equal(IncrementalLinearModel(2).model().weights, [0, 0])
+    # the second feature is the first in other units, so any split of the
+    # weight between them fits; the smallest one is picked like linear_model does
+    r = random.Random(2)
+    examples = [([d, d / 1000], 0.01 * d) for d in (r.uniform(0, 2000) for _ in range(30))]
+    ws = IncrementalLinearModel.from_examples(examples).model().weights
+    assert np.allclose(ws, linear_model(examples).weights, rtol=1e-6)
@@ -0,0 +1,43 @@
+import math
+import random
+
+from parallel import *
+import astar
+import csr
+import synthetic
+
+
+def test_route_parallel_matches_astar(tmp_path):
+    id_digraph, id_to_data = synthetic.grid_graph(12, 12, drop=0.2)
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    weights = astar.edge_weights(graph, astar.toblers)
+    path = str(tmp_path / 'compiled')
+    write_compiled(path, graph, weights, 1/100)
+
+    r = random.Random(0)
+    ids = list(id_digraph)
+    queries = [(r.choice(ids), r.choice(ids)) for _ in range(30)] + [(ids[0], -1)]
+    results = list(route_parallel(path, queries, 2))
+
+    assert len(results) == len(queries)
+    assert results[-1] is None
+    for (s, t), got in zip(queries, results):
+        expected = astar.astar(astar.toblers, astar.toblers_heuristic, id_digraph, id_to_data, s, t)
+        if expected is None:
+            assert got is None
+        else:
+            assert (got[0][0], got[0][-1]) == (s, t)
+            assert math.isclose(got[1], expected[1], rel_tol=1e-9)
+
+
+def test_compiled_search_reads_the_mapped_arrays(tmp_path):
+    id_digraph, id_to_data = synthetic.grid_graph(6, 6, drop=0.2, seed=4)
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    path = str(tmp_path / 'compiled')
+    write_compiled(path, graph, astar.edge_weights(graph, astar.toblers), 1/100)
+
+    search = CompiledSearch(path)
+    assert isinstance(search.weights, memoryview)
+    assert all(isinstance(a, memoryview) for a in search.graph.adjacency())
+    assert [search.node(nid) for nid in graph.ids] == list(range(len(graph)))
+    assert search.node(-1) is None and search.node(10**12) is None
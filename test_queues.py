@@ -0,0 +1,40 @@
+from heapq import heappush, heappop
+import random
+
+from queues import *
+
+
+def test_queues_pop_in_order():
+    r = random.Random(0)
+    for queue in (BinaryHeap(), BucketQueue(0.3), BucketQueue(1000)):
+        reference = []
+        for i in range(500):
+            p = r.uniform(0, 10)
+            queue.push(p, i)
+            heappush(reference, (p, i))
+            if r.random() < .3:
+                assert queue.pop() == heappop(reference)
+        while reference:
+            assert queue.pop() == heappop(reference)
+        assert len(queue) == 0
+
+
+def test_indexed_heap_decrease_key():
+    queue = IndexedHeap()
+    queue.push(5, 'a')
+    queue.push(3, 'b')
+    queue.push(4, 'c')
+    queue.push(1, 'a')
+    queue.push(9, 'b')
+    assert len(queue) == 3
+    assert [queue.pop() for _ in range(3)] == [(1, 'a'), (3, 'b'), (4, 'c')]
+
+
+def test_bucket_queue_takes_priorities_below_the_current_bucket():
+    queue = BucketQueue(10)
+    for p in (25, 12, 14, float('inf')):
+        queue.push(p, p)
+    assert queue.pop() == (12, 12)
+    queue.push(3, 3)
+    queue.push(13, 13)
+    assert [queue.pop()[0] for _ in range(5)] == [3, 13, 14, 25, float('inf')]
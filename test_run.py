@@ -1,5 +1,150 @@
 from run import *
+import os
+import numpy as np
+import pytest
+import synthetic
 
 def test_elevation_idx():
     assert elevation_idx(43, 18) == 0
     assert elevation_idx(42.5, 18.5) == 1800*3601 + 1800
+
+
+def write_map(tmp_path, rows=4, cols=5):
+    osm_path = str(tmp_path / 'map.osm')
+    elev_path = str(tmp_path / 'N42E018.HGT')
+    synthetic.write_osm(osm_path, rows, cols)
+    elevs = np.add.outer(np.arange(3601), np.arange(3601)) % 500
+    synthetic.write_hgt(elev_path, elevs)
+    return osm_path, elev_path
+
+
+@pytest.fixture
+def configured_map(tmp_path, monkeypatch):
+    '''A write_map map that config points at, with every file built from it kept in tmp_path.'''
+    osm_path, elev_path = write_map(tmp_path)
+    monkeypatch.setattr(config, 'osm_path', osm_path)
+    monkeypatch.setattr(config, 'elev_path', elev_path)
+    for name, filename in (('cache_path', 'map.cache'), ('ch_path', 'map.ch'), ('chains_path', 'map.chains'),
+                           ('landmarks_path', 'map.landmarks'), ('tiles_path', 'tiles')):
+        monkeypatch.setattr(config, name, str(tmp_path / filename))
+    return osm_path, elev_path
+
+
+def test_streaming_matches_read_xml(tmp_path):
+    osm_path, elev_path = write_map(tmp_path)
+    (graph, ways, data) = read_xml(osm_path, elev_path)
+    (sgraph, sways, sdata) = read_xml_streaming(osm_path, elev_path)
+
+    assert sgraph == graph
+    assert sways == ways
+    assert len(sways) == 4 + 5
+    assert set(sdata) == set(graph)
+    assert all(sdata[nid] == data[nid] for nid in sdata)
+    assert len(sdata) < len(data)
+
+
+def test_ways_with_the_same_name_are_joined():
+    root = ET.fromstring(
+        '<osm version="0.6">'
+        '<way><nd ref="1"/><nd ref="2"/><tag k="highway" v="steps"/><tag k="name" v="Stradun"/></way>'
+        '<way><nd ref="2"/><nd ref="3"/><tag k="highway" v="steps"/><tag k="name" v="stradun"/></way>'
+        '</osm>')
+    assert build_ways(root) == {'stradun': [1, 2, 2, 3]}
+
+
+def test_lerped_elevations_matches_lerped_elevation(tmp_path):
+    r = np.random.default_rng(0)
+    elevs = r.integers(-50, 2000, size=(3601, 3601)).astype(np.int16)
+    path = str(tmp_path / 'N42E018.HGT')
+    synthetic.write_hgt(path, elevs)
+
+    lats = np.concatenate([r.uniform(41.9, 43.1, 500), [42, 43, 42.5]])
+    lons = np.concatenate([r.uniform(17.9, 19.1, 500), [18, 19, 18.5]])
+
+    flat = read_elevations(path)
+    expected = [lerped_elevation(flat, lat, lon) for lat, lon in zip(lats.tolist(), lons.tolist())]
+    assert lerped_elevations(flat, lats, lons).tolist() == expected
+    assert lerped_elevations(map_elevations(path), lats, lons).tolist() == expected
+
+
+def test_run_toblers(configured_map, capsys):
+    run('ulica 0', 'ulica 3', False, 'toblers', None)
+    out = capsys.readouterr().out
+    assert 'path: ' in out
+    assert 'minutes' in out
+
+
+def test_run_stats(configured_map, capsys):
+    osm_path, elev_path = configured_map
+    stats = astar.SearchStats()
+    run('ulica 0', 'ulica 3', False, 'toblers', None, stats=stats)
+    assert stats['expanded'] > 0
+    compiled = load_map(osm_path, elev_path, config.cache_path).compiled
+    assert stats['cost_calls'] == compiled.num_edges() + len(compiled)
+    assert set(stats['phases']) == {'load', 'resolve', 'prepare', 'heuristic', 'search', 'path'}
+
+
+def test_run_routes(configured_map, capsys):
+    run('2', '21', False, 'toblers', None, routes=3)
+    out = capsys.readouterr().out
+    assert 'route 1: ' in out and 'route 2: ' in out
+    assert 'path: ' not in out
+
+
+def test_run_with_chains_collapsed(configured_map, capsys):
+    osm_path, _ = configured_map
+    synthetic.write_osm(osm_path, 4, 5, bends=3)
+
+    run('2', '21', False, 'toblers', None)
+    expected = capsys.readouterr().out
+    run('2', '21', False, 'toblers', None, chains=True)
+    assert capsys.readouterr().out == expected
+    assert len(expected.split(', ')) > 8
+    assert os.path.exists(config.chains_path)
+    # the second time round they are loaded
+    run('21', '2', False, 'toblers', None, chains=True)
+    reverse = capsys.readouterr().out
+    run('21', '2', False, 'toblers', None)
+    assert capsys.readouterr().out == reverse
+
+
+def test_run_tiled(configured_map, monkeypatch, capsys):
+    osm_path, _ = configured_map
+    synthetic.write_osm(osm_path, 8, 8)
+    monkeypatch.setattr(config, 'tile_size', 100.0)
+
+    run('ulica 0', 'put 7', False, 'toblers', None)
+    expected = capsys.readouterr().out
+    stats = astar.SearchStats()
+    run_tiled('ulica 0', 'put 7', margin=0, stats=stats)
+    assert capsys.readouterr().out == expected
+    assert stats['cells_loaded'] > 1
+
+
+def test_run_isochrone(configured_map, tmp_path, capsys):
+    times_path = str(tmp_path / 'times.csv')
+    times = run_isochrone(['ulica 0', 'put 4'], 2.0, times_path=times_path)
+    assert 'within 2.0 minutes' in capsys.readouterr().out
+    with open(times_path) as f:
+        assert len(f.readlines()) == np.isfinite(times).sum() > 1
+    assert run_isochrone(['nowhere'], 2.0) is None
+
+
+def test_run_with_hierarchy(configured_map, capsys):
+    run('ulica 0', 'ulica 3', False, 'toblers', None)
+    plain = capsys.readouterr().out
+    run('ulica 0', 'ulica 3', False, 'toblers', None, hierarchy=True)
+    assert capsys.readouterr().out == plain
+
+
+def test_run_with_landmarks(configured_map, capsys):
+    run('ulica 0', 'put 4', False, 'toblers', None)
+    plain = capsys.readouterr().out
+    run('ulica 0', 'put 4', False, 'toblers', None, landmarks=True)
+    assert capsys.readouterr().out == plain
+    assert os.path.exists(config.landmarks_path)
+    # the second time round they are loaded
+    run('put 4', 'ulica 0', False, 'toblers', None)
+    reverse = capsys.readouterr().out
+    run('put 4', 'ulica 0', False, 'toblers', None, landmarks=True)
+    assert capsys.readouterr().out == reverse
@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import numpy as np
+
+from server import *
+import models
+import synthetic
+
+
+def write_map(tmp_path):
+    osm_path = str(tmp_path / 'map.osm')
+    elev_path = str(tmp_path / 'N42E018.HGT')
+    synthetic.write_osm(osm_path, 4, 5)
+    synthetic.write_hgt(elev_path, np.add.outer(np.arange(3601), np.arange(3601)) % 500)
+    return (osm_path, elev_path, str(tmp_path / 'map.cache'))
+
+
+def test_route_service(tmp_path):
+    service = RouteService.from_files(*write_map(tmp_path))
+
+    response = service.route({'id': 7, 'source': 'Ulica 0', 'destination': 'put 4'})
+    assert response['id'] == 7
+    assert response['path'][0] == service.map.ways['ulica 0'][0]
+    assert response['path'][-1] == service.map.ways['put 4'][0]
+    assert response['minutes'] > 0
+
+    assert 'error' in service.route({'id': 8, 'source': 'nowhere', 'destination': 'put 4'})
+    assert 'error' in service.route({'id': 9, 'source': 'ulica 0', 'destination': 'put 4', 'prediction': 'magic'})
+
+
+def test_searches_are_bounded(tmp_path, monkeypatch):
+    service = RouteService.from_files(*write_map(tmp_path), max_searches=2)
+    toblers = service.search('toblers', None)
+    for seed in range(5):
+        assert service.search('toblers', seed) is toblers
+    assert list(service.searches) == [('toblers', 0)]
+
+    monkeypatch.setattr(run, 'prepare_search', lambda prediction, *args: object())
+    for seed in range(5):
+        service.search('nearest', seed)
+    assert list(service.searches) == [('nearest', 3), ('nearest', 4)]
+    nearest = service.search('nearest', 3)
+    service.search('nearest', 5)
+    assert list(service.searches) == [('nearest', 3), ('nearest', 5)]
+    assert service.search('nearest', 3) is nearest
+
+
+def test_serve_stream(tmp_path):
+    paths = write_map(tmp_path)
+
+    async def serve(workers):
+        server = Server(paths, workers)
+        reader = asyncio.StreamReader()
+        lines = [json.dumps({'id': i, 'source': 'ulica {}'.format(i), 'destination': 'put 0'}) for i in range(4)]
+        reader.feed_data(('\n'.join(lines) + '\nnot json\n').encode('utf-8'))
+        reader.feed_eof()
+        out = []
+        try:
+            await server.serve_stream(reader, out.append)
+        finally:
+            server.close()
+        return [json.loads(line) for line in out]
+
+    for workers in (0, 2):
+        responses = asyncio.run(serve(workers))
+        assert len(responses) == 5
+        assert sorted(r['id'] for r in responses if 'path' in r) == [0, 1, 2, 3]
+        assert [r['id'] for r in responses if 'error' in r] == [None]
+
+
+def test_route_service_positions(tmp_path):
+    service = RouteService.from_files(*write_map(tmp_path))
+    response = service.route({'id': 1, 'source': [42.6, 18.05], 'destination': '42.6015,18.052'})
+    assert response['path'][0] == service.map.ways['ulica 0'][0]
+    assert response['path'][-1] == service.map.ways['ulica 3'][4]
+
+
+def test_add_walk(tmp_path, monkeypatch):
+    import config
+    paths = write_map(tmp_path)
+    walk_path = str(tmp_path / 'walk.txt')
+    service = RouteService.from_files(*paths, added_path=str(tmp_path / 'added'))
+    ids = list(service.map.graph)
+    with open(walk_path, 'w') as f:
+        for i in range(10):
+            f.write('{},{},{},{},x,1\n'.format(ids[i], ids[-1 - i], 3 + i, 7 * i % 60))
+    monkeypatch.setattr(config, 'walk_data_path', walk_path)
+    monkeypatch.setattr(config, 'walk_cache_path', str(tmp_path / 'walk.cache'))
+
+    reads = []
+    read_walk_data = models.read_walk_data
+    monkeypatch.setattr(models, 'read_walk_data', lambda *args: reads.append(args) or read_walk_data(*args))
+
+    before = service.search('linear', 0)
+    response = service.add_walk({'id': 3, 'path': ['ulica 0', 'put 4'], 'minutes': 30})
+    assert response == {'id': 3, 'walks': 1}
+    after = service.search('linear', 0)
+    assert after[0] != before[0]
+    # the walk data is read once, not again for every walk added
+    assert len(reads) == 1
+
+    # another process sharing the file sees the walk too
+    other = RouteService.from_files(*paths, added_path=str(tmp_path / 'added'))
+    assert other.search('linear', 0)[0] == after[0]
+    other.add_walk({'id': 6, 'path': ['ulica 1', 'put 2'], 'minutes': 12})
+    assert service.added_walks().count == 2
+
+    assert 'error' in service.route({'id': 4, 'op': 'add_walk', 'path': ['ulica 0'], 'minutes': 3})
+    assert 'error' in service.route({'id': 5, 'op': 'add_walk', 'path': ['ulica 0', 'nowhere'], 'minutes': 3})
+    assert 'error' in service.route({'id': 7, 'op': 'add_walk', 'path': ['ulica 0', 'put 4'], 'minutes': True})
@@ -0,0 +1,79 @@
+import math
+import random
+
+from simplify import *
+import astar
+import csr
+import synthetic
+
+
+def path_cost(graph, weights, path):
+    offsets, targets = graph.adjacency()
+    return sum(min(weights[e] for e in range(offsets[a], offsets[a + 1]) if targets[e] == b)
+               for a, b in zip(path, path[1:]))
+
+
+def check_all_pairs(graph, weights, chains, pairs):
+    reduced_weights = chains.weights(weights)
+    for s, t in pairs:
+        h = astar.heuristic_values(graph, astar.toblers_heuristic, t)
+        expected = astar.astar_csr(graph, weights, h, s, t)
+        got = chains.search(weights, reduced_weights, h, s, t)
+        if expected is None:
+            assert got is None
+            continue
+        (path, cost) = got
+        assert math.isclose(cost, expected[1], rel_tol=1e-9, abs_tol=1e-12)
+        assert (path[0], path[-1]) == (s, t)
+        assert math.isclose(path_cost(graph, weights, path), cost, rel_tol=1e-9, abs_tol=1e-12)
+
+
+def test_curved_streets_collapse():
+    graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(12, 12, drop=0.2, seed=1, bends=3))
+    weights = astar.edge_weights(graph, astar.toblers).tolist()
+    chains = Chains.build(graph)
+    assert len(chains.reduced) <= 144
+    assert chains.reduced.ids == [graph.ids[v] for v in chains.kept]
+    assert math.isclose(sum(chains.weights(weights)), sum(weights[e] for e in chains.edges.tolist()))
+
+    r = random.Random(0)
+    check_all_pairs(graph, weights, chains, [(r.randrange(len(graph)), r.randrange(len(graph))) for _ in range(150)])
+    assert check_against_astar(graph, weights, chains, count=50) == []
+
+
+def test_save_and_load(tmp_path):
+    graph = csr.CSRGraph.from_digraph(*synthetic.grid_graph(8, 8, drop=0.2, seed=2, bends=2))
+    weights = astar.edge_weights(graph, astar.toblers).tolist()
+    chains = Chains.build(graph)
+    path = str(tmp_path / 'chains')
+    chains.save(path, graph.fingerprint())
+
+    other = csr.CSRGraph.from_digraph(*synthetic.grid_graph(8, 8, drop=0.2, seed=3, bends=2))
+    assert Chains.load(path, other, other.fingerprint()) is None
+    loaded = Chains.load(path, graph, graph.fingerprint())
+    assert loaded.kept == chains.kept
+    assert loaded.reduced.ids == chains.reduced.ids
+    assert loaded.weights(weights) == chains.weights(weights)
+    r = random.Random(2)
+    check_all_pairs(graph, weights, loaded, [(r.randrange(len(graph)), r.randrange(len(graph))) for _ in range(50)])
+
+
+def test_one_way_streets_rings_and_dead_ends():
+    # 1 -> 2 -> 3 one way, 3 <-> 4 <-> 5 <-> 1 two way, 5 -> 6 but 6 <-> 7
+    # (so 6 is kept), a ring 8 <-> 9 <-> 10 <-> 8 on its own and a dead end
+    # 4 <-> 11 <-> 12
+    id_digraph = {1: [2], 2: [3], 3: [4], 4: [3, 5, 11], 5: [4, 1, 6], 6: [7], 7: [6],
+                  8: [9, 10], 9: [8, 10], 10: [9, 8], 11: [4, 12], 12: [11]}
+    id_digraph[1].append(5)
+    id_digraph[3].append(3) # a loop keeps 3
+    r = random.Random(1)
+    id_to_data = {nid: astar.nodedata(r.uniform(0, 100), r.uniform(0, 100), r.uniform(0, 10)) for nid in range(1, 13)}
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    weights = astar.edge_weights(graph, astar.toblers).tolist()
+    chains = Chains.build(graph)
+
+    kept = {graph.ids[v] for v in chains.kept}
+    assert {2, 11}.isdisjoint(kept)
+    assert {1, 3, 4, 5, 6, 7, 12} <= kept
+    assert len(kept & {8, 9, 10}) == 1
+    check_all_pairs(graph, weights, chains, [(s, t) for s in range(len(graph)) for t in range(len(graph))])
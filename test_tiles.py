@@ -0,0 +1,84 @@
+import math
+import random
+
+from tiles import *
+import astar
+import csr
+import lookup
+import synthetic
+
+
+def setup(tmp_path, cell_size=300.0):
+    (id_digraph, id_to_data) = synthetic.grid_graph(15, 15, drop=0.2, seed=1, bends=2)
+    ways = {'stradun': [1, 2, 3], 'ulica od puča': [20, 21]}
+    directory = str(tmp_path / 'tiles')
+    count = write_tiles(directory, id_digraph, ways, id_to_data, cell_size)
+    return (id_digraph, id_to_data, directory, count)
+
+
+def test_routes_match_astar_whatever_the_cache_size(tmp_path):
+    (id_digraph, id_to_data, directory, count) = setup(tmp_path)
+    graph = csr.CSRGraph.from_digraph(id_digraph, id_to_data)
+    weights = astar.edge_weights(graph, astar.toblers).tolist()
+    assert count > 4
+
+    r = random.Random(0)
+    pairs = [(r.randrange(len(graph)), r.randrange(len(graph))) for _ in range(40)]
+    for max_cells in (2, 64):
+        tiled = TiledMap(directory, max_cells)
+        for s, t in pairs:
+            expected = astar.astar_csr(graph, weights, astar.heuristic_values(graph, astar.toblers_heuristic, t), s, t)
+            got = tiled.route(graph.ids[s], graph.ids[t], margin=0)
+            assert len(tiled.loaded) <= max_cells
+            if expected is None:
+                assert got is None
+            else:
+                (path, cost) = got
+                assert math.isclose(cost, expected[1], rel_tol=1e-9)
+                assert (path[0], path[-1]) == (graph.ids[s], graph.ids[t])
+                walked = sum(astar.toblers(id_to_data[a], id_to_data[b]) for a, b in zip(path, path[1:]))
+                assert math.isclose(walked, cost, rel_tol=1e-9)
+
+
+def test_cells_and_boundary_nodes(tmp_path):
+    (id_digraph, id_to_data, directory, count) = setup(tmp_path)
+    tiled = TiledMap(directory, max_cells=count)
+    seen = set()
+    for c in range(count):
+        tile = tiled.tile(c)
+        seen.update(tile.ids)
+        boundary = set()
+        for i, nid in enumerate(tile.ids):
+            assert tiled.cell_of(nid) == c
+            assert tile.targets[tile.offsets[i]:tile.offsets[i + 1]] == id_digraph.get(nid, [])
+            if any(tiled.cell_of(t) != c for t in id_digraph.get(nid, [])):
+                boundary.add(i)
+        assert set(tile.boundary.tolist()) == boundary
+    assert seen == set(id_to_data)
+
+
+def test_nearby_queries_load_few_cells(tmp_path):
+    (id_digraph, id_to_data, directory, count) = setup(tmp_path)
+    tiled = TiledMap(directory)
+    stats = {}
+    assert tiled.route(1, 2, margin=50, stats=stats) is not None
+    assert 0 < stats['cells_loaded'] < count / 2
+
+
+def test_resolve(tmp_path):
+    (id_digraph, id_to_data, directory, count) = setup(tmp_path)
+    tiled = TiledMap(directory, max_cells=4)
+    assert tiled.resolve('17') == 17
+    assert tiled.resolve('999999') is None
+    assert tiled.resolve('Stradun') == 1
+    assert tiled.resolve('ulica od puca') == 20
+    assert tiled.resolve('strad') == 1
+
+    target = id_to_data[100]
+    position = (target.y_m / 111000, target.x_m / 82000)
+    assert tiled.resolve('{},{}'.format(*position)) == 100
+
+    # the same as a Lookup over the whole map, misspellings included
+    places = lookup.Lookup(id_digraph, {'stradun': [1, 2, 3], 'ulica od puča': [20, 21]}, id_to_data, 111000, 82000)
+    for query in ('17', 'stradnu', 'Ulica od puc', 'ulca od puca', 'nowhere', list(position), '', None):
+        assert tiled.resolve(query) == places.resolve(query)
@@ -0,0 +1,328 @@
+'''
+Tiled maps, for extracts too big to load whole.
+
+write_tiles splits a compiled map into square cells cell_size meters wide
+and writes each to its own file (see cache.save_arrays), plus an index.
+A cell holds its nodes and their outgoing edges. An edge leading into
+another cell is kept with the cell it leaves from, together with the
+coordinates and cell of the node it leads to, so a cell's edge costs and
+heuristic values can all be worked out from the cell alone; the nodes such
+edges leave from are the cell's boundary nodes. The index maps every node
+id to its cell and holds the named ways.
+
+TiledMap loads the cells covering a query's bounding box plus a margin up
+front, then more as the search pops nodes in cells it doesn't have, which
+only happens once the frontier has crossed a boundary. At most max_cells
+cells are kept, the least recently used going first.
+'''
+from collections import OrderedDict
+from heapq import heappush, heappop
+import math
+import os
+
+import numpy as np
+
+import astar
+import cache
+import lookup
+
+
+class Tile:
+    '''One cell of a TiledMap, with edge targets given as node ids.'''
+
+    def __init__(self, cell, arrays):
+        self.cell = cell
+        self.ids = arrays['ids'].tolist()
+        self.index = {nid: i for i, nid in enumerate(self.ids)}
+        self.xyz = arrays['xyz']
+        self.offsets = arrays['offsets'].tolist()
+        self.targets = arrays['targets'].tolist()
+        self.target_xyz = arrays['target_xyz']
+        self.target_cells = arrays['target_cells'].tolist()
+        self.boundary = arrays['boundary']
+        self._weights = {}
+        self._heuristic = (None, None)
+
+    def weights(self, costfunc):
+        '''The cost of every edge under costfunc, as a list.'''
+        if costfunc not in self._weights:
+            src = np.repeat(np.arange(len(self.ids)), np.diff(self.offsets))
+            self._weights[costfunc] = _evaluate(costfunc, self.xyz[src], self.target_xyz).tolist()
+        return self._weights[costfunc]
+
+    def heuristic(self, heuristic, goal_xyz):
+        '''
+        Return (at nodes, at targets) lists of the heuristic cost to
+        goal_xyz from every node of the cell and every edge's target.
+        The last goal's values are kept.
+        '''
+        key = (heuristic, tuple(goal_xyz))
+        if self._heuristic[0] != key:
+            goal = np.broadcast_to(np.asarray(goal_xyz, dtype=np.float64), (1, 3))
+            self._heuristic = (key, (_evaluate(heuristic, self.xyz, goal).tolist(),
+                                     _evaluate(heuristic, self.target_xyz, goal).tolist()))
+        return self._heuristic[1]
+
+
+def _evaluate(func, a, b):
+    # func between rows of the (n, 3) coordinate arrays a and b
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 3)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 3)
+    if func in astar.vectorized:
+        return np.asarray(astar.vectorized[func](a[:, 0], a[:, 1], a[:, 2], b[:, 0], b[:, 1], b[:, 2]), dtype=np.float64)
+    a, b = np.broadcast_arrays(a, b)
+    return np.array([func(astar.nodedata(*p), astar.nodedata(*q)) for p, q in zip(a.tolist(), b.tolist())])
+
+
+def cell_file(directory, cell):
+    return os.path.join(directory, '{}_{}.tile'.format(*cell))
+
+
+def write_tiles(directory, graph, ways, data, cell_size=1000.0, stamp=None):
+    '''
+    Split the (graph, ways, data) triple into cells cell_size meters wide
+    and write them and their index to directory. Nodes without coordinates
+    can't be placed in a cell and are left out, along with their edges.
+    stamp tags the index (see cache.source_stamp). Return the number of
+    cells written.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    ids = np.array(sorted(data), dtype=np.int64)
+    xyz = np.array([data[nid] for nid in ids.tolist()], dtype=np.float64).reshape(-1, 3)
+    keys = np.floor(xyz[:, :2] / cell_size).astype(np.int64)
+    cells, node_cells = np.unique(keys, axis=0, return_inverse=True)
+    node_cells = node_cells.reshape(-1)
+    position = {nid: i for i, nid in enumerate(ids.tolist())}
+
+    order = np.argsort(node_cells, kind='stable')
+    bounds = np.searchsorted(node_cells[order], np.arange(len(cells) + 1))
+    for c in range(len(cells)):
+        members = order[bounds[c]:bounds[c + 1]]
+        offsets = np.zeros(len(members) + 1, dtype=np.int64)
+        targets = []
+        for k, i in enumerate(members.tolist()):
+            targets.extend(t for t in graph.get(int(ids[i]), ()) if t in position)
+            offsets[k + 1] = len(targets)
+        target_index = np.array([position[t] for t in targets], dtype=np.int64)
+        target_cells = node_cells[target_index] if len(targets) else np.zeros(0, dtype=np.int64)
+        leaving = target_cells != c
+        sources = np.repeat(np.arange(len(members)), np.diff(offsets))
+        arrays = {
+            'ids': ids[members],
+            'xyz': xyz[members],
+            'offsets': offsets,
+            'targets': np.array(targets, dtype=np.int64),
+            'target_xyz': xyz[target_index].reshape(-1, 3),
+            'target_cells': target_cells.astype(np.int32),
+            'boundary': np.unique(sources[leaving]).astype(np.int64),
+        }
+        cache.save_arrays(cell_file(directory, tuple(cells[c].tolist())), arrays, {'kind': 'tile', 'cell': c})
+
+    # names resolve to routable nodes only, as with lookup.Lookup
+    routable = {name: [nid for nid in nds if nid in position and graph.get(nid)] for name, nds in ways.items()}
+    names = sorted(name for name in routable if routable[name])
+    way_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum([len(routable[name]) for name in names], out=way_offsets[1:])
+    arrays = {
+        'ids': ids,
+        'cells': node_cells.astype(np.int32),
+        'way_offsets': way_offsets,
+        'way_nodes': np.array([nid for name in names for nid in routable[name]], dtype=np.int64),
+    }
+    meta = {'kind': 'tiles', 'graph_version': cache.GRAPH_VERSION, 'stamp': stamp,
+            'cell_size': cell_size, 'cells': cells.tolist(), 'way_names': names}
+    cache.save_arrays(os.path.join(directory, 'index'), arrays, meta)
+    return len(cells)
+
+
+def read_index(directory, stamp=None):
+    '''
+    Return the (meta, arrays) of the tiled map index in directory, or None
+    if there is none, or (with stamp) it was built from other sources.
+    '''
+    loaded = cache.load_arrays(os.path.join(directory, 'index'))
+    if loaded is None:
+        return None
+    meta, arrays = loaded
+    if meta.get('kind') != 'tiles' or meta.get('graph_version') != cache.GRAPH_VERSION:
+        return None
+    if stamp is not None and meta.get('stamp') != stamp:
+        return None
+    return (meta, arrays)
+
+
+class TiledMap(lookup.Resolver):
+    '''
+    The cells of a tiled map in directory, loaded on demand, keeping at most
+    max_cells of them. loads counts the cells read in so far. Endpoints
+    resolve the way lookup.Lookup resolves them, m_per_lat and m_per_lon
+    converting degrees to the x/y meters of the map.
+    '''
+
+    def __init__(self, directory, max_cells=64, index=None, m_per_lat=111000, m_per_lon=82000, fuzzy_cache=1024):
+        if index is None:
+            index = read_index(directory)
+        if index is None:
+            raise IOError('No tiled map in "{}".'.format(directory))
+        meta, arrays = index
+        self.directory = directory
+        self.max_cells = max_cells
+        self.cell_size = meta['cell_size']
+        self.cells = [tuple(cell) for cell in meta['cells']]
+        self.cell_index = {cell: c for c, cell in enumerate(self.cells)}
+        self.ids = arrays['ids']
+        self.node_cells = arrays['cells']
+        way_offsets = arrays['way_offsets'].tolist()
+        self.ways = {name: (way_offsets[i], way_offsets[i + 1]) for i, name in enumerate(meta['way_names'])}
+        self.way_nodes = arrays['way_nodes']
+        self.m_per_lat = m_per_lat
+        self.m_per_lon = m_per_lon
+        super().__init__(self.ways, fuzzy_cache)
+        self.loaded = OrderedDict()
+        self.loads = 0
+
+    def __contains__(self, nid):
+        return self.cell_of(nid) is not None
+
+    def cell_of(self, nid):
+        '''The index of the cell node nid is in, or None if there's no such node.'''
+        i = int(np.searchsorted(self.ids, nid))
+        if i < len(self.ids) and self.ids[i] == nid:
+            return int(self.node_cells[i])
+        return None
+
+    def tile(self, c):
+        '''The Tile of cell index c, loading it (and dropping the least recently used) if needed.'''
+        if c in self.loaded:
+            self.loaded.move_to_end(c)
+            return self.loaded[c]
+        loaded = cache.load_arrays(cell_file(self.directory, self.cells[c]))
+        if loaded is None:
+            raise IOError('Missing tile {} in "{}".'.format(self.cells[c], self.directory))
+        tile = Tile(c, loaded[1])
+        self.loaded[c] = tile
+        self.loads += 1
+        while len(self.loaded) > self.max_cells:
+            self.loaded.popitem(last=False)
+        return tile
+
+    def node(self, nid):
+        '''Return (tile, index in tile) for node nid.'''
+        tile = self.tile(self.cell_of(nid))
+        return (tile, tile.index[nid])
+
+    def xyz(self, nid):
+        (tile, i) = self.node(nid)
+        return tile.xyz[i]
+
+    def cells_in(self, x0, y0, x1, y1):
+        '''The indices of the cells overlapping the box from x0/y0 to x1/y1 meters.'''
+        size = self.cell_size
+        found = []
+        for cx in range(math.floor(x0 / size), math.floor(x1 / size) + 1):
+            for cy in range(math.floor(y0 / size), math.floor(y1 / size) + 1):
+                if (cx, cy) in self.cell_index:
+                    found.append(self.cell_index[cx, cy])
+        return found
+
+    def load_box(self, x0, y0, x1, y1):
+        '''Load the cells overlapping a box, as many as fit.'''
+        for c in self.cells_in(x0, y0, x1, y1)[:self.max_cells]:
+            self.tile(c)
+
+    def nearest(self, x, y):
+        '''The node with edges nearest to x/y meters, or None if there are none.'''
+        size = self.cell_size
+        cx, cy = math.floor(x / size), math.floor(y / size)
+        rings = max((max(abs(a - cx), abs(b - cy)) for (a, b) in self.cells), default=-1)
+        best, best_d2 = None, math.inf
+        for ring in range(rings + 1):
+            # nodes in this ring of cells around x/y are at least ring - 1 cells away
+            if best is not None and ((ring - 1) * size)**2 > best_d2:
+                break
+            for dx in range(-ring, ring + 1):
+                for dy in range(-ring, ring + 1):
+                    if max(abs(dx), abs(dy)) != ring or (cx + dx, cy + dy) not in self.cell_index:
+                        continue
+                    tile = self.tile(self.cell_index[cx + dx, cy + dy])
+                    d2 = (tile.xyz[:, 0] - x)**2 + (tile.xyz[:, 1] - y)**2
+                    d2 = np.where(np.diff(tile.offsets) > 0, d2, np.inf)
+                    if len(d2) and d2.min() < best_d2:
+                        i = int(np.argmin(d2))
+                        best, best_d2 = tile.ids[i], float(d2[i])
+        return best
+
+    def is_routable(self, nid):
+        if nid not in self:
+            return False
+        (tile, i) = self.node(nid)
+        return tile.offsets[i + 1] > tile.offsets[i]
+
+    def street_node(self, name):
+        '''The first routable node along the named way.'''
+        (begin, end) = self.ways[name]
+        for nid in self.way_nodes[begin:end].tolist():
+            if self.is_routable(nid):
+                return nid
+        return None
+
+    def route(self, start, goal, margin=500.0, costfunc=astar.toblers, heuristic=astar.toblers_heuristic, stats=None):
+        '''
+        A* from node id start to node id goal, first loading the cells
+        around both plus margin meters. Return (path of node ids,
+        path_cost), or None if either node is unknown or there is no path.
+        heuristic must be admissible for costfunc. If stats is a dict the
+        search counters and the number of cells read in go in it.
+
+        The search holds on to the cells it has been through until it is
+        done, so each is read at most once per search however small
+        max_cells is; max_cells bounds the cells kept between searches.
+        '''
+        if start not in self or goal not in self:
+            return None
+        loads = self.loads
+        goal_xyz = self.xyz(goal)
+        start_xyz = self.xyz(start)
+        self.load_box(min(start_xyz[0], goal_xyz[0]) - margin, min(start_xyz[1], goal_xyz[1]) - margin,
+                      max(start_xyz[0], goal_xyz[0]) + margin, max(start_xyz[1], goal_xyz[1]) + margin)
+
+        held = {} # cell -> the lists the search needs from its tile
+        def hold(c):
+            tile = self.tile(c)
+            held[c] = (tile.index, tile.offsets, tile.targets, tile.target_cells, tile.weights(costfunc)) + \
+                tile.heuristic(heuristic, goal_xyz)
+            return held[c]
+
+        start_cell = self.cell_of(start)
+        (index, _, _, _, _, h_nodes, _) = hold(start_cell)
+        history = {}
+        path_costs = {start: 0}
+        frontier = [(h_nodes[index[start]], start, start_cell)]
+        expanded = 0
+        result = None
+
+        while frontier:
+            (cost, cur_node, cell) = heappop(frontier)
+            (index, offsets, targets, target_cells, weights, h_nodes, h_targets) = held.get(cell) or hold(cell)
+            i = index[cur_node]
+            cur_cost = path_costs[cur_node]
+            if cost > cur_cost + h_nodes[i]:
+                continue
+            if cur_node == goal:
+                result = (astar.build_path(None, start, goal, history), cur_cost)
+                break
+            expanded += 1
+
+            for e in range(offsets[i], offsets[i + 1]):
+                successor = targets[e]
+                new_path_cost = cur_cost + weights[e]
+                if successor not in path_costs or new_path_cost < path_costs[successor]:
+                    history[successor] = cur_node
+                    path_costs[successor] = new_path_cost
+                    heappush(frontier, (new_path_cost + h_targets[e], successor, target_cells[e]))
+
+        if stats is not None:
+            stats['expanded'] = expanded
+            stats['cells_loaded'] = self.loads - loads
+            stats['cells_searched'] = len(held)
+        return result